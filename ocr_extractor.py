@@ -3,16 +3,60 @@ import sys
 import cv2
 import numpy as np
 import argparse
-from typing import List, Tuple, Dict, Optional
+from typing import List, Tuple, Dict, Optional, Callable, Iterable, Iterator
 import torch
 import json
-from flask import Flask, request, jsonify, send_file
-import tempfile
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context, g
 import uuid
-import base64
+import binascii
 from io import BytesIO
 import datetime
 import re
+import queue
+import threading
+import hashlib
+import copy
+import sqlite3
+import time
+import signal
+import functools
+import gc
+import logging
+import logging.handlers
+import contextvars
+import atexit
+import zipfile
+import itertools
+import tarfile
+import socket
+from contextlib import contextmanager
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.exceptions import RequestEntityTooLarge
+import zlib
+
+# Thư viện tuỳ chọn: orjson (encode/decode JSON nhanh hơn), zstandard (nén zstd)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+# watchdog (inotify/FSEvents/ReadDirectoryChangesW) cho chế độ --watch, không có thì quét định kỳ
+try:
+    from watchdog.observers import Observer as WatchdogObserver
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    WatchdogObserver = None
+    FileSystemEventHandler = object
+# fcntl (chỉ có trên Unix) để chỉ một process dọn tầng đĩa dùng chung của ResultStore tại một thời điểm
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 # Thêm đường dẫn để import các module từ Comic Translate
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -45,362 +89,3795 @@ LANGUAGE_CODES = {
     "Russian": "ru"
 }
 
+# Số hình ảnh tối đa trong một nhóm xử lý: detection cho cả nhóm, OCR mọi crop của nhóm trong một lần gọi engine
+DEFAULT_BATCH_SIZE = 8
+# Khoảng đệm tối thiểu (pixel) quanh mỗi vùng crop trong ảnh ghép OCR của một nhóm
+MOSAIC_MARGIN = 16
+# Số hình ảnh tối đa trong một yêu cầu /api/ocr/batch
+MAX_BATCH_IMAGES = 100
+
+# Kích thước tối đa (MB) của body yêu cầu OCR, của body /api/ocr/archive và của mỗi hình ảnh sau khi decode
+MAX_UPLOAD_MB = int(os.environ.get("OCR_MAX_UPLOAD_MB", "32"))
+MAX_ARCHIVE_UPLOAD_MB = int(os.environ.get("OCR_MAX_ARCHIVE_UPLOAD_MB", "512"))
+MAX_IMAGE_MB = int(os.environ.get("OCR_MAX_IMAGE_MB", "16"))
+# Số ký tự base64 decode mỗi lần (bội số của 4)
+BASE64_CHUNK_CHARS = 1024 * 1024
+
+# Dạng bản ghi của output JSONL: một dòng mỗi trang hoặc mỗi block văn bản
+JSONL_RECORDS = ("page", "block")
+# Nén response (gzip, zstd nếu có zstandard) khi body lớn hơn ngưỡng này (byte)
+COMPRESS_MIN_BYTES = int(os.environ.get("OCR_COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_LEVEL = int(os.environ.get("OCR_COMPRESS_LEVEL", "6"))
+COMPRESSIBLE_MIMETYPES = ("application/json", "application/x-ndjson", "text/plain")
+
+# Số vùng văn bản tối đa client có thể gửi trong một yêu cầu
+MAX_REGIONS = 500
+# Thứ tự đọc của các vùng do client gửi: giữ nguyên, trái sang phải hoặc phải sang trái
+READING_ORDERS = ("given", "ltr", "rtl")
+
+# Định dạng hình ảnh và file nén được hỗ trợ
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+ARCHIVE_EXTENSIONS = ('.cbz', '.zip', '.cbt', '.tar', '.tar.gz', '.tgz')
+# Số hình ảnh tối đa và kích thước tối đa (MB) của mỗi hình ảnh trong một file nén
+MAX_ARCHIVE_IMAGES = int(os.environ.get("OCR_MAX_ARCHIVE_IMAGES", "1000"))
+MAX_ARCHIVE_MEMBER_MB = int(os.environ.get("OCR_MAX_ARCHIVE_MEMBER_MB", "64"))
+
+# Detector mặc định của Comic Translate
+DETECTOR_NAME = "RT-DETR-v2"
+
+# Chia ảnh thành các tile khi tỉ lệ cao/rộng vượt quá giá trị này (webtoon, trang dài)
+TILE_ASPECT = float(os.environ.get("OCR_TILE_ASPECT", "2.5"))
+# Chia ảnh thành các tile khi cạnh dài nhất vượt quá giá trị này (pixel)
+TILE_MAX_SIDE = int(os.environ.get("OCR_TILE_MAX_SIDE", "4096"))
+# Tỉ lệ chồng lấn giữa hai tile liền kề
+TILE_OVERLAP = float(os.environ.get("OCR_TILE_OVERLAP", "0.2"))
+
+# Tăng giá trị này khi thay đổi định dạng kết quả hoặc cách xử lý để vô hiệu hoá cache cũ
+RESULT_CACHE_VERSION = 2
+# File manifest trong thư mục output dùng cho xử lý thư mục tăng dần
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+
+# Hàng đợi công việc dùng chung (sqlite) cho chế độ phân tán: file mặc định trong
+# thư mục output, thời gian lease (giây) và số lần thử tối đa của mỗi hình ảnh
+WORK_QUEUE_FILE = "work_queue.sqlite"
+LEASE_SECONDS = float(os.environ.get("OCR_LEASE_SECONDS", "300"))
+# Lease ngắn nhất được chấp nhận: hạn lease so theo đồng hồ của từng máy nên phải lớn hơn
+# nhiều so với độ lệch đồng hồ giữa các máy (các máy cần đồng bộ giờ, ví dụ NTP)
+MIN_LEASE_SECONDS = 30.0
+MAX_ATTEMPTS = int(os.environ.get("OCR_MAX_ATTEMPTS", "3"))
+
+# Chế độ --watch: file phải giữ nguyên kích thước/mtime trong WATCH_DEBOUNCE giây mới
+# được xử lý (tránh đọc file đang ghi dở); WATCH_POLL_INTERVAL là chu kỳ quét khi không có watchdog
+WATCH_DEBOUNCE = float(os.environ.get("OCR_WATCH_DEBOUNCE", "2"))
+WATCH_POLL_INTERVAL = float(os.environ.get("OCR_WATCH_POLL_SECONDS", "5"))
+# Cấu hình cache kết quả cho server (0 để tắt)
+RESULT_CACHE_SIZE_MB = int(os.environ.get("OCR_CACHE_SIZE_MB", "64"))
+RESULT_CACHE_DIR = os.environ.get("OCR_CACHE_DIR") or None
+# Số trang tối đa trong cache detection (0 để tắt)
+DETECTION_CACHE_SIZE = int(os.environ.get("OCR_DETECTION_CACHE_SIZE", "256"))
+# Số vùng văn bản (crop) tối đa trong cache nhận dạng, 0 để tắt
+CROP_CACHE_SIZE = int(os.environ.get("OCR_CROP_CACHE_SIZE", "4096"))
+
+# Giới hạn bộ nhớ (MB) cho các OCR engine đã tải, 0 để không giới hạn
+ENGINE_MEMORY_MB = int(os.environ.get("OCR_ENGINE_MEMORY_MB", "0"))
+
+# Số instance tối đa của mỗi OCR engine để xử lý song song (mỗi instance chỉ một luồng dùng tại một thời điểm)
+ENGINE_INSTANCES = int(os.environ.get("OCR_ENGINE_INSTANCES", "1"))
+# Số luồng intra-op của torch trong mỗi worker, 0 để dùng mặc định của torch
+TORCH_THREADS = int(os.environ.get("OCR_TORCH_THREADS", "0"))
+# Backend suy luận: "torch" (eager) hoặc "int8" (lượng tử hoá động các lớp Linear/LSTM/GRU, chỉ CPU)
+SUPPORTED_BACKENDS = ("torch", "int8")
+INFERENCE_BACKEND = os.environ.get("OCR_BACKEND", "torch")
+# Backend riêng cho từng engine, ví dụ: "detector=torch,DocTROCR=int8"
+ENGINE_BACKENDS = dict(
+    item.split("=", 1) for item in os.environ.get("OCR_ENGINE_BACKENDS", "").replace(" ", "").split(",") if "=" in item
+)
+
+# Các ngôn ngữ được tải sẵn engine và warm-up khi khởi động server (phân cách bằng dấu phẩy)
+PRELOAD_LANGUAGES = [lang.strip() for lang in os.environ.get("OCR_PRELOAD_LANGUAGES", "").split(",") if lang.strip()]
+
+# Giới hạn xử lý đồng thời của mỗi worker server
+MAX_CONCURRENT_REQUESTS = int(os.environ.get("OCR_MAX_CONCURRENCY", "2"))
+# Số yêu cầu tối đa được chờ trong hàng đợi, vượt quá sẽ trả về 429
+MAX_QUEUED_REQUESTS = int(os.environ.get("OCR_MAX_QUEUE", "16"))
+# Thời gian tối đa (giây) một yêu cầu được chờ trong hàng đợi
+QUEUE_TIMEOUT = float(os.environ.get("OCR_QUEUE_TIMEOUT", "60"))
+# Thời gian tối đa (giây) chờ các yêu cầu đang xử lý khi tắt server
+GRACEFUL_TIMEOUT = float(os.environ.get("OCR_GRACEFUL_TIMEOUT", "120"))
+# Số luồng thêm mỗi worker production cho các endpoint không qua request_limiter (status, download, metrics)
+SERVER_EXTRA_THREADS = 4
+
+# Số job OCR bất đồng bộ xử lý đồng thời trong mỗi worker
+JOB_CONCURRENCY = int(os.environ.get("OCR_JOB_CONCURRENCY", "1"))
+# Số job tối đa đang chờ xử lý, vượt quá sẽ trả về 429
+JOB_QUEUE_SIZE = int(os.environ.get("OCR_JOB_QUEUE_SIZE", "100"))
+# Thời gian (giây) giữ lại job đã hoàn thành
+JOB_TTL = float(os.environ.get("OCR_JOB_TTL", "3600"))
+# File sqlite lưu job để nhiều worker dùng chung và giữ qua các lần khởi động lại (tuỳ chọn)
+JOB_DB_PATH = os.environ.get("OCR_JOB_DB") or None
+# Chu kỳ (giây) worker kiểm tra job mới trong sqlite do worker khác tạo
+JOB_POLL_INTERVAL = float(os.environ.get("OCR_JOB_POLL_SECONDS", "1"))
+# Thời gian lease (giây) của job đang chạy trong sqlite; worker gia hạn trong khi xử lý,
+# job có lease hết hạn (worker đã dừng) được worker khác nhận lại
+JOB_LEASE_SECONDS = float(os.environ.get("OCR_JOB_LEASE_SECONDS", "60"))
+
+# Thư mục dùng chung để các worker ghi snapshot metric; /metrics gộp metric của mọi worker
+# (tự tạo thư mục tạm khi chạy gunicorn nhiều worker)
+METRICS_DIR = os.environ.get("OCR_METRICS_DIR") or None
+# Chu kỳ (giây) mỗi worker ghi snapshot metric vào METRICS_DIR
+METRICS_FLUSH_SECONDS = float(os.environ.get("OCR_METRICS_FLUSH_SECONDS", "5"))
+
+# Mức log mặc định (DEBUG để xem chi tiết từng yêu cầu)
+LOG_LEVEL = os.environ.get("OCR_LOG_LEVEL", "INFO").upper()
+# Ghi log dạng JSON (mỗi dòng một record)
+LOG_JSON = os.environ.get("OCR_LOG_JSON", "").lower() in ("1", "true", "yes")
+# Yêu cầu chậm hơn ngưỡng này (giây) được ghi ở mức WARNING kèm thời gian từng stage
+SLOW_REQUEST_SECONDS = float(os.environ.get("OCR_SLOW_REQUEST_SECONDS", "10"))
+
 # Khởi tạo Flask app
 app = Flask(__name__)
+# Giới hạn cứng của werkzeug khi đọc body (kể cả yêu cầu chunked không có Content-Length);
+# _check_upload_size thay bằng giới hạn riêng của từng endpoint
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_MB * 1024 * 1024
+
+if orjson is not None:
+    class OrjsonProvider(DefaultJSONProvider):
+        """JSON provider của Flask dùng orjson cho jsonify và request.get_json"""
+        
+        def dumps(self, obj, **kwargs) -> str:
+            try:
+                return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS).decode("utf-8")
+            except TypeError:
+                return super().dumps(obj, **kwargs)
+        
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+    
+    app.json = OrjsonProvider(app)
 # Thư mục lưu trữ tạm thời
 TEMP_DIR = os.path.join(current_dir, "temp")
 if not os.path.exists(TEMP_DIR):
     os.makedirs(TEMP_DIR)
 
+# Kho transcript để download: thời gian giữ (giây), dung lượng trong bộ nhớ và trên đĩa (MB)
+RESULT_TTL = float(os.environ.get("OCR_RESULT_TTL", "86400"))
+RESULT_STORE_MB = int(os.environ.get("OCR_RESULT_STORE_MB", "64"))
+RESULT_STORE_DISK_MB = int(os.environ.get("OCR_RESULT_STORE_DISK_MB", "1024"))
+# Thư mục tầng đĩa (dùng chung giữa các worker), "none" để chỉ lưu trong bộ nhớ
+RESULT_STORE_DIR = os.environ.get("OCR_RESULT_STORE_DIR", os.path.join(TEMP_DIR, "results"))
+if RESULT_STORE_DIR.lower() in ("", "none"):
+    RESULT_STORE_DIR = None
+# Chu kỳ (giây) dọn các kết quả hết hạn
+RESULT_SWEEP_INTERVAL = float(os.environ.get("OCR_RESULT_SWEEP_SECONDS", "300"))
+
 # Thêm hằng số cho file log
 API_KEY_LOG_FILE = os.path.join(current_dir, "api_keys.log")
 
-class OCRExtractor:
+logger = logging.getLogger("ocr_extractor")
+
+# Ngữ cảnh log của yêu cầu hoặc job hiện tại: {"request_id": ..., "stages": {stage: seconds}}
+_log_context = contextvars.ContextVar("ocr_log_context", default=None)
+
+class RequestContextFilter(logging.Filter):
+    """Gắn request_id của yêu cầu hiện tại vào mỗi log record"""
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "request_id"):
+            context = _log_context.get()
+            record.request_id = context["request_id"] if context else None
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """Định dạng log record thành một dòng JSON"""
+    
+    FIELDS = ("request_id", "stage_timings", "duration_ms", "status", "path", "method", "job_id")
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "pid": record.process,
+            "thread": record.threadName
+        }
+        for field in self.FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
     """
-    Trích xuất văn bản từ hình ảnh sử dụng các OCR engine mặc định của Comic Translate
+    QueueHandler không định dạng message trên luồng gọi log
+    
+    Record được đưa nguyên vào hàng đợi trong process; việc định dạng và ghi
+    ra stream do luồng của QueueListener thực hiện.
+    """
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+_log_queue = queue.SimpleQueue()
+_log_listener = None
+_log_listener_pid = None
+_log_output = None
+
+def configure_logging(level: str = LOG_LEVEL, json_format: bool = LOG_JSON, stream=None) -> None:
+    """
+    Cấu hình logging cho ứng dụng
+    
+    Luồng xử lý yêu cầu chỉ đưa record vào hàng đợi; một luồng riêng
+    (QueueListener) định dạng và ghi ra stream nên không bị chặn bởi I/O log.
+    
+    Args:
+        level: Mức log (DEBUG, INFO, WARNING, ERROR)
+        json_format: Ghi log dạng JSON thay vì text
+        stream: Stream đích, mặc định sys.stderr
+    """
+    global _log_output
+    
+    output = logging.StreamHandler(stream or sys.stderr)
+    if json_format:
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s"))
+    _log_output = output
+    
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, _DeferredQueueHandler):
+            root.removeHandler(handler)
+    handler = _DeferredQueueHandler(_log_queue)
+    handler.addFilter(RequestContextFilter())
+    root.addHandler(handler)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    
+    _start_log_listener(force=True)
+    atexit.register(flush_logging)
+
+def _start_log_listener(force: bool = False) -> None:
+    """Khởi động luồng ghi log trong process hiện tại (gọi lại sau khi fork worker)"""
+    global _log_listener, _log_listener_pid
+    
+    if _log_output is None or (_log_listener_pid == os.getpid() and not force):
+        return
+    if _log_listener is not None and _log_listener_pid == os.getpid():
+        _log_listener.stop()
+    _log_listener = logging.handlers.QueueListener(_log_queue, _log_output)
+    _log_listener.start()
+    _log_listener_pid = os.getpid()
+
+def flush_logging() -> None:
+    """Ghi hết các log đang chờ (khi thoát chương trình)"""
+    global _log_listener, _log_listener_pid
+    if _log_listener is not None and _log_listener_pid == os.getpid():
+        _log_listener.stop()
+        _log_listener = None
+        _log_listener_pid = None
+
+@contextmanager
+def log_context(request_id: str):
+    """Gắn request_id và thời gian từng stage cho các log trong khối lệnh"""
+    context = {"request_id": request_id, "stages": {}}
+    token = _log_context.set(context)
+    try:
+        yield context
+    finally:
+        _log_context.reset(token)
+
+def _record_stage_timing(stage: str, seconds: float, labels: Dict) -> None:
+    """Cộng dồn thời gian stage vào ngữ cảnh log của yêu cầu hiện tại"""
+    context = _log_context.get()
+    if context is not None:
+        stages = context["stages"]
+        stages[stage] = stages.get(stage, 0.0) + seconds
+
+def _stage_timings_ms(context: Dict) -> Dict:
+    return {stage: round(seconds * 1000, 2) for stage, seconds in context["stages"].items()}
+
+@app.before_request
+def _begin_request_log():
+    """Gán request ID (nhận từ header X-Request-ID nếu có) cho yêu cầu hiện tại"""
+    request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+    g.log_context = {"request_id": request_id[:128], "stages": {}}
+    g.log_token = _log_context.set(g.log_context)
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def _finish_request_log(response):
+    """Ghi tóm tắt yêu cầu (DEBUG, hoặc WARNING nếu chậm) và trả lại request ID"""
+    context = g.get('log_context')
+    if context is None:
+        return response
+    
+    response.headers['X-Request-ID'] = context["request_id"]
+    duration = time.perf_counter() - g.request_start
+    level = logging.WARNING if duration >= SLOW_REQUEST_SECONDS else logging.DEBUG
+    if logger.isEnabledFor(level):
+        logger.log(level, "%s %s -> %d trong %.1f ms", request.method, request.path, response.status_code, duration * 1000,
+                   extra={"method": request.method, "path": request.path, "status": response.status_code,
+                          "duration_ms": round(duration * 1000, 2), "stage_timings": _stage_timings_ms(context)})
+    return response
+
+@app.teardown_request
+def _end_request_log(exc):
+    token = g.pop('log_token', None)
+    if token is not None:
+        _log_context.reset(token)
+
+def hash_bytes(data) -> str:
+    """Tính hash nhanh của dữ liệu nhị phân (dùng làm khoá cache)"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def hash_image(image: np.ndarray) -> str:
+    """Tính hash của hình ảnh đã giải mã dựa trên pixel và kích thước"""
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(str(image.shape).encode())
+    hasher.update(np.ascontiguousarray(image).data)
+    return hasher.hexdigest()
+
+class ResultCache:
+    """
+    Cache kết quả OCR theo nội dung hình ảnh
+    
+    Gồm một tầng LRU trong bộ nhớ giới hạn theo dung lượng và một tầng sqlite
+    tuỳ chọn trên đĩa để giữ kết quả qua các lần khởi động lại.
     """
     
-    def __init__(self, use_gpu: bool = False):
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, cache_dir: str = None,
+                 disk_max_bytes: int = 1024 * 1024 * 1024):
         """
-        Khởi tạo OCR Extractor
+        Khởi tạo cache
         
         Args:
-            use_gpu: Sử dụng GPU nếu có
+            max_bytes: Dung lượng tối đa của tầng bộ nhớ
+            cache_dir: Thư mục chứa file sqlite của tầng đĩa (None để tắt)
+            disk_max_bytes: Dung lượng tối đa của tầng đĩa
         """
-        self.use_gpu = use_gpu
-        self.device = 'cuda' if use_gpu and torch.cuda.is_available() else 'cpu'
+        self.max_bytes = max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
         
-        print(f"Sử dụng device: {self.device}")
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
         
-        # Khởi tạo detector để phát hiện vùng chứa văn bản
-        self.text_detector = None
+        self._db = None
+        self.db_path = None
+        self._disk_writes = 0
+        if cache_dir:
+            if not os.path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            self.db_path = os.path.join(cache_dir, "ocr_cache.sqlite3")
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.commit()
+    
+    def get(self, key: str) -> Optional[Dict]:
+        """Lấy kết quả từ cache, trả về None nếu không có"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return json.loads(value)
+            
+            if self._db is not None:
+                row = self._db.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._db.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+                    self._db.commit()
+                    self.disk_hits += 1
+                    self._put_memory(key, row[0])
+                    return json.loads(row[0])
+            
+            self.misses += 1
+            return None
+    
+    def put(self, key: str, value: Dict) -> None:
+        """Lưu kết quả vào cache"""
+        encoded = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._put_memory(key, encoded)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                    (key, encoded, len(encoded), time.time())
+                )
+                self._db.commit()
+                self._disk_writes += 1
+                if self._disk_writes % 100 == 0:
+                    self._trim_disk()
+    
+    def _put_memory(self, key: str, encoded: str) -> None:
+        """Thêm vào tầng bộ nhớ và loại bỏ các mục cũ nhất khi vượt dung lượng"""
+        size = len(encoded)
+        if size > self.max_bytes:
+            return
         
-        # Dictionary lưu trữ các OCR engine đã khởi tạo
-        self.ocr_engines = {}
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._size -= len(old)
+        self._entries[key] = encoded
+        self._size += size
+        
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+            self.evictions += 1
     
-    def _init_text_detector(self):
-        """Khởi tạo detector để phát hiện vùng chứa văn bản"""
-        if self.text_detector is None:
-            # Tạo object settings tạm thời để truyền cho detector
-            class MockSettings:
-                def __init__(self, use_gpu):
-                    self.use_gpu = use_gpu
-                def is_gpu_enabled(self):
-                    return self.use_gpu
-                def get_tool_selection(self, key):
-                    return "RT-DETR-v2"  # Detector mặc định
+    def _trim_disk(self) -> None:
+        """Xoá các mục ít được truy cập nhất khi tầng đĩa vượt dung lượng"""
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.disk_max_bytes:
+            return
+        
+        excess = total - self.disk_max_bytes
+        removed = 0
+        keys = []
+        for key, size in self._db.execute("SELECT key, size FROM results ORDER BY accessed"):
+            keys.append((key,))
+            removed += size
+            if removed >= excess:
+                break
+        self._db.executemany("DELETE FROM results WHERE key = ?", keys)
+        self._db.commit()
+    
+    def stats(self) -> Dict:
+        """Thống kê cache cho /api/status"""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            stats = {
+                'entries': len(self._entries),
+                'size_bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                'disk': None
+            }
+            if self._db is not None:
+                count, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+                stats['disk'] = {'path': self.db_path, 'entries': count, 'size_bytes': size, 'max_bytes': self.disk_max_bytes}
+            return stats
+
+class DetectionCache:
+    """
+    Cache kết quả detection (đã sắp xếp) theo hash hình ảnh
+    
+    Detection không phụ thuộc ngôn ngữ nên khi gửi lại cùng một trang với ngôn
+    ngữ khác chỉ cần chạy lại OCR. Toạ độ của mỗi trang (xyxy, bubble, inpaint,
+    lines) được lưu gọn dưới dạng vài mảng numpy thay vì giữ nguyên danh sách
+    TextBlock; các thuộc tính còn lại của block (direction, text_class, ...)
+    được sao chép nguyên, nên block lấy từ cache giống hệt block vừa detect.
+    """
+    
+    # Thuộc tính được lưu trong các mảng numpy, không sao chép vào "attrs"
+    _ARRAY_ATTRS = ("xyxy", "bubble_xyxy", "inpaint_bboxes", "lines")
+    
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    @staticmethod
+    def _pack(text_blocks: List[TextBlock]) -> Dict:
+        """Chuyển danh sách TextBlock thành các mảng numpy"""
+        count = len(text_blocks)
+        xyxy = np.zeros((count, 4), dtype=np.int32)
+        bubble = np.full((count, 4), -1, dtype=np.int32)
+        has_bubble = np.zeros(count, dtype=bool)
+        inpaint = []
+        inpaint_offsets = np.zeros(count + 1, dtype=np.int32)
+        has_inpaint = np.zeros(count, dtype=bool)
+        text_class = []
+        line_points = []
+        line_lengths = []
+        line_offsets = np.zeros(count + 1, dtype=np.int32)
+        attrs = []
+        
+        for i, block in enumerate(text_blocks):
+            xyxy[i] = np.asarray(block.xyxy, dtype=np.int32).reshape(4)
+            bubble_xyxy = getattr(block, "bubble_xyxy", None)
+            if bubble_xyxy is not None:
+                bubble[i] = np.asarray(bubble_xyxy, dtype=np.int32).reshape(4)
+                has_bubble[i] = True
+            text_class.append(getattr(block, "text_class", ""))
             
-            settings = MockSettings(self.use_gpu)
-            self.text_detector = TextBlockDetector(settings)
+            inpaint_bboxes = getattr(block, "inpaint_bboxes", None)
+            if inpaint_bboxes is not None and len(inpaint_bboxes):
+                boxes = np.asarray(inpaint_bboxes, dtype=np.int32).reshape(-1, 4)
+                inpaint.append(boxes)
+                has_inpaint[i] = True
+                inpaint_offsets[i + 1] = inpaint_offsets[i] + len(boxes)
+            else:
+                inpaint_offsets[i + 1] = inpaint_offsets[i]
+            
+            lines = [np.asarray(line).reshape(-1, 2) for line in (getattr(block, "lines", None) or [])]
+            line_points.extend(lines)
+            line_lengths.extend(len(line) for line in lines)
+            line_offsets[i + 1] = line_offsets[i] + len(lines)
+            
+            # Các thuộc tính khác mà recognizer và các bước sau có thể đọc (direction, source_lang, ...)
+            attrs.append(copy.deepcopy({
+                name: value for name, value in getattr(block, "__dict__", {}).items()
+                if name not in DetectionCache._ARRAY_ATTRS
+            }))
+        
+        return {
+            "xyxy": xyxy,
+            "bubble": bubble,
+            "has_bubble": has_bubble,
+            "text_class": tuple(text_class),
+            "inpaint": np.concatenate(inpaint) if inpaint else np.zeros((0, 4), dtype=np.int32),
+            "inpaint_offsets": inpaint_offsets,
+            "has_inpaint": has_inpaint,
+            "line_points": np.concatenate(line_points) if line_points else np.zeros((0, 2), dtype=np.int32),
+            "line_lengths": np.asarray(line_lengths, dtype=np.int32),
+            "line_offsets": line_offsets,
+            "attrs": tuple(attrs)
+        }
+    
+    @staticmethod
+    def _unpack(packed: Dict) -> List[TextBlock]:
+        """Tạo lại danh sách TextBlock mới từ các mảng đã lưu"""
+        text_blocks = []
+        offsets = packed["inpaint_offsets"]
+        # Vị trí bắt đầu của từng line trong line_points
+        line_starts = np.concatenate(([0], np.cumsum(packed["line_lengths"])))
+        for i in range(len(packed["xyxy"])):
+            inpaint_bboxes = None
+            if packed["has_inpaint"][i]:
+                inpaint_bboxes = packed["inpaint"][offsets[i]:offsets[i + 1]].copy()
+            lines = [
+                packed["line_points"][line_starts[j]:line_starts[j + 1]].copy()
+                for j in range(packed["line_offsets"][i], packed["line_offsets"][i + 1])
+            ]
+            block = TextBlock(
+                text_bbox=packed["xyxy"][i].copy(),
+                bubble_bbox=packed["bubble"][i].copy() if packed["has_bubble"][i] else None,
+                text_class=packed["text_class"][i],
+                inpaint_bboxes=inpaint_bboxes,
+                lines=lines
+            )
+            for name, value in copy.deepcopy(packed["attrs"][i]).items():
+                setattr(block, name, value)
+            text_blocks.append(block)
+        return text_blocks
+    
+    def get(self, key: str) -> Optional[List[TextBlock]]:
+        """Lấy danh sách TextBlock từ cache, trả về None nếu không có"""
+        with self._lock:
+            packed = self._entries.get(key)
+            if packed is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return self._unpack(packed)
+    
+    def put(self, key: str, text_blocks: List[TextBlock]) -> None:
+        """Lưu danh sách TextBlock vào cache"""
+        packed = self._pack(text_blocks)
+        with self._lock:
+            self._entries[key] = packed
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def stats(self) -> Dict:
+        """Thống kê cache cho /api/status"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            size = sum(
+                sum(value.nbytes for value in packed.values() if isinstance(value, np.ndarray))
+                for packed in self._entries.values()
+            )
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'size_bytes': size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+class ResultStore:
+    """
+    Kho transcript để download theo file_id, có thời hạn (TTL)
     
-    def _get_ocr_engine(self, language: str) -> object:
+    Tầng bộ nhớ giữ các kết quả mới nhất (LRU, giới hạn max_bytes). Tầng đĩa
+    (tuỳ chọn) ghi mỗi kết quả thành một file trong thư mục con theo hai ký tự
+    đầu của file_id để không có thư mục nào chứa quá nhiều file, và được dùng
+    chung giữa các worker. Một luồng nền định kỳ xoá kết quả hết hạn và giữ
+    tầng đĩa dưới disk_max_bytes; tầng đĩa chỉ được một process dọn tại một
+    thời điểm (khoá file) để các worker không cùng xoá bớt file cũ nhất.
+    """
+    
+    ID_PATTERN = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+    
+    def __init__(self, max_bytes: int = RESULT_STORE_MB * 1024 * 1024, ttl: float = RESULT_TTL,
+                 disk_dir: str = RESULT_STORE_DIR, disk_max_bytes: int = RESULT_STORE_DISK_MB * 1024 * 1024,
+                 sweep_interval: float = RESULT_SWEEP_INTERVAL, legacy_dir: str = None):
         """
-        Lấy OCR engine phù hợp với ngôn ngữ
-        
         Args:
-            language: Ngôn ngữ cần OCR
-            
-        Returns:
-            OCR engine phù hợp
+            max_bytes: Dung lượng tối đa của tầng bộ nhớ
+            ttl: Thời gian giữ mỗi kết quả (giây)
+            disk_dir: Thư mục tầng đĩa, None để chỉ lưu trong bộ nhớ
+            disk_max_bytes: Dung lượng tối đa của tầng đĩa
+            sweep_interval: Chu kỳ dọn kết quả hết hạn (giây)
+            legacy_dir: Thư mục chứa các file <uuid>.txt kiểu cũ cần dọn khi hết hạn
         """
-        if language in self.ocr_engines:
-            return self.ocr_engines[language]
-        
-        # Chọn engine phù hợp dựa vào ngôn ngữ
-        if language == "Japanese":
-            engine = MangaOCREngine()
-            engine.initialize(device=self.device)
-        elif language == "Korean":
-            engine = PororoOCREngine()
-            engine.initialize()
-        elif language == "Chinese":
-            engine = PaddleOCREngine()
-            engine.initialize()
-        else:
-            # Sử dụng DocTR OCR cho các ngôn ngữ khác
-            engine = DocTROCR()
-            engine.initialize(device=self.device)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.sweep_interval = sweep_interval
+        self.legacy_dir = legacy_dir
         
-        # Lưu engine vào cache
-        self.ocr_engines[language] = engine
-        return engine
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._sweeper_pid = None
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.disk_entries = 0
+        self.disk_bytes = 0
+        self.last_sweep = None
     
-    def detect_text_blocks(self, image: np.ndarray) -> List[TextBlock]:
+    def _disk_path(self, file_id: str) -> str:
+        return os.path.join(self.disk_dir, file_id[:2], f"{file_id}.txt")
+    
+    def put(self, text: str) -> Tuple[str, Optional[str]]:
         """
-        Phát hiện các vùng văn bản trong hình ảnh
+        Lưu transcript mới
         
-        Args:
-            image: Hình ảnh cần phát hiện văn bản
-            
         Returns:
-            Danh sách các TextBlock
+            (file_id, đường dẫn file trên đĩa hoặc None)
         """
-        self._init_text_detector()
-        blocks = self.text_detector.detect(image)
-        return blocks
+        self._ensure_sweeper()
+        file_id = str(uuid.uuid4())
+        data = text.encode("utf-8")
+        expires = time.time() + self.ttl
+        
+        path = None
+        if self.disk_dir:
+            path = self._disk_path(file_id)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(data)
+        
+        with self._lock:
+            if len(data) <= self.max_bytes:
+                self._entries[file_id] = (data, expires)
+                self._size += len(data)
+                while self._size > self.max_bytes:
+                    _, (old_data, _) = self._entries.popitem(last=False)
+                    self._size -= len(old_data)
+                    self.evictions += 1
+        return file_id, path
     
-    def process_image(self, image_path: str, language: str, output_path: str = None) -> Dict:
+    def get(self, file_id: str) -> Optional[bytes]:
+        """Lấy transcript theo file_id, None nếu không có hoặc đã hết hạn"""
+        if not file_id or not self.ID_PATTERN.match(file_id):
+            return None
+        
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(file_id)
+            if entry is not None:
+                data, expires = entry
+                if expires > now:
+                    self._entries.move_to_end(file_id)
+                    self.hits += 1
+                    return data
+                del self._entries[file_id]
+                self._size -= len(data)
+                self.expired += 1
+        
+        # Tầng đĩa: kết quả do worker khác tạo hoặc đã bị đẩy khỏi bộ nhớ
+        if self.disk_dir:
+            path = self._disk_path(file_id)
+            try:
+                if os.path.getmtime(path) + self.ttl > now:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                    with self._lock:
+                        self.hits += 1
+                    return data
+                os.remove(path)
+                with self._lock:
+                    self.expired += 1
+            except OSError:
+                pass
+        
+        with self._lock:
+            self.misses += 1
+        return None
+    
+    def _ensure_sweeper(self) -> None:
+        """Khởi động luồng dọn trong process hiện tại (một lần, kể cả sau khi fork)"""
+        with self._lock:
+            if self._sweeper_pid == os.getpid() or self.sweep_interval <= 0:
+                return
+            self._sweeper_pid = os.getpid()
+        threading.Thread(target=self._sweep_loop, name="ocr-result-sweeper", daemon=True).start()
+    
+    def _sweep_loop(self) -> None:
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.warning("Lỗi khi dọn kho kết quả: %s", e)
+            time.sleep(self.sweep_interval)
+    
+    @contextmanager
+    def _disk_sweep_lock(self):
+        """Khoá file không chờ trên tầng đĩa; trả về False nếu process khác đang dọn"""
+        if fcntl is None:
+            yield True
+            return
+        with open(os.path.join(self.disk_dir, ".sweep.lock"), "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    def sweep(self) -> int:
         """
-        Xử lý một hình ảnh để trích xuất văn bản
+        Xoá các kết quả hết hạn và giữ tầng đĩa dưới disk_max_bytes
+        
+        Chỉ kết quả hết hạn được tính vào expired; file bị xoá để giữ giới hạn
+        dung lượng được tính vào evictions.
         
-        Args:
-            image_path: Đường dẫn đến hình ảnh
-            language: Ngôn ngữ của văn bản trong hình ảnh
-            output_path: Đường dẫn để lưu kết quả (tuỳ chọn)
-            
         Returns:
-            Dictionary chứa kết quả trích xuất
+            Số kết quả đã xoá
         """
-        if language not in SUPPORTED_LANGUAGES:
-            raise ValueError(f"Ngôn ngữ không được hỗ trợ. Các ngôn ngữ được hỗ trợ: {', '.join(SUPPORTED_LANGUAGES)}")
+        now = time.time()
+        expired = evicted = 0
+        with self._lock:
+            for file_id in [file_id for file_id, (_, expires) in self._entries.items() if expires <= now]:
+                data, _ = self._entries.pop(file_id)
+                self._size -= len(data)
+                expired += 1
         
-        # Đọc hình ảnh
-        print(f"Đọc hình ảnh từ {image_path}")
-        image = cv2.imread(image_path)
+        if self.disk_dir and os.path.isdir(self.disk_dir):
+            with self._disk_sweep_lock() as owner:
+                if owner:
+                    disk_expired, evicted = self._sweep_disk(now)
+                    expired += disk_expired
         
-        if image is None:
-            error_msg = f"Không thể đọc hình ảnh từ {image_path}"
-            print(error_msg)
-            raise ValueError(error_msg)
-            
-        # Kiểm tra kích thước hình ảnh
-        height, width, channels = image.shape
-        print(f"Kích thước hình ảnh: {width}x{height}, channels: {channels}")
+        # Các file <uuid>.txt do phiên bản cũ ghi thẳng vào TEMP_DIR
+        if self.legacy_dir and os.path.isdir(self.legacy_dir):
+            for entry in os.scandir(self.legacy_dir):
+                if entry.is_file() and entry.name.endswith(".txt") and self.ID_PATTERN.match(entry.name[:-4]):
+                    try:
+                        if entry.stat().st_mtime + self.ttl <= now:
+                            expired += self._remove_file(entry.path)
+                    except OSError:
+                        continue
         
-        if width < 10 or height < 10:
-            error_msg = f"Hình ảnh quá nhỏ: {width}x{height}"
-            print(error_msg)
-            raise ValueError(error_msg)
+        with self._lock:
+            self.expired += expired
+            self.evictions += evicted
+            self.last_sweep = now
+        if expired or evicted:
+            logger.info("Kho kết quả: xoá %d kết quả hết hạn, %d kết quả vượt giới hạn dung lượng", expired, evicted)
+        return expired + evicted
+    
+    def _sweep_disk(self, now: float) -> Tuple[int, int]:
+        """
+        Dọn tầng đĩa (gọi khi giữ khoá dọn)
         
-        # Phát hiện các vùng văn bản
-        print("Đang phát hiện vùng văn bản...")
-        try:
-            text_blocks = self.detect_text_blocks(image)
-            print(f"Đã phát hiện {len(text_blocks)} vùng văn bản")
-        except Exception as e:
-            error_msg = f"Lỗi khi phát hiện vùng văn bản: {str(e)}"
-            print(error_msg)
-            import traceback
-            print(traceback.format_exc())
-            raise ValueError(error_msg)
+        Returns:
+            (số file hết hạn, số file xoá để giữ disk_max_bytes)
+        """
+        expired = evicted = 0
+        files = []
+        for shard in os.scandir(self.disk_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
         
-        if not text_blocks:
-            print("Không phát hiện được văn bản nào trong hình ảnh")
-            empty_result = {
-                "blocks": [], 
-                "transcript": f"//{os.path.basename(image_path)}\nKhông phát hiện được văn bản", 
-                "filename": os.path.basename(image_path)
+        # Xoá file hết hạn, sau đó xoá file cũ nhất đến khi dưới giới hạn dung lượng
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        kept = []
+        for mtime, size, path in files:
+            if mtime + self.ttl <= now:
+                expired += self._remove_file(path)
+                total -= size
+            else:
+                kept.append((mtime, size, path))
+        while kept and total > self.disk_max_bytes:
+            _, size, path = kept.pop(0)
+            evicted += self._remove_file(path)
+            total -= size
+        
+        with self._lock:
+            self.disk_entries = len(kept)
+            self.disk_bytes = total
+        return expired, evicted
+    
+    @staticmethod
+    def _remove_file(path: str) -> int:
+        try:
+            os.remove(path)
+            return 1
+        except OSError:
+            # Worker khác đã xoá file này
+            return 0
+    
+    def stats(self) -> Dict:
+        """Thống kê kho kết quả cho /api/status"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'size_bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl,
+                'disk_dir': self.disk_dir,
+                'disk_entries': self.disk_entries,
+                'disk_bytes': self.disk_bytes,
+                'disk_max_bytes': self.disk_max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'expired': self.expired,
+                'evictions': self.evictions,
+                'last_sweep': self.last_sweep
             }
-            
-            # Lưu kết quả rỗng nếu cần
-            if output_path:
-                with open(output_path, "w", encoding="utf-8") as f:
-                    f.write(empty_result["transcript"])
-                    
-            return empty_result
+
+def hash_crop(image: np.ndarray, xyxy) -> Optional[str]:
+    """
+    Hash của vùng ảnh trong bbox sau khi chuẩn hoá (grayscale)
+    
+    Returns:
+        Hash dạng hex, hoặc None nếu vùng ảnh rỗng
+    """
+    height, width = image.shape[:2]
+    x1, y1, x2, y2 = (int(coord) for coord in np.asarray(xyxy).reshape(4))
+    x1, x2 = max(0, x1), min(width, x2)
+    y1, y2 = max(0, y1), min(height, y2)
+    if x2 <= x1 or y2 <= y1:
+        return None
+    
+    crop = image[y1:y2, x1:x2]
+    if crop.ndim == 3:
+        crop = cv2.cvtColor(crop, cv2.COLOR_BGRA2GRAY if crop.shape[2] == 4 else cv2.COLOR_BGR2GRAY)
+    return hash_image(crop)
+
+def hash_block_crop(image: np.ndarray, block: TextBlock) -> Optional[str]:
+    """
+    Khoá cache nhận dạng của một block: hash crop xyxy cùng các thuộc tính
+    recognizer có thể dùng (vùng bubble_xyxy, text_class, angle, direction)
+    
+    Returns:
+        Hash dạng hex, hoặc None nếu vùng ảnh rỗng
+    """
+    digest = hash_crop(image, block.xyxy)
+    if digest is None:
+        return None
+    
+    parts = [digest]
+    bubble_xyxy = getattr(block, "bubble_xyxy", None)
+    if bubble_xyxy is not None:
+        # Engine có thể cắt theo bubble: cả nội dung bubble và vị trí crop trong bubble đều ảnh hưởng kết quả
+        bubble = [int(coord) for coord in np.asarray(bubble_xyxy).reshape(4)]
+        x1, y1 = (int(coord) for coord in np.asarray(block.xyxy).reshape(4)[:2])
+        parts.append(hash_crop(image, bubble) or "")
+        parts.append(f"{x1 - bubble[0]},{y1 - bubble[1]},{bubble[2] - bubble[0]},{bubble[3] - bubble[1]}")
+    for name in ("text_class", "angle", "direction"):
+        parts.append(f"{name}={getattr(block, name, None)}")
+    return hash_bytes("|".join(parts).encode("utf-8"))
+
+class RecognitionCache:
+    """
+    Cache kết quả nhận dạng theo từng vùng văn bản (crop)
+    
+    Trong một chương truyện các crop giống hệt nhau xuất hiện lặp lại (SFX,
+    khung tên nhân vật, credit trên mỗi trang). Khoá gồm hash của crop đã
+    chuẩn hoá và các thuộc tính block mà recognizer dùng (hash_block_crop),
+    engine và ngôn ngữ; crop đã có trong cache không cần chạy lại recognizer.
+    Loại bỏ theo LRU khi vượt quá max_entries.
+    """
+    
+    def __init__(self, max_entries: int = CROP_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, key: str) -> Optional[Tuple[str, Optional[float]]]:
+        """Lấy (text, confidence) từ cache, trả về None nếu không có"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+    
+    def put(self, key: str, text: str, confidence: Optional[float] = None) -> None:
+        with self._lock:
+            self._entries[key] = (text, confidence)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+    
+    def stats(self) -> Dict:
+        """Thống kê cache cho /api/status"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+def get_rss_bytes() -> int:
+    """Bộ nhớ thường trú hiện tại của process (0 nếu không đọc được)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError, IndexError):
+        return 0
+
+def estimate_engine_memory(engine: object, max_depth: int = 3) -> int:
+    """
+    Ước lượng bộ nhớ của một engine từ các tensor torch và mảng numpy nó giữ
+    
+    Duyệt thuộc tính của engine (tối đa max_depth cấp) để tìm torch.nn.Module,
+    tensor và numpy array, mỗi object chỉ được tính một lần.
+    """
+    seen = set()
+    
+    def visit(obj, depth):
+        if id(obj) in seen or depth > max_depth:
+            return 0
+        seen.add(id(obj))
         
-        # Sắp xếp các block từ trên xuống dưới, trái sang phải
-        rtl = True if language == "Japanese" else False
-        text_blocks = sort_blk_list(text_blocks, rtl)
+        if isinstance(obj, torch.nn.Module):
+            total = 0
+            for tensor in list(obj.parameters()) + list(obj.buffers()):
+                if id(tensor) not in seen:
+                    seen.add(id(tensor))
+                    total += tensor.numel() * tensor.element_size()
+            return total
+        if isinstance(obj, torch.Tensor):
+            return obj.numel() * obj.element_size()
+        if isinstance(obj, np.ndarray):
+            return obj.nbytes
+        if isinstance(obj, (str, bytes, int, float, bool, type(None))):
+            return 0
+        if isinstance(obj, dict):
+            return sum(visit(value, depth + 1) for value in obj.values())
+        if isinstance(obj, (list, tuple, set)):
+            return sum(visit(value, depth + 1) for value in obj)
+        if hasattr(obj, "__dict__"):
+            return sum(visit(value, depth + 1) for value in vars(obj).values())
+        return 0
+    
+    return visit(engine, 0)
+
+def quantize_int8(engine: object, max_depth: int = 3) -> int:
+    """
+    Lượng tử hoá động (int8) các torch.nn.Module mà engine giữ
+    
+    Duyệt thuộc tính của engine giống estimate_engine_memory và thay mỗi
+    module tìm được bằng bản có các lớp Linear/LSTM/GRU dùng trọng số int8.
+    Module được nhiều thuộc tính cùng trỏ tới chỉ lượng tử hoá một lần và mọi
+    chỗ tham chiếu đều được thay bằng cùng một bản int8 (không để lại bản fp32).
+    Chỉ có tác dụng khi chạy trên CPU.
+    
+    Returns:
+        Số module đã được lượng tử hoá
+    """
+    seen = set()
+    # id(module gốc) -> (module gốc, bản int8); giữ module gốc để id không bị dùng lại khi duyệt
+    quantized_modules = {}
+    layers = {torch.nn.Linear, torch.nn.LSTM, torch.nn.GRU}
+    
+    def quantize(module):
+        if id(module) not in quantized_modules:
+            module.eval()
+            quantized_modules[id(module)] = (
+                module, torch.ao.quantization.quantize_dynamic(module, layers, dtype=torch.qint8)
+            )
+        return quantized_modules[id(module)][1]
+    
+    def visit(obj, depth):
+        if id(obj) in seen or depth > max_depth:
+            return
+        seen.add(id(obj))
         
-        # Thực hiện OCR
-        print(f"Đang thực hiện trích xuất với ngôn ngữ: {language}...")
+        if isinstance(obj, (str, bytes, int, float, bool, type(None), torch.Tensor, np.ndarray)):
+            return
+        if isinstance(obj, dict):
+            items = list(obj.items())
+        elif isinstance(obj, list):
+            items = list(enumerate(obj))
+        elif hasattr(obj, "__dict__") and not isinstance(obj, type):
+            items = list(vars(obj).items())
+        else:
+            return
+        
+        for key, value in items:
+            if isinstance(value, torch.nn.Module):
+                quantized = quantize(value)
+                if isinstance(obj, (dict, list)):
+                    obj[key] = quantized
+                else:
+                    setattr(obj, key, quantized)
+            else:
+                visit(value, depth + 1)
+    
+    visit(engine, 0)
+    return len(quantized_modules)
+
+class _EnginePool:
+    """Các instance của một engine cùng khoá và hàng đợi instance đang rảnh"""
+    
+    def __init__(self):
+        self.free = queue.LifoQueue()
+        self.instances = 0
+        self.in_use = 0
+        self.lock = threading.Lock()
+        # Pool đã bị gỡ khỏi EngineManager: không cho mượn thêm, luồng đang chờ lấy lại pool mới
+        self.detached = False
+
+class EngineManager:
+    """
+    Quản lý các OCR engine đã tải với giới hạn bộ nhớ
+    
+    Engine được tải khi cần qua hàm loader truyền vào lease(); các luồng cùng
+    yêu cầu một engine chưa tải chỉ tải một lần. Mỗi instance chỉ được một
+    luồng dùng tại một thời điểm; với pool_size > 1 các yêu cầu đồng thời có thể
+    dùng thêm instance của cùng engine. Khi tổng bộ nhớ ước lượng vượt quá
+    memory_budget, engine ít được dùng gần đây nhất sẽ bị giải phóng.
+    """
+    
+    # Chu kỳ (giây) luồng đang chờ instance rảnh kiểm tra pool còn được dùng không
+    wait_interval = 1.0
+    
+    def __init__(self, memory_budget: int = 0, pool_size: int = ENGINE_INSTANCES):
+        """
+        Args:
+            memory_budget: Giới hạn bộ nhớ (byte), 0 để không giới hạn
+            pool_size: Số instance tối đa của mỗi engine
+        """
+        self.memory_budget = memory_budget
+        self.pool_size = max(1, pool_size)
+        self._pools = OrderedDict()
+        self._info = {}
+        self._loading = {}
+        self._lock = threading.RLock()
+        self.evictions = 0
+    
+    @contextmanager
+    def lease(self, key: str, loader: Callable[[], object]):
+        """Mượn một instance engine để chạy suy luận, trả lại khi xong"""
+        while True:
+            pool = self._get_pool(key, loader)
+            engine = self._checkout(key, pool, loader)
+            # None: pool bị gỡ (giải phóng bộ nhớ) trước khi lấy được instance, lấy lại pool
+            if engine is not None:
+                break
         try:
-            ocr_engine = self._get_ocr_engine(language)
-            
-            # Đặt ngôn ngữ nguồn cho mỗi block
-            lang_code = LANGUAGE_CODES.get(language, "en")
-            for block in text_blocks:
-                block.source_lang = lang_code
+            yield engine
+        finally:
+            with pool.lock:
+                pool.in_use -= 1
+                # Instance của pool đã gỡ được bỏ đi để thu hồi bộ nhớ
+                if not pool.detached:
+                    pool.free.put(engine)
+    
+    def _get_pool(self, key: str, loader: Callable[[], object]) -> _EnginePool:
+        """Lấy pool của engine, tải instance đầu tiên nếu chưa có (single-flight)"""
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is not None:
+                self._pools.move_to_end(key)
+                return pool
+            load_lock = self._loading.setdefault(key, threading.Lock())
+        
+        with load_lock:
+            with self._lock:
+                pool = self._pools.get(key)
+                if pool is not None:
+                    self._pools.move_to_end(key)
+                    return pool
             
-            # Xử lý OCR
-            text_blocks = ocr_engine.process_image(image, text_blocks)
-            print(f"Trích xuất hoàn thành, xử lý {len(text_blocks)} blocks")
-        except Exception as e:
-            error_msg = f"Lỗi khi thực hiện trích xuất: {str(e)}"
-            print(error_msg)
-            import traceback
-            print(traceback.format_exc())
-            raise ValueError(error_msg)
+            pool = _EnginePool()
+            pool.free.put(self._load(key, loader))
+            pool.instances = 1
+            with self._lock:
+                self._pools[key] = pool
+                self._loading.pop(key, None)
+                evicted = self._enforce_budget(keep=key)
+            self._release(evicted)
+            return pool
+    
+    def _checkout(self, key: str, pool: _EnginePool, loader: Callable[[], object]) -> object:
+        """
+        Lấy instance rảnh, tạo thêm nếu pool chưa đầy, nếu không thì chờ
         
-        # Tạo kết quả
-        results = []
-        transcript_lines = []
-        transcript_lines.append(f"//{os.path.basename(image_path)}")
+        Chỉ tạo thêm instance khi pool vẫn nằm trong memory_budget sau khi thêm;
+        các engine khác vượt giới hạn được giải phóng theo LRU.
         
-        for i, block in enumerate(text_blocks):
-            if block.text:
-                results.append({
+        Returns:
+            Instance engine, hoặc None nếu pool đã bị gỡ trong lúc chờ
+        """
+        create = False
+        with pool.lock:
+            if pool.detached:
+                return None
+            try:
+                engine = pool.free.get_nowait()
+            except queue.Empty:
+                engine = None
+                if pool.instances < self.pool_size and self._has_room_for_instance(key, pool):
+                    pool.instances += 1
+                    create = True
+            pool.in_use += 1
+        
+        if engine is None:
+            try:
+                engine = self._load(key, loader) if create else self._wait_for_instance(pool)
+            except Exception:
+                with pool.lock:
+                    pool.in_use -= 1
+                    if create:
+                        pool.instances -= 1
+                raise
+            if engine is None:
+                return None
+            if create:
+                with self._lock:
+                    evicted = self._enforce_budget(keep=key)
+                self._release(evicted)
+        
+        with self._lock:
+            info = self._info[key]
+            info["last_used"] = time.time()
+            info["uses"] += 1
+        return engine
+    
+    def _wait_for_instance(self, pool: _EnginePool) -> Optional[object]:
+        """Chờ instance rảnh của pool; trả về None (và nhả chỗ in_use) nếu pool bị gỡ trong lúc chờ"""
+        while True:
+            try:
+                return pool.free.get(timeout=self.wait_interval)
+            except queue.Empty:
+                with pool.lock:
+                    if pool.detached:
+                        pool.in_use -= 1
+                        return None
+    
+    def _load(self, key: str, loader: Callable[[], object]) -> object:
+        """Tải một instance engine và ghi nhận thời gian tải, bộ nhớ"""
+        rss_before = get_rss_bytes()
+        start = time.perf_counter()
+        engine = loader()
+        load_seconds = time.perf_counter() - start
+        
+        # Ưu tiên kích thước tensor; RSS tăng thêm dùng khi engine không dùng torch
+        size = max(estimate_engine_memory(engine), get_rss_bytes() - rss_before, 0)
+        
+        with self._lock:
+            info = self._info.setdefault(key, {"loads": 0, "evictions": 0, "load_seconds": 0.0, "uses": 0,
+                                               "instance_bytes": 0})
+            info.update({
+                "resident": True,
+                "instance_bytes": max(info["instance_bytes"], size) if info.get("resident") else size,
+                "load_seconds": load_seconds,
+                "loads": info["loads"] + 1,
+                "last_used": time.time()
+            })
+        logger.info("Đã tải OCR engine %s trong %.2fs, bộ nhớ ước lượng %.1f MB", key, load_seconds, size / 1024 / 1024)
+        return engine
+    
+    def _has_room_for_instance(self, key: str, pool: _EnginePool) -> bool:
+        """Pool có thể thêm một instance mà không vượt memory_budget (kể cả khi giải phóng engine khác)"""
+        if self.memory_budget <= 0:
+            return True
+        with self._lock:
+            return self._pool_bytes(key, pool) + self._info[key]["instance_bytes"] <= self.memory_budget
+    
+    def _enforce_budget(self, keep: str) -> List[Tuple[str, _EnginePool]]:
+        """
+        Gỡ các engine LRU cho đến khi tổng bộ nhớ nằm trong giới hạn (gọi khi giữ self._lock)
+        
+        Returns:
+            Các pool đã gỡ, người gọi giải phóng bằng _release sau khi nhả khoá
+        """
+        evicted = []
+        if self.memory_budget <= 0:
+            return evicted
+        
+        while self.resident_bytes() > self.memory_budget and len(self._pools) > 1:
+            key = next(iter(self._pools))
+            if key == keep:
+                break
+            evicted.append((key, self._detach(key)))
+        return evicted
+    
+    def evict(self, key: str) -> None:
+        """
+        Giải phóng một engine khỏi bộ nhớ
+        
+        Instance đang được dùng sẽ được giải phóng khi luồng đang dùng trả lại.
+        """
+        with self._lock:
+            pool = self._detach(key)
+            evicted = [(key, pool)] if pool is not None else []
+            del pool
+        self._release(evicted)
+    
+    def _detach(self, key: str) -> Optional[_EnginePool]:
+        """Gỡ pool khỏi danh sách engine đang tải (gọi khi giữ self._lock)"""
+        pool = self._pools.pop(key, None)
+        if pool is None:
+            return None
+        # Không lấy pool.lock ở đây: _checkout giữ pool.lock khi lấy self._lock
+        pool.detached = True
+        
+        info = self._info[key]
+        info["resident"] = False
+        info["evictions"] += 1
+        self.evictions += 1
+        return pool
+    
+    def _release(self, pools: List[Tuple[str, _EnginePool]]) -> None:
+        """Bỏ các instance rảnh của pool đã gỡ và thu hồi bộ nhớ, ngoài self._lock để không chặn luồng khác"""
+        if not pools:
+            return
+        for key, pool in pools:
+            logger.info("Giải phóng OCR engine %s (%.1f MB)", key, self._pool_bytes(key, pool) / 1024 / 1024)
+            while True:
+                try:
+                    pool.free.get_nowait()
+                except queue.Empty:
+                    break
+        # Bỏ mọi tham chiếu tới pool trước khi thu hồi
+        pool = None
+        del pools[:]
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    
+    def _pool_bytes(self, key: str, pool: _EnginePool) -> int:
+        return self._info[key]["instance_bytes"] * pool.instances
+    
+    def resident_bytes(self) -> int:
+        """Tổng bộ nhớ ước lượng của các engine đang tải"""
+        with self._lock:
+            return sum(self._pool_bytes(key, pool) for key, pool in self._pools.items())
+    
+    def keys(self) -> List[str]:
+        with self._lock:
+            return list(self._pools.keys())
+    
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._pools
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._pools)
+    
+    def stats(self) -> Dict:
+        """Thống kê cho /api/status"""
+        with self._lock:
+            engines = {}
+            for key, info in self._info.items():
+                pool = self._pools.get(key)
+                engines[key] = dict(info)
+                engines[key].update({
+                    "instances": pool.instances if pool else 0,
+                    "in_use": pool.in_use if pool else 0,
+                    "size_bytes": self._pool_bytes(key, pool) if pool else 0
+                })
+            return {
+                'memory_budget_bytes': self.memory_budget,
+                'resident_bytes': self.resident_bytes(),
+                'pool_size': self.pool_size,
+                'evictions': self.evictions,
+                'engines': engines
+            }
+
+class OCRExtractor:
+    """
+    Trích xuất văn bản từ hình ảnh sử dụng các OCR engine mặc định của Comic Translate
+    """
+    
+    def __init__(self, use_gpu: bool = False, cache_size_mb: int = 64, cache_dir: str = None,
+                 detection_cache_size: int = DETECTION_CACHE_SIZE, crop_cache_size: int = CROP_CACHE_SIZE,
+                 engine_memory_mb: int = ENGINE_MEMORY_MB,
+                 engine_instances: int = ENGINE_INSTANCES, num_threads: int = TORCH_THREADS,
+                 backend: str = INFERENCE_BACKEND, engine_backends: Dict[str, str] = None,
+                 result_store: "ResultStore" = None):
+        """
+        Khởi tạo OCR Extractor
+        
+        Args:
+            use_gpu: Sử dụng GPU nếu có
+            cache_size_mb: Dung lượng cache kết quả trong bộ nhớ (MB), 0 để tắt cache
+            cache_dir: Thư mục lưu cache kết quả trên đĩa (tuỳ chọn)
+            detection_cache_size: Số trang tối đa trong cache detection, 0 để tắt
+            crop_cache_size: Số crop tối đa trong cache nhận dạng, 0 để tắt
+            engine_memory_mb: Giới hạn bộ nhớ (MB) cho các OCR engine, 0 để không giới hạn
+            engine_instances: Số instance tối đa của mỗi engine để chạy song song
+            num_threads: Số luồng intra-op của torch, 0 để dùng mặc định
+            backend: Backend suy luận mặc định ("torch" hoặc "int8")
+            engine_backends: Backend riêng theo tên engine class hoặc "detector",
+                ví dụ {"DocTROCR": "int8"}
+            result_store: Kho lưu transcript để download (mặc định tạo mới)
+        """
+        self.use_gpu = use_gpu
+        self.device = 'cuda' if use_gpu and torch.cuda.is_available() else 'cpu'
+        
+        logger.info("Sử dụng device: %s", self.device)
+        
+        # Giới hạn số luồng torch để nhiều yêu cầu đồng thời không tranh CPU
+        if num_threads > 0:
+            configure_torch_threads(num_threads)
+        
+        # Backend suy luận của detector và từng OCR engine
+        self.set_backends(backend, ENGINE_BACKENDS if engine_backends is None else engine_backends)
+        
+        # Khởi tạo detector để phát hiện vùng chứa văn bản
+        self.text_detector = None
+        
+        # Các OCR engine đã khởi tạo, giới hạn theo bộ nhớ
+        self.ocr_engines = EngineManager(engine_memory_mb * 1024 * 1024, engine_instances)
+        
+        # Khoá khởi tạo detector (chỉ tải một lần) và khoá suy luận detector
+        self._detector_init_lock = threading.Lock()
+        self._detector_lock = threading.Lock()
+        
+        # Cache kết quả theo nội dung hình ảnh
+        self.result_cache = None
+        if cache_size_mb > 0 or cache_dir:
+            self.result_cache = ResultCache(max(cache_size_mb, 0) * 1024 * 1024, cache_dir)
+        
+        # Cache detection riêng, không phụ thuộc ngôn ngữ
+        self.detection_cache = DetectionCache(detection_cache_size) if detection_cache_size > 0 else None
+        
+        # Cache nhận dạng theo crop, dùng chung giữa các trang và các yêu cầu
+        self.crop_cache = RecognitionCache(crop_cache_size) if crop_cache_size > 0 else None
+        
+        # Kho transcript để download, có thời hạn
+        self.result_store = result_store if result_store is not None else ResultStore(legacy_dir=TEMP_DIR)
+        
+        # Trạng thái sẵn sàng sau khi warm-up
+        self.ready = False
+        self.warmup_seconds = {}
+        
+        # Các hàm nhận thời gian từng stage: observer(stage, seconds, labels)
+        self.stage_observers = [_record_stage_timing]
+    
+    def _init_text_detector(self):
+        """Khởi tạo detector để phát hiện vùng chứa văn bản"""
+        if self.text_detector is not None:
+            return
+        
+        with self._detector_init_lock:
+            if self.text_detector is not None:
+                return
+            
+            # Tạo object settings tạm thời để truyền cho detector
+            class MockSettings:
+                def __init__(self, use_gpu):
+                    self.use_gpu = use_gpu
+                def is_gpu_enabled(self):
+                    return self.use_gpu
+                def get_tool_selection(self, key):
+                    return DETECTOR_NAME  # Detector mặc định
+            
+            settings = MockSettings(self.use_gpu)
+            detector = TextBlockDetector(settings)
+            self._apply_backend(detector, "detector")
+            self.text_detector = detector
+    
+    def set_backends(self, backend: str, engine_backends: Dict[str, str] = None) -> None:
+        """
+        Chọn backend suy luận mặc định và backend riêng cho từng engine
+        
+        Engine đã tải với backend cũ không được dùng nữa (khoá engine gồm cả
+        backend) và sẽ bị giải phóng dần theo LRU; detector được tải lại khi cần.
+        """
+        engine_backends = dict(engine_backends or {})
+        for name, value in [("default", backend)] + list(engine_backends.items()):
+            if value not in SUPPORTED_BACKENDS:
+                raise ValueError(f"Backend không được hỗ trợ cho {name}: {value} (hỗ trợ: {', '.join(SUPPORTED_BACKENDS)})")
+        
+        self.backend = backend
+        self.engine_backends = engine_backends
+        self.text_detector = None
+    
+    def _backend_for(self, name: str) -> str:
+        """Backend suy luận của một engine (theo tên class) hoặc của detector"""
+        return self.engine_backends.get(name, self.backend)
+    
+    def _apply_backend(self, engine: object, name: str) -> None:
+        """Chuyển engine vừa tải sang backend đã chọn"""
+        backend = self._backend_for(name)
+        if backend != "int8":
+            return
+        if self.device != "cpu":
+            logger.warning("Backend int8 chỉ hỗ trợ CPU, %s tiếp tục chạy torch trên %s", name, self.device)
+            return
+        count = quantize_int8(engine)
+        if count:
+            logger.info("Lượng tử hoá int8 %d module của %s", count, name)
+        else:
+            logger.warning("Không tìm thấy module torch trong %s, tiếp tục dùng engine gốc", name)
+    
+    def _lease_ocr_engine(self, language: str):
+        """
+        Mượn OCR engine phù hợp với ngôn ngữ (dùng với câu lệnh with)
+        
+        Các ngôn ngữ dùng chung engine class và cấu hình (ví dụ các ngôn ngữ
+        Latin cùng dùng DocTR) sẽ dùng chung engine; ngôn ngữ được gán cho
+        từng block qua source_lang khi xử lý. Engine đang được mượn không bị
+        luồng khác dùng cùng lúc.
+        
+        Args:
+            language: Ngôn ngữ cần OCR
+            
+        Returns:
+            Context manager trả về OCR engine phù hợp
+        """
+        engine_cls, config = self._engine_spec(language)
+        return self.ocr_engines.lease(self._engine_key(language), lambda: self._load_ocr_engine(engine_cls, config))
+    
+    def _engine_spec(self, language: str) -> Tuple[type, Dict]:
+        """Chọn engine class và tham số initialize phù hợp với ngôn ngữ"""
+        if language == "Japanese":
+            return MangaOCREngine, {"device": self.device}
+        elif language == "Korean":
+            return PororoOCREngine, {}
+        elif language == "Chinese":
+            return PaddleOCREngine, {}
+        else:
+            # Sử dụng DocTR OCR cho các ngôn ngữ khác
+            return DocTROCR, {"device": self.device}
+    
+    def _engine_key(self, language: str) -> str:
+        """Khoá engine theo (engine class, device, cấu hình), không theo ngôn ngữ"""
+        engine_cls, config = self._engine_spec(language)
+        options = ",".join(f"{name}={value}" for name, value in sorted(config.items()) if name != "device")
+        backend = self._backend_for(engine_cls.__name__)
+        return (f"{engine_cls.__name__}@{self.device}" + (f"({options})" if options else "")
+                + (f"[{backend}]" if backend != "torch" else ""))
+    
+    def _load_ocr_engine(self, engine_cls: type, config: Dict) -> object:
+        """Tạo và khởi tạo OCR engine"""
+        engine = engine_cls()
+        engine.initialize(**config)
+        self._apply_backend(engine, engine_cls.__name__)
+        return engine
+    
+    def warm_up(self, languages: List[str] = None) -> Dict[str, float]:
+        """
+        Tải sẵn detector và OCR engine, chạy thử một lần suy luận trên ảnh tổng hợp
+        
+        Lần suy luận đầu tiên của torch chậm hơn nhiều so với các lần sau, nên
+        chạy trước khi nhận yêu cầu để yêu cầu đầu tiên không bị timeout.
+        
+        Args:
+            languages: Danh sách ngôn ngữ cần tải engine
+            
+        Returns:
+            Thời gian warm-up (giây) của detector và từng ngôn ngữ
+        """
+        languages = languages or []
+        for language in languages:
+            self._check_language(language)
+        
+        image = make_warmup_image()
+        
+        start = time.perf_counter()
+        self._init_text_detector()
+        with self._detector_lock:
+            self.text_detector.detect(image)
+        self.warmup_seconds["detector"] = time.perf_counter() - start
+        logger.info("Warm-up detector: %.2fs", self.warmup_seconds['detector'])
+        
+        for language in languages:
+            start = time.perf_counter()
+            block = TextBlock(text_bbox=np.array([16, 16, image.shape[1] - 16, image.shape[0] - 16]))
+            block.source_lang = LANGUAGE_CODES.get(language, "en")
+            with self._lease_ocr_engine(language) as ocr_engine:
+                ocr_engine.process_image(image, [block])
+            self.warmup_seconds[language] = time.perf_counter() - start
+            logger.info("Warm-up %s: %.2fs", language, self.warmup_seconds[language])
+        
+        self.ready = True
+        return dict(self.warmup_seconds)
+    
+    def _observe(self, stage: str, seconds: float, language: str) -> None:
+        """Gửi thời gian của một stage cho các observer (benchmark, metrics)"""
+        if not self.stage_observers:
+            return
+        labels = {"language": language, "engine": self._engine_spec(language)[0].__name__}
+        for observer in self.stage_observers:
+            observer(stage, seconds, labels)
+    
+    @contextmanager
+    def _timed(self, stage: str, language: str):
+        """Đo thời gian một stage (decode, detect, sort, ocr, serialize)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._observe(stage, time.perf_counter() - start, language)
+    
+    def _engine_identity(self, language: str) -> str:
+        """Định danh detector + OCR engine + phiên bản dùng cho khoá cache"""
+        engine_name = self._engine_spec(language)[0].__name__
+        return f"{self._detector_identity()}/{engine_name}:{self._backend_for(engine_name)}/v{RESULT_CACHE_VERSION}"
+    
+    def _detector_identity(self) -> str:
+        """Định danh detector + backend (kết quả int8 có thể khác torch)"""
+        return f"{DETECTOR_NAME}:{self._backend_for('detector')}"
+    
+    def _result_cache_key(self, digest: str, language: str) -> str:
+        """Tạo khoá cache từ hash hình ảnh, ngôn ngữ và định danh engine"""
+        return f"{digest}:{language}:{self._engine_identity(language)}"
+    
+    def _get_cached_result(self, cache_key: Optional[str], filename: str, output_path: str = None) -> Optional[Dict]:
+        """Trả về kết quả từ cache (đã gắn filename mới) hoặc None nếu không có"""
+        if cache_key is None:
+            return None
+        
+        cached = self.result_cache.get(cache_key)
+        if cached is None:
+            return None
+        
+        logger.debug("Lấy kết quả từ cache cho %s", filename)
+        return self._make_result(cached["blocks"], cached["detected"], filename, output_path)
+    
+    def detect_text_blocks(self, image: np.ndarray) -> List[TextBlock]:
+        """
+        Phát hiện các vùng văn bản trong hình ảnh
+        
+        Args:
+            image: Hình ảnh cần phát hiện văn bản
+            
+        Returns:
+            Danh sách các TextBlock
+        """
+        tiles = compute_tiles(image.shape[0], image.shape[1])
+        if tiles is None:
+            return self._run_detector([image])[0]
+        return self._detect_tiled(image, tiles)
+    
+    def _run_detector(self, images: List[np.ndarray]) -> List[List[TextBlock]]:
+        """
+        Chạy detector trên danh sách hình ảnh
+        
+        TextBlockDetector không có API batch nên đây là vòng lặp gọi detect cho
+        từng ảnh; khoá detector được giữ cho từng ảnh để yêu cầu /api/ocr đồng thời
+        không phải chờ cả nhóm. detect_batch là hook tuỳ chọn: chỉ được dùng (một
+        lần gọi cho cả nhóm) nếu detector, ví dụ bản thay thế, tự cung cấp.
+        """
+        self._init_text_detector()
+        detect_batch = getattr(self.text_detector, "detect_batch", None)
+        if callable(detect_batch) and len(images) > 1:
+            with self._detector_lock:
+                return [list(blocks or []) for blocks in detect_batch(images)]
+        detected = []
+        for image in images:
+            with self._detector_lock:
+                detected.append(list(self.text_detector.detect(image) or []))
+        return detected
+    
+    def _detect_tiled(self, image: np.ndarray, tiles: List[Tuple[int, int, int, int]]) -> List[TextBlock]:
+        """
+        Phát hiện vùng văn bản trên ảnh lớn bằng cách chia thành các tile chồng lấn
+        
+        Các tile là view của ảnh gốc (không sao chép) và được gửi cho detector theo
+        từng batch DEFAULT_BATCH_SIZE nên bộ nhớ của detector không phụ thuộc vào
+        chiều cao ảnh. Block được dịch về toạ độ ảnh gốc rồi loại trùng ở vùng chồng lấn.
+        
+        Args:
+            image: Hình ảnh cần phát hiện văn bản
+            tiles: Danh sách tile (x1, y1, x2, y2)
+            
+        Returns:
+            Danh sách các TextBlock đã gộp
+        """
+        logger.debug("Chia hình ảnh %dx%d thành %d tile để phát hiện văn bản", image.shape[1], image.shape[0], len(tiles))
+        blocks = []
+        tile_indices = []
+        for start in range(0, len(tiles), DEFAULT_BATCH_SIZE):
+            batch = tiles[start:start + DEFAULT_BATCH_SIZE]
+            detected = self._run_detector([image[y1:y2, x1:x2] for x1, y1, x2, y2 in batch])
+            for index, ((x1, y1, _, _), tile_blocks) in enumerate(zip(batch, detected), start):
+                for block in tile_blocks:
+                    offset_block(block, x1, y1)
+                    blocks.append(block)
+                    tile_indices.append(index)
+        return dedupe_blocks(blocks, tile_indices, tiles)
+    
+    def _check_language(self, language: str) -> None:
+        """Kiểm tra ngôn ngữ có được hỗ trợ không"""
+        if language not in SUPPORTED_LANGUAGES:
+            raise ValueError(f"Ngôn ngữ không được hỗ trợ. Các ngôn ngữ được hỗ trợ: {', '.join(SUPPORTED_LANGUAGES)}")
+    
+    def process_image(self, image_path: str, language: str, output_path: str = None) -> Dict:
+        """
+        Xử lý một hình ảnh để trích xuất văn bản
+        
+        Args:
+            image_path: Đường dẫn đến hình ảnh
+            language: Ngôn ngữ của văn bản trong hình ảnh
+            output_path: Đường dẫn để lưu kết quả (tuỳ chọn)
+            
+        Returns:
+            Dictionary chứa kết quả trích xuất
+        """
+        self._check_language(language)
+        
+        # Đọc toàn bộ file vào bộ nhớ rồi giải mã chung một đường với API
+        logger.debug("Đọc hình ảnh từ %s", image_path)
+        try:
+            with open(image_path, "rb") as f:
+                image_data = f.read()
+        except OSError as e:
+            error_msg = f"Không thể đọc hình ảnh từ {image_path}: {str(e)}"
+            logger.debug(error_msg)
+            raise ValueError(error_msg)
+        
+        return self.process_bytes(image_data, language, os.path.basename(image_path), output_path)
+    
+    def process_bytes(self, image_data: bytes, language: str, filename: str = "image.jpg",
+                      output_path: str = None, digest: str = None) -> Dict:
+        """
+        Xử lý hình ảnh từ buffer đã mã hoá (PNG, JPEG, WEBP...) mà không ghi ra đĩa
+        
+        Args:
+            image_data: Dữ liệu hình ảnh dạng byte (bytes, bytearray hoặc memoryview)
+            language: Ngôn ngữ của văn bản trong hình ảnh
+            filename: Tên hiển thị trong transcript
+            output_path: Đường dẫn để lưu kết quả (tuỳ chọn)
+            digest: hash_bytes(image_data) nếu người gọi đã tính sẵn
+            
+        Returns:
+            Dictionary chứa kết quả trích xuất
+        """
+        self._check_language(language)
+        
+        # Tra cache theo hash của dữ liệu gốc để bỏ qua cả bước giải mã khi trùng
+        cache_key = None
+        if self.result_cache is not None:
+            cache_key = self._result_cache_key(digest or hash_bytes(image_data), language)
+            cached = self._get_cached_result(cache_key, filename, output_path)
+            if cached is not None:
+                return cached
+        
+        with self._timed("decode", language):
+            image = decode_image(image_data)
+        return self._process_decoded(image, language, filename, output_path, cache_key)
+    
+    def process_array(self, image: np.ndarray, language: str, filename: str = "image",
+                      output_path: str = None) -> Dict:
+        """
+        Xử lý hình ảnh đã được giải mã (mảng BGR của OpenCV)
+        
+        Args:
+            image: Hình ảnh dạng numpy array (H, W, 3)
+            language: Ngôn ngữ của văn bản trong hình ảnh
+            filename: Tên hiển thị trong transcript
+            output_path: Đường dẫn để lưu kết quả (tuỳ chọn)
+            
+        Returns:
+            Dictionary chứa kết quả trích xuất
+        """
+        self._check_language(language)
+        
+        cache_key = None
+        if self.result_cache is not None:
+            cache_key = self._result_cache_key(hash_image(image), language)
+            cached = self._get_cached_result(cache_key, filename, output_path)
+            if cached is not None:
+                return cached
+        
+        return self._process_decoded(image, language, filename, output_path, cache_key)
+    
+    def process_regions(self, image_data: bytes, regions: List[List[int]], language: str, filename: str = "image",
+                        reading_order: str = "given", output_path: str = None) -> Dict:
+        """
+        OCR các vùng văn bản do client cung cấp, bỏ qua bước detection
+        
+        Args:
+            image_data: Dữ liệu hình ảnh dạng byte
+            regions: Danh sách bbox [x1, y1, x2, y2] (xem parse_regions)
+            language: Ngôn ngữ của văn bản
+            filename: Tên hiển thị trong transcript
+            reading_order: "given" giữ thứ tự của regions, "ltr"/"rtl" sắp xếp lại theo chiều đọc
+            output_path: Đường dẫn để lưu kết quả (tuỳ chọn)
+            
+        Returns:
+            Dictionary chứa kết quả trích xuất, id của block theo thứ tự sau khi sắp xếp
+        """
+        self._check_language(language)
+        if reading_order not in READING_ORDERS:
+            raise ValueError(f"reading_order không hợp lệ: {reading_order} (hỗ trợ: {', '.join(READING_ORDERS)})")
+        
+        with self._timed("decode", language):
+            image = decode_image(image_data)
+        self._check_image_size(image)
+        
+        # Giới hạn bbox trong phạm vi hình ảnh
+        height, width = image.shape[:2]
+        text_blocks = []
+        for index, (x1, y1, x2, y2) in enumerate(regions):
+            x1, x2 = max(0, min(x1, width)), max(0, min(x2, width))
+            y1, y2 = max(0, min(y1, height)), max(0, min(y2, height))
+            if x2 <= x1 or y2 <= y1:
+                raise ValueError(f"Vùng {index} nằm ngoài hình ảnh {width}x{height}")
+            text_blocks.append(TextBlock(text_bbox=np.array([x1, y1, x2, y2])))
+        
+        if reading_order != "given" and text_blocks:
+            with self._timed("sort", language):
+                text_blocks = sort_blk_list(text_blocks, reading_order == "rtl")
+        
+        if text_blocks:
+            text_blocks = self._recognize_blocks(image, text_blocks, language)
+        with self._timed("serialize", language):
+            return self._build_result(text_blocks, filename, output_path)
+    
+    def _process_decoded(self, image: np.ndarray, language: str, filename: str,
+                         output_path: str = None, cache_key: str = None) -> Dict:
+        """Chạy detection và OCR trên hình ảnh đã giải mã"""
+        self._check_image_size(image)
+        
+        text_blocks = self._detect_sorted_blocks(image, language)
+        if text_blocks:
+            text_blocks = self._recognize_blocks(image, text_blocks, language)
+        with self._timed("serialize", language):
+            return self._build_result(text_blocks, filename, output_path, cache_key)
+    
+    def process_batch(self, images: List[Tuple[str, object]], language: str,
+                      batch_size: int = DEFAULT_BATCH_SIZE) -> List[Dict]:
+        """
+        Xử lý nhiều hình ảnh cùng lúc, chạy detection và OCR theo từng nhóm batch_size ảnh
+        
+        Detection chạy cho từng ảnh của nhóm (xem _run_detector); OCR của cả nhóm
+        dùng một lần mượn engine và một lần gọi process_image cho mọi crop chưa có
+        trong cache (xem _recognize_pages).
+        
+        Args:
+            images: Danh sách (filename, dữ liệu) với dữ liệu là bytes đã mã hoá hoặc numpy array
+            language: Ngôn ngữ của văn bản
+            batch_size: Số hình ảnh tối đa trong một nhóm detection
+            
+        Returns:
+            Danh sách kết quả theo đúng thứ tự đầu vào; ảnh lỗi có dạng {"filename", "error"}
+        """
+        self._check_language(language)
+        batch_size = max(1, int(batch_size))
+        results = [None] * len(images)
+        
+        for start in range(0, len(images), batch_size):
+            chunk = list(enumerate(images[start:start + batch_size], start))
+            
+            # Giải mã và kiểm tra từng ảnh trong batch
+            decoded = []
+            for index, (filename, data) in chunk:
+                try:
+                    is_array = isinstance(data, np.ndarray)
+                    cache_key = None
+                    if self.result_cache is not None:
+                        digest = hash_image(data) if is_array else hash_bytes(data)
+                        cache_key = self._result_cache_key(digest, language)
+                        cached = self._get_cached_result(cache_key, filename)
+                        if cached is not None:
+                            results[index] = cached
+                            continue
+                    
+                    if is_array:
+                        image = data
+                    else:
+                        with self._timed("decode", language):
+                            image = decode_image(data)
+                    self._check_image_size(image)
+                    decoded.append((index, filename, image, cache_key))
+                except Exception as e:
+                    results[index] = {"filename": filename, "error": str(e)}
+            
+            if not decoded:
+                continue
+            
+            # Detection cho cả batch
+            try:
+                detected = self._detect_sorted_batch([image for _, _, image, _ in decoded], language)
+            except Exception as e:
+                for index, filename, _, _ in decoded:
+                    results[index] = {"filename": filename, "error": str(e)}
+                continue
+            
+            # OCR các block của mọi trang trong batch trong một lần gọi engine
+            with_blocks = [i for i, text_blocks in enumerate(detected) if text_blocks]
+            if with_blocks:
+                try:
+                    recognized = self._recognize_pages([(decoded[i][2], detected[i]) for i in with_blocks], language)
+                except Exception as e:
+                    for index, filename, _, _ in decoded:
+                        results[index] = {"filename": filename, "error": str(e)}
+                    continue
+                for i, text_blocks in zip(with_blocks, recognized):
+                    detected[i] = text_blocks
+            
+            for (index, filename, image, cache_key), text_blocks in zip(decoded, detected):
+                try:
+                    with self._timed("serialize", language):
+                        results[index] = self._build_result(text_blocks, filename, cache_key=cache_key)
+                except Exception as e:
+                    results[index] = {"filename": filename, "error": str(e)}
+        
+        return results
+    
+    def _check_image_size(self, image: np.ndarray) -> None:
+        """Kiểm tra kích thước hình ảnh"""
+        height, width = image.shape[:2]
+        channels = image.shape[2] if image.ndim == 3 else 1
+        logger.debug("Kích thước hình ảnh: %dx%d, channels: %d", width, height, channels)
+        
+        if width < 10 or height < 10:
+            error_msg = f"Hình ảnh quá nhỏ: {width}x{height}"
+            logger.debug(error_msg)
+            raise ValueError(error_msg)
+    
+    def _detect_blocks(self, image: np.ndarray) -> List[TextBlock]:
+        """Phát hiện các vùng văn bản, chuyển lỗi thành ValueError"""
+        logger.debug("Đang phát hiện vùng văn bản...")
+        try:
+            text_blocks = self.detect_text_blocks(image)
+            logger.debug("Đã phát hiện %d vùng văn bản", len(text_blocks))
+            return text_blocks
+        except Exception as e:
+            error_msg = f"Lỗi khi phát hiện vùng văn bản: {str(e)}"
+            logger.debug(error_msg, exc_info=True)
+            raise ValueError(error_msg)
+    
+    def _detect_blocks_batch(self, images: List[np.ndarray]) -> List[List[TextBlock]]:
+        """
+        Phát hiện vùng văn bản cho nhiều hình ảnh
+        
+        Ảnh thường được gửi chung một batch cho detector; ảnh quá dài hoặc quá
+        lớn được chia tile như detect_text_blocks.
+        """
+        logger.debug("Đang phát hiện vùng văn bản cho batch %d hình ảnh...", len(images))
+        try:
+            # Ảnh cần chia tile được xử lý riêng, các ảnh còn lại đi chung một batch
+            detected = [None] * len(images)
+            regular = []
+            for i, image in enumerate(images):
+                tiles = compute_tiles(image.shape[0], image.shape[1])
+                if tiles is None:
+                    regular.append(i)
+                else:
+                    detected[i] = self._detect_tiled(image, tiles)
+            if regular:
+                for i, blocks in zip(regular, self._run_detector([images[i] for i in regular])):
+                    detected[i] = blocks
+            logger.debug("Đã phát hiện %d vùng văn bản", sum(len(blocks) for blocks in detected))
+            return detected
+        except Exception as e:
+            error_msg = f"Lỗi khi phát hiện vùng văn bản: {str(e)}"
+            logger.debug(error_msg, exc_info=True)
+            raise ValueError(error_msg)
+    
+    def _sort_blocks(self, text_blocks: List[TextBlock], language: str) -> List[TextBlock]:
+        """Sắp xếp các block theo thứ tự đọc (phải sang trái với tiếng Nhật)"""
+        rtl = True if language == "Japanese" else False
+        return sort_blk_list(text_blocks, rtl)
+    
+    def _detection_cache_key(self, image: np.ndarray, language: str) -> str:
+        """Khoá cache detection: hash hình ảnh, detector và chiều đọc"""
+        rtl = language == "Japanese"
+        return f"{hash_image(image)}:{self._detector_identity()}:{'rtl' if rtl else 'ltr'}"
+    
+    def _detect_sorted_blocks(self, image: np.ndarray, language: str) -> List[TextBlock]:
+        """Phát hiện và sắp xếp các block, dùng cache detection nếu có"""
+        cache_key = None
+        if self.detection_cache is not None:
+            cache_key = self._detection_cache_key(image, language)
+            text_blocks = self.detection_cache.get(cache_key)
+            if text_blocks is not None:
+                logger.debug("Lấy %d vùng văn bản từ cache detection", len(text_blocks))
+                return text_blocks
+        
+        with self._timed("detect", language):
+            text_blocks = self._detect_blocks(image)
+        if text_blocks:
+            with self._timed("sort", language):
+                text_blocks = self._sort_blocks(text_blocks, language)
+        if cache_key is not None:
+            self.detection_cache.put(cache_key, text_blocks)
+        return text_blocks
+    
+    def _detect_sorted_batch(self, images: List[np.ndarray], language: str) -> List[List[TextBlock]]:
+        """Phát hiện và sắp xếp các block cho nhiều hình ảnh, chỉ chạy detector với ảnh chưa có trong cache"""
+        detected = [None] * len(images)
+        cache_keys = [None] * len(images)
+        if self.detection_cache is not None:
+            for i, image in enumerate(images):
+                cache_keys[i] = self._detection_cache_key(image, language)
+                detected[i] = self.detection_cache.get(cache_keys[i])
+        
+        missing = [i for i, text_blocks in enumerate(detected) if text_blocks is None]
+        if missing:
+            start = time.perf_counter()
+            missing_blocks = self._detect_blocks_batch([images[i] for i in missing])
+            # Thời gian detection của batch được chia đều cho từng ảnh
+            elapsed = (time.perf_counter() - start) / len(missing)
+            for _ in missing:
+                self._observe("detect", elapsed, language)
+            
+            for i, text_blocks in zip(missing, missing_blocks):
+                if text_blocks:
+                    with self._timed("sort", language):
+                        text_blocks = self._sort_blocks(text_blocks, language)
+                if cache_keys[i] is not None:
+                    self.detection_cache.put(cache_keys[i], text_blocks)
+                detected[i] = text_blocks
+        
+        return detected
+    
+    def _recognize_blocks(self, image: np.ndarray, text_blocks: List[TextBlock], language: str) -> List[TextBlock]:
+        """Thực hiện OCR trên các block đã phát hiện"""
+        return self._recognize_pages([(image, text_blocks)], language)[0]
+    
+    def _recognize_pages(self, pages: List[Tuple[np.ndarray, List[TextBlock]]], language: str) -> List[List[TextBlock]]:
+        """
+        Thực hiện OCR trên các block của một hoặc nhiều trang với một lần mượn engine
+        
+        Crop đã có trong cache crop, hoặc trùng với crop khác trong nhóm, không
+        được nhận dạng lại. Các block còn lại được gửi cho engine trong một lần
+        gọi process_image: trên chính trang đó nếu chỉ một trang cần OCR, nếu
+        không thì trên ảnh ghép các vùng crop của mọi trang (build_crop_mosaic).
+        
+        Args:
+            pages: Danh sách (hình ảnh, các block đã phát hiện) của từng trang
+            language: Ngôn ngữ của văn bản
+            
+        Returns:
+            Danh sách block đã nhận dạng của từng trang, theo thứ tự đầu vào
+        """
+        logger.debug("Đang thực hiện trích xuất với ngôn ngữ: %s...", language)
+        try:
+            # Đặt ngôn ngữ nguồn cho mỗi block
+            lang_code = LANGUAGE_CODES.get(language, "en")
+            pages = [(image, list(text_blocks)) for image, text_blocks in pages]
+            for _, text_blocks in pages:
+                for block in text_blocks:
+                    block.source_lang = lang_code
+            
+            # Lấy kết quả của các crop đã nhận dạng trước đó; crop trùng nhau
+            # trong cùng nhóm chỉ được nhận dạng một lần. Vị trí block là (trang, block)
+            pending = [(p, i) for p, (_, text_blocks) in enumerate(pages) for i in range(len(text_blocks))]
+            duplicates = {}
+            keys = {}
+            if self.crop_cache is not None:
+                prefix = f"{self._engine_identity(language)}:{lang_code}:"
+                pending = []
+                first_index = {}
+                for p, (image, text_blocks) in enumerate(pages):
+                    for i, block in enumerate(text_blocks):
+                        digest = hash_block_crop(image, block)
+                        if digest is None:
+                            pending.append((p, i))
+                            continue
+                        key = prefix + digest
+                        if key in first_index:
+                            duplicates.setdefault(first_index[key], []).append((p, i))
+                            continue
+                        cached = self.crop_cache.get(key)
+                        if cached is not None:
+                            block.text, confidence = cached
+                            if confidence is not None:
+                                block.confidence = confidence
+                            continue
+                        first_index[key] = (p, i)
+                        pending.append((p, i))
+                keys = {position: key for key, position in first_index.items()}
+            
+            # Xử lý OCR các crop chưa có trong cache
+            if pending:
+                with self._lease_ocr_engine(language) as ocr_engine:
+                    with self._timed("ocr", language):
+                        recognized = self._run_ocr_engine(ocr_engine, pages, pending)
+                for (p, i), block in zip(pending, recognized):
+                    pages[p][1][i] = block
+                    if (p, i) in keys:
+                        self.crop_cache.put(keys[(p, i)], block.text, getattr(block, "confidence", None))
+            
+            for (p, i), copies in duplicates.items():
+                source = pages[p][1][i]
+                for q, j in copies:
+                    pages[q][1][j].text = source.text
+                    if getattr(source, "confidence", None) is not None:
+                        pages[q][1][j].confidence = source.confidence
+            
+            total = sum(len(text_blocks) for _, text_blocks in pages)
+            logger.debug("Trích xuất hoàn thành, xử lý %d blocks trên %d trang (%d từ cache crop)",
+                         total, len(pages), total - len(pending))
+            return [text_blocks for _, text_blocks in pages]
+        except Exception as e:
+            error_msg = f"Lỗi khi thực hiện trích xuất: {str(e)}"
+            logger.debug(error_msg, exc_info=True)
+            raise ValueError(error_msg)
+    
+    def _run_ocr_engine(self, ocr_engine, pages: List[Tuple[np.ndarray, List[TextBlock]]],
+                        pending: List[Tuple[int, int]]) -> List[TextBlock]:
+        """
+        Gọi process_image một lần cho các block ở vị trí pending (trang, block)
+        
+        Nhiều trang: các block được dịch sang toạ độ của ảnh ghép rồi dịch lại
+        sau khi nhận dạng (kể cả khi engine lỗi).
+        """
+        page_indices = sorted({p for p, _ in pending})
+        blocks = [pages[p][1][i] for p, i in pending]
+        if len(page_indices) == 1:
+            return ocr_engine.process_image(pages[page_indices[0]][0], blocks)
+        
+        regions = [crop_region(pages[p][0], pages[p][1][i]) for p, i in pending]
+        mosaic, positions = build_crop_mosaic([(pages[p][0], region) for (p, _), region in zip(pending, regions)],
+                                              max(pages[p][0].shape[1] for p in page_indices))
+        offsets = [(x - region[0], y - region[1]) for (x, y), region in zip(positions, regions)]
+        for block, (dx, dy) in zip(blocks, offsets):
+            offset_block(block, dx, dy)
+        recognized = []
+        try:
+            recognized = ocr_engine.process_image(mosaic, blocks)
+        finally:
+            for block, (dx, dy) in zip(blocks, offsets):
+                offset_block(block, -dx, -dy)
+            # Engine trả về block mới thay vì sửa block đầu vào: dịch lại cả các block đó
+            for block, original, (dx, dy) in zip(recognized, blocks, offsets):
+                if block is not original:
+                    offset_block(block, -dx, -dy)
+        return recognized
+    
+    def _build_result(self, text_blocks: List[TextBlock], filename: str, output_path: str = None,
+                      cache_key: str = None) -> Dict:
+        """Tạo dictionary kết quả từ các TextBlock và lưu vào cache nếu cần"""
+        results = []
+        for i, block in enumerate(text_blocks):
+            if block.text:
+                results.append({
                     "id": i,
                     "text": block.text,
                     "bbox": [int(coord) for coord in block.xyxy],
                     "confidence": getattr(block, "confidence", None)
                 })
-                transcript_lines.append(block.text)
         
-        # Tạo transcript theo định dạng yêu cầu
-        transcript = "\n".join(transcript_lines)
+        detected = bool(text_blocks)
+        if cache_key is not None:
+            self.result_cache.put(cache_key, {"blocks": results, "detected": detected})
+        
+        return self._make_result(results, detected, filename, output_path)
+    
+    def _make_result(self, results: List[Dict], detected: bool, filename: str, output_path: str = None) -> Dict:
+        """Tạo transcript từ danh sách block đã trích xuất, lưu vào file nếu cần"""
+        if not detected:
+            logger.debug("Không phát hiện được văn bản nào trong hình ảnh")
+            empty_result = {
+                "blocks": [], 
+                "transcript": f"//{filename}\nKhông phát hiện được văn bản", 
+                "filename": filename
+            }
+            
+            # Lưu kết quả rỗng nếu cần
+            if output_path:
+                with open(output_path, "w", encoding="utf-8") as f:
+                    f.write(empty_result["transcript"])
+                    
+            return empty_result
+        
+        # Tạo transcript theo định dạng yêu cầu
+        transcript_lines = [f"//{filename}"]
+        transcript_lines.extend(block["text"] for block in results)
+        transcript = "\n".join(transcript_lines)
+        
+        # Lưu kết quả vào file nếu có output_path
+        if output_path:
+            try:
+                self._save_results(results, output_path, filename, transcript)
+                logger.debug("Đã lưu kết quả vào %s", output_path)
+            except Exception as e:
+                logger.error("Lỗi khi lưu kết quả: %s", e)
+        
+        logger.debug("Hoàn thành xử lý hình ảnh: %s", filename)
+        return {
+            "blocks": results, 
+            "transcript": transcript,
+            "filename": filename
+        }
+    
+    def process_directory(self, dir_path: str, language: str, output_dir: str = None, workers: int = 1,
+                          force: bool = False) -> Dict:
+        """
+        Xử lý tất cả hình ảnh trong một thư mục (gom kết quả của iter_directory)
+        
+        Args:
+            dir_path: Đường dẫn đến thư mục chứa hình ảnh
+            language: Ngôn ngữ của văn bản
+            output_dir: Thư mục để lưu kết quả (tuỳ chọn)
+            workers: Số luồng giải mã; lớn hơn 1 sẽ chạy pipeline giải mã/detection/OCR song song
+            force: Bỏ qua manifest và xử lý lại tất cả hình ảnh
+            
+        Returns:
+            Dictionary chứa kết quả trích xuất cho mỗi hình ảnh
+        """
+        return dict(self.iter_directory(dir_path, language, output_dir, workers, force))
+    
+    def iter_directory(self, dir_path: str, language: str, output_dir: str = None, workers: int = 1,
+                       force: bool = False) -> Iterator[Tuple[str, Dict]]:
+        """
+        Xử lý lần lượt các hình ảnh trong một thư mục, trả về kết quả ngay khi từng trang xong
+        
+        Khi có output_dir, thông tin từng ảnh (kích thước, mtime, hash) và kết
+        quả được lưu trong manifest; lần chạy sau chỉ xử lý ảnh mới hoặc đã thay
+        đổi, các trang còn lại lấy kết quả từ manifest.
+        
+        Args:
+            dir_path: Đường dẫn đến thư mục chứa hình ảnh
+            language: Ngôn ngữ của văn bản
+            output_dir: Thư mục để lưu kết quả (tuỳ chọn)
+            workers: Số luồng giải mã; lớn hơn 1 sẽ chạy pipeline giải mã/detection/OCR song song
+            force: Bỏ qua manifest và xử lý lại tất cả hình ảnh
+            
+        Yields:
+            (tên file, kết quả) theo thứ tự tên file
+        """
+        if not os.path.isdir(dir_path):
+            raise ValueError(f"{dir_path} không phải là thư mục")
+        
+        self._check_language(language)
+        
+        # Tạo thư mục output nếu cần
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        
+        # Lấy danh sách hình ảnh (sắp xếp tự nhiên để thứ tự kết quả luôn cố định)
+        image_files = list_image_files(dir_path)
+        
+        if not image_files:
+            logger.warning("Không tìm thấy hình ảnh nào trong %s", dir_path)
+            return
+        
+        output_paths = {img_file: None for img_file in image_files}
+        if output_dir:
+            for img_file in image_files:
+                base_name = os.path.splitext(img_file)[0]
+                output_paths[img_file] = os.path.join(output_dir, f"{base_name}.txt")
+        
+        # Lấy kết quả của các trang không thay đổi từ manifest
+        cached = {}
+        manifest = None
+        if output_dir:
+            manifest = self._load_manifest(output_dir, language, force)
+            for img_file in image_files:
+                entry = self._check_manifest_entry(manifest, dir_path, img_file)
+                if entry is not None:
+                    cached[img_file] = entry["result"]
+                    if not os.path.exists(output_paths[img_file]):
+                        self._save_results(entry["result"]["blocks"], output_paths[img_file], img_file,
+                                           entry["result"]["transcript"])
+            if cached:
+                logger.info("Bỏ qua %d/%d hình ảnh không thay đổi", len(cached), len(image_files))
+        
+        # Các hình ảnh mới hoặc đã thay đổi được đọc lần lượt khi cần; kết quả trả về
+        # theo thứ tự tên file, xen kẽ với các trang lấy từ manifest
+        pending_files = [img_file for img_file in image_files if img_file not in cached]
+        # stat và hash của đúng dữ liệu đã xử lý, dùng cho manifest mà không đọc lại file
+        stats = {} if manifest is not None else None
+        digests = {} if manifest is not None else None
+        pages = iter_directory_images(dir_path, pending_files, stats)
+        processed = self._process_pages(pages, language, output_paths.get, workers, digests)
+        
+        # File tổng hợp được ghi dần, không giữ toàn bộ transcript trong bộ nhớ
+        all_results = open(os.path.join(output_dir, "all_results.txt"), "w", encoding="utf-8") if output_dir else None
+        try:
+            first = True
+            for img_file in image_files:
+                if img_file in cached:
+                    result = cached.pop(img_file)
+                else:
+                    _, result = next(processed)
+                    if manifest is not None and "error" not in result:
+                        self._update_manifest_entry(manifest, img_file, stats.pop(img_file),
+                                                    digests.pop(img_file), result)
+                
+                if all_results is not None and "error" not in result:
+                    all_results.write(("" if first else "\n\n") + result["transcript"])
+                    all_results.flush()
+                    first = False
+                yield img_file, result
+        finally:
+            processed.close()
+            if all_results is not None:
+                all_results.close()
+            # Lưu manifest kể cả khi bị dừng giữa chừng để lần chạy sau tiếp tục từ đó
+            if manifest is not None:
+                manifest["pages"] = {img_file: manifest["pages"][img_file] for img_file in image_files
+                                     if img_file in manifest["pages"]}
+                self._save_manifest(output_dir, manifest)
+    
+    def _load_manifest(self, output_dir: str, language: str, force: bool = False) -> Dict:
+        """
+        Đọc manifest của thư mục output
+        
+        Manifest của ngôn ngữ hoặc engine khác (hoặc khi force) bị bỏ qua để
+        xử lý lại toàn bộ.
+        """
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "language": language,
+            "engine": self._engine_identity(language),
+            "pages": {}
+        }
+        manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+        if force or not os.path.exists(manifest_path):
+            return manifest
+        
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Không đọc được manifest %s, xử lý lại toàn bộ: %s", manifest_path, e)
+            return manifest
+        
+        if any(stored.get(key) != manifest[key] for key in ("version", "language", "engine")):
+            logger.info("Manifest được tạo với ngôn ngữ hoặc engine khác, xử lý lại toàn bộ")
+            return manifest
+        manifest["pages"] = stored.get("pages", {})
+        return manifest
+    
+    def _check_manifest_entry(self, manifest: Dict, dir_path: str, img_file: str) -> Optional[Dict]:
+        """Trả về mục manifest nếu hình ảnh không thay đổi từ lần chạy trước, ngược lại None"""
+        entry = manifest["pages"].get(img_file)
+        if entry is None:
+            return None
+        
+        img_path = os.path.join(dir_path, img_file)
+        try:
+            stat = os.stat(img_path)
+            if stat.st_size != entry["size"]:
+                return None
+            if stat.st_mtime_ns == entry["mtime_ns"]:
+                return entry
+            
+            # Cùng kích thước nhưng mtime khác (copy, touch): so sánh nội dung
+            with open(img_path, "rb") as f:
+                if hash_bytes(f.read()) != entry["hash"]:
+                    return None
+        except OSError:
+            # File đã bị xoá hoặc không đọc được: xử lý lại để trang được ghi nhận là lỗi
+            return None
+        entry["mtime_ns"] = stat.st_mtime_ns
+        return entry
+    
+    def _update_manifest_entry(self, manifest: Dict, img_file: str, stat: os.stat_result, digest: str,
+                               result: Dict) -> None:
+        """
+        Ghi thông tin và kết quả của hình ảnh vừa xử lý vào manifest
+        
+        Args:
+            manifest: Manifest đang cập nhật
+            img_file: Tên file trong thư mục
+            stat: stat của file tại lúc đọc dữ liệu đã xử lý
+            digest: hash_bytes của dữ liệu đã xử lý
+            result: Kết quả của trang
+        """
+        manifest["pages"][img_file] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "hash": digest,
+            "result": {key: result[key] for key in ("blocks", "transcript", "filename")}
+        }
+    
+    def _save_manifest(self, output_dir: str, manifest: Dict) -> None:
+        """Ghi manifest (qua file tạm để không hỏng khi bị ngắt giữa chừng)"""
+        manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+        temp_path = f"{manifest_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(temp_path, manifest_path)
+    
+    def process_archive(self, archive, language: str, output_dir: str = None, workers: int = 1) -> Dict:
+        """
+        Xử lý tất cả hình ảnh trong file nén (.cbz, .zip, .tar) mà không giải nén ra đĩa (gom kết quả của iter_archive)
+        
+        Args:
+            archive: Đường dẫn hoặc file object (seek được) của file nén
+            language: Ngôn ngữ của văn bản
+            output_dir: Thư mục để lưu kết quả (tuỳ chọn)
+            workers: Số luồng giải mã; lớn hơn 1 sẽ chạy pipeline giải mã/detection/OCR song song
+            
+        Returns:
+            Dictionary chứa kết quả trích xuất cho mỗi hình ảnh trong file nén
+        """
+        results = dict(self.iter_archive(archive, language, output_dir, workers))
+        if not results:
+            logger.warning("Không tìm thấy hình ảnh nào trong file nén")
+        return results
+    
+    def iter_archive(self, archive, language: str, output_dir: str = None,
+                     workers: int = 1) -> Iterator[Tuple[str, Dict]]:
+        """
+        Xử lý lần lượt các hình ảnh trong file nén, trả về kết quả ngay khi từng trang xong
+        
+        Các hình ảnh được đọc lần lượt từ file nén theo thứ tự tự nhiên của tên
+        nên bộ nhớ không phụ thuộc vào kích thước file nén.
+        
+        Args:
+            archive: Đường dẫn hoặc file object (seek được) của file nén
+            language: Ngôn ngữ của văn bản
+            output_dir: Thư mục để lưu kết quả (tuỳ chọn)
+            workers: Số luồng giải mã; lớn hơn 1 sẽ chạy pipeline giải mã/detection/OCR song song
+            
+        Yields:
+            (tên trong file nén, kết quả) theo thứ tự tự nhiên của tên
+        """
+        self._check_language(language)
+        
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        
+        output_paths = {}
+        used_paths = set()
+        
+        def output_path_for(name):
+            if not output_dir:
+                return None
+            if name not in output_paths:
+                # Làm phẳng đường dẫn bên trong file nén để không ghi ra ngoài output_dir;
+                # thêm hậu tố khi hai tên trùng nhau sau khi làm phẳng (a/1.png và a_1.png)
+                base = os.path.splitext(name)[0].replace('/', '_')
+                path = os.path.join(output_dir, f"{base}.txt")
+                suffix = 1
+                while path in used_paths:
+                    suffix += 1
+                    path = os.path.join(output_dir, f"{base}_{suffix}.txt")
+                used_paths.add(path)
+                output_paths[name] = path
+            return output_paths[name]
+        
+        all_results = open(os.path.join(output_dir, "all_results.txt"), "w", encoding="utf-8") if output_dir else None
+        processed = self._process_pages(iter_archive_images(archive), language, output_path_for, workers)
+        try:
+            first = True
+            for name, result in processed:
+                if all_results is not None and "error" not in result:
+                    all_results.write(("" if first else "\n\n") + result["transcript"])
+                    all_results.flush()
+                    first = False
+                yield name, result
+        finally:
+            # Dừng pipeline ngay cả khi người gọi bỏ dở giữa chừng
+            processed.close()
+            if all_results is not None:
+                all_results.close()
+    
+    def _process_pages(self, pages: Iterable[Tuple[str, bytes]], language: str,
+                       output_path_for: Callable[[str], Optional[str]], workers: int = 1,
+                       digests: Dict[str, str] = None) -> Iterator[Tuple[str, Dict]]:
+        """
+        Xử lý lần lượt các trang (tên, dữ liệu hình ảnh) từ một generator
+        
+        Args:
+            pages: Các cặp (tên, dữ liệu hình ảnh dạng byte), được đọc khi cần
+            language: Ngôn ngữ của văn bản
+            output_path_for: Hàm trả về đường dẫn file .txt cho từng trang (None nếu không lưu)
+            workers: Số luồng giải mã; lớn hơn 1 sẽ chạy pipeline song song
+            digests: Nếu có, nhận hash_bytes của dữ liệu từng trang (theo tên) trước khi trả kết quả
+            
+        Yields:
+            (tên, kết quả) theo đúng thứ tự đầu vào
+        """
+        if workers and workers > 1:
+            yield from self._process_pages_pipeline(pages, language, output_path_for, workers, digests)
+            return
+        
+        for name, image_data in pages:
+            logger.info("Đang xử lý %s...", name)
+            try:
+                if isinstance(image_data, OSError):
+                    raise image_data
+                digest = None
+                if digests is not None:
+                    digest = digests[name] = hash_bytes(image_data)
+                yield name, self.process_bytes(image_data, language, name, output_path_for(name), digest)
+            except Exception as e:
+                logger.error("Lỗi khi xử lý %s: %s", name, e)
+                yield name, {"error": str(e)}
+    
+    def _process_pages_pipeline(self, pages: Iterable[Tuple[str, bytes]], language: str,
+                                output_path_for: Callable[[str], Optional[str]], workers: int,
+                                digests: Dict[str, str] = None) -> Iterator[Tuple[str, Dict]]:
+        """
+        Xử lý các trang theo pipeline: giải mã (thread pool) -> detection -> OCR
+        
+        Các stage nối với nhau bằng queue có giới hạn nên số ảnh đã đọc hoặc giải
+        mã nằm trong bộ nhớ không vượt quá khoảng 4 * workers. Kết quả trả về theo
+        đúng thứ tự của pages. Khi generator bị đóng sớm (client ngắt kết nối,
+        Ctrl-C), các stage dừng lại và đóng pages.
+        
+        Args:
+            pages: Các cặp (tên, dữ liệu hình ảnh dạng byte)
+            language: Ngôn ngữ của văn bản
+            output_path_for: Hàm trả về đường dẫn file .txt cho từng trang
+            workers: Số luồng giải mã
+            digests: Nếu có, nhận hash_bytes của dữ liệu từng trang (theo tên)
+            
+        Yields:
+            (tên, kết quả) theo thứ tự của pages
+        """
+        logger.info("Xử lý hình ảnh với %d workers", workers)
+        decode_queue = queue.Queue(maxsize=workers * 2)
+        ocr_queue = queue.Queue(maxsize=workers * 2)
+        failures = []
+        stop = threading.Event()
+        
+        def put(target, item) -> bool:
+            # put có timeout để luồng không bị kẹt mãi khi phía nhận đã dừng
+            while not stop.is_set():
+                try:
+                    target.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        
+        def decode(name, image_data):
+            # Trả về (ảnh, khoá cache, kết quả cache) cho stage detection
+            if isinstance(image_data, OSError):
+                raise image_data
+            digest = None
+            if digests is not None:
+                digest = digests[name] = hash_bytes(image_data)
+            cache_key = None
+            if self.result_cache is not None:
+                cache_key = self._result_cache_key(digest or hash_bytes(image_data), language)
+                cached = self._get_cached_result(cache_key, name, output_path_for(name))
+                if cached is not None:
+                    return None, cache_key, cached
+            with self._timed("decode", language):
+                image = decode_image(image_data)
+            self._check_image_size(image)
+            return image, cache_key, None
+        
+        def decode_stage():
+            # Đọc trang từ generator, giải mã song song nhưng đưa vào queue theo thứ tự
+            pending = deque()
+            try:
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    for name, image_data in pages:
+                        if stop.is_set():
+                            break
+                        pending.append((name, pool.submit(decode, name, image_data)))
+                        if len(pending) >= workers and not put(decode_queue, pending.popleft()):
+                            break
+                    while pending and not stop.is_set():
+                        put(decode_queue, pending.popleft())
+                    # Bị dừng: huỷ các ảnh chưa giải mã
+                    for _, future in pending:
+                        future.cancel()
+            except Exception as e:
+                # Lỗi khi đọc đầu vào (ví dụ file nén hỏng) được báo lại cho luồng gọi
+                failures.append(e)
+            finally:
+                pending.clear()
+                # Đóng generator đầu vào (file nén, file đang mở) trên chính luồng đang đọc nó
+                if hasattr(pages, "close"):
+                    pages.close()
+                put(decode_queue, None)
+        
+        def detect_stage():
+            try:
+                while not stop.is_set():
+                    try:
+                        item = decode_queue.get(timeout=0.1)
+                    except queue.Empty:
+                        continue
+                    if item is None:
+                        break
+                    name, future = item
+                    logger.info("Đang xử lý %s...", name)
+                    try:
+                        image, cache_key, cached = future.result()
+                        if cached is not None:
+                            put(ocr_queue, (name, None, None, None, cached))
+                            continue
+                        text_blocks = self._detect_sorted_blocks(image, language)
+                        put(ocr_queue, (name, image, text_blocks, cache_key, None))
+                    except Exception as e:
+                        logger.error("Lỗi khi xử lý %s: %s", name, e)
+                        put(ocr_queue, (name, None, None, None, {"error": str(e)}))
+            finally:
+                put(ocr_queue, None)
+        
+        threads = [
+            threading.Thread(target=decode_stage, name="ocr-decode", daemon=True),
+            threading.Thread(target=detect_stage, name="ocr-detect", daemon=True)
+        ]
+        for thread in threads:
+            thread.start()
+        
+        # Stage OCR và ghi kết quả chạy trên luồng hiện tại
+        try:
+            while True:
+                item = ocr_queue.get()
+                if item is None:
+                    break
+                name, image, text_blocks, cache_key, result = item
+                if result is None:
+                    try:
+                        if text_blocks:
+                            text_blocks = self._recognize_blocks(image, text_blocks, language)
+                        with self._timed("serialize", language):
+                            result = self._build_result(text_blocks, name, output_path_for(name), cache_key)
+                    except Exception as e:
+                        logger.error("Lỗi khi xử lý %s: %s", name, e)
+                        result = {"error": str(e)}
+                yield name, result
+        finally:
+            # Dừng các stage (kể cả khi generator bị đóng sớm) và bỏ các ảnh còn trong queue
+            stop.set()
+            for pending_queue in (decode_queue, ocr_queue):
+                while True:
+                    try:
+                        pending_queue.get_nowait()
+                    except queue.Empty:
+                        break
+            for thread in threads:
+                thread.join()
+        
+        if failures:
+            raise failures[0]
+    
+    def _save_results(self, results: List[Dict], output_path: str, image_path: str, transcript: str = None) -> None:
+        """
+        Lưu kết quả trích xuất vào file
+        
+        Args:
+            results: Danh sách các block văn bản đã trích xuất
+            output_path: Đường dẫn file để lưu kết quả
+            image_path: Đường dẫn hình ảnh gốc
+            transcript: Transcript đã định dạng (nếu có)
+        """
+        # Tạo thư mục chứa output_path nếu nó không tồn tại
+        output_dir = os.path.dirname(output_path)
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        
+        with open(output_path, "w", encoding="utf-8") as f:
+            if transcript:
+                f.write(transcript)
+            else:
+                f.write(f"Extraction Results for {os.path.basename(image_path)}\n")
+                f.write("=" * 50 + "\n\n")
+                
+                if not results:
+                    f.write("No text detected\n")
+                else:
+                    for block in results:
+                        f.write(f"Block {block['id']}:\n")
+                        f.write(f"Text: {block['text']}\n")
+                        f.write(f"Position: {block['bbox']}\n")
+                        if block['confidence'] is not None:
+                            f.write(f"Confidence: {block['confidence']:.2f}\n")
+                        f.write("\n")
+
+    def process_image_data(self, image_data: bytes, language: str, filename: str = "image.jpg",
+                           regions: List[List[int]] = None, reading_order: str = "given") -> Dict:
+        """
+        Xử lý hình ảnh từ dữ liệu nhị phân
+        
+        Args:
+            image_data: Dữ liệu hình ảnh dạng byte
+            language: Ngôn ngữ của văn bản
+            filename: Tên file gốc (dùng cho transcript)
+            regions: Các bbox do client cung cấp; khi có sẽ bỏ qua detection
+            reading_order: Thứ tự đọc của regions ("given", "ltr", "rtl")
+            
+        Returns:
+            Dictionary chứa kết quả trích xuất
+        """
+        try:
+            # Kiểm tra dữ liệu đầu vào
+            if not image_data:
+                raise ValueError("Dữ liệu hình ảnh trống")
+            
+            # Giải mã trực tiếp từ buffer của request, không qua file tạm
+            logger.debug("Bắt đầu quá trình trích xuất với ngôn ngữ: %s, kích thước: %d bytes", language, len(image_data))
+            if regions is not None:
+                result = self.process_regions(image_data, regions, language, filename, reading_order)
+            else:
+                result = self.process_bytes(image_data, language, filename)
+            
+            # Lưu transcript vào file để có thể download
+            self._store_transcript(result)
+            file_id = result["file_id"]
+            
+            logger.debug("Hoàn thành trích xuất, file_id: %s", file_id)
+            return result
+        except Exception as e:
+            logger.debug("Lỗi trong process_image_data: %s", e)
+            raise
+
+    def process_batch_data(self, images: Iterable[Tuple[str, bytes]], language: str,
+                           batch_size: int = DEFAULT_BATCH_SIZE) -> Dict:
+        """
+        Xử lý nhiều hình ảnh từ dữ liệu nhị phân và lưu transcript để download
+        
+        Args:
+            images: Danh sách hoặc generator (filename, dữ liệu hình ảnh dạng byte);
+                generator được đọc từng batch một
+            language: Ngôn ngữ của văn bản
+            batch_size: Số hình ảnh tối đa trong một nhóm detection
+            
+        Returns:
+            Dictionary gồm kết quả từng ảnh và transcript tổng hợp
+        """
+        logger.debug("Bắt đầu trích xuất batch với ngôn ngữ: %s", language)
+        results = list(self.iter_batch_data(images, language, batch_size))
+        if not results:
+            raise ValueError("Không có hình ảnh nào trong batch")
+        
+        # Transcript tổng hợp giống all_results.txt của process_directory
+        combined = {"transcript": "\n\n".join(r["transcript"] for r in results if "error" not in r)}
+        self._store_transcript(combined)
+        
+        logger.debug("Hoàn thành trích xuất batch, file_id: %s", combined['file_id'])
+        return {
+            "results": results,
+            "transcript": combined["transcript"],
+            "result_file": combined["result_file"],
+            "file_id": combined["file_id"]
+        }
+    
+    def iter_batch_data(self, images: Iterable[Tuple[str, bytes]], language: str,
+                        batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[Dict]:
+        """
+        Xử lý từng batch hình ảnh, trả về kết quả từng ảnh (đã lưu transcript) ngay khi batch chứa nó xong
+        
+        Args:
+            images: Danh sách hoặc generator (filename, dữ liệu hình ảnh dạng byte)
+            language: Ngôn ngữ của văn bản
+            batch_size: Số hình ảnh tối đa trong một nhóm detection
+            
+        Yields:
+            Kết quả từng ảnh theo đúng thứ tự đầu vào
+        """
+        pages = iter(images)
+        while True:
+            chunk = list(itertools.islice(pages, max(1, batch_size)))
+            if not chunk:
+                break
+            for result in self.process_batch(chunk, language, batch_size):
+                if "error" not in result:
+                    self._store_transcript(result)
+                yield result
+    
+    def _store_transcript(self, result: Dict) -> None:
+        """Lưu transcript vào kho kết quả và gắn file_id/result_file vào kết quả"""
+        file_id, txt_path = self.result_store.put(result["transcript"])
+        logger.debug("Lưu kết quả trích xuất với file_id: %s", file_id)
+        
+        # Thêm file_id và đường dẫn file kết quả (None nếu chỉ lưu trong bộ nhớ) vào kết quả
+        result["result_file"] = txt_path
+        result["file_id"] = file_id
+
+def compute_tiles(height: int, width: int) -> Optional[List[Tuple[int, int, int, int]]]:
+    """
+    Tính các tile chồng lấn cho ảnh quá dài hoặc quá lớn
+    
+    Args:
+        height: Chiều cao ảnh
+        width: Chiều rộng ảnh
+        
+    Returns:
+        Danh sách tile (x1, y1, x2, y2), hoặc None nếu không cần chia tile
+    """
+    if height <= TILE_ASPECT * width and max(height, width) <= TILE_MAX_SIDE:
+        return None
+    
+    # Tile có tỉ lệ gần với một trang truyện bình thường
+    tile_width = min(width, TILE_MAX_SIDE)
+    tile_height = min(height, TILE_MAX_SIDE, int(tile_width * 1.5))
+    
+    def starts(length, tile_length):
+        if length <= tile_length:
+            return [0]
+        step = max(1, int(tile_length * (1 - TILE_OVERLAP)))
+        positions = list(range(0, length - tile_length, step))
+        positions.append(length - tile_length)
+        return positions
+    
+    return [
+        (x, y, x + tile_width, y + tile_height)
+        for y in starts(height, tile_height)
+        for x in starts(width, tile_width)
+    ]
+
+def offset_block(block: TextBlock, dx: int, dy: int) -> None:
+    """Dịch toạ độ của TextBlock từ toạ độ tile về toạ độ ảnh gốc"""
+    offset = np.array([dx, dy, dx, dy])
+    block.xyxy = np.asarray(block.xyxy) + offset
+    if getattr(block, "bubble_xyxy", None) is not None:
+        block.bubble_xyxy = np.asarray(block.bubble_xyxy) + offset
+    if getattr(block, "inpaint_bboxes", None) is not None and len(block.inpaint_bboxes):
+        block.inpaint_bboxes = np.asarray(block.inpaint_bboxes).reshape(-1, 4) + offset
+    if getattr(block, "lines", None):
+        block.lines = [np.asarray(line) + np.array([dx, dy]) for line in block.lines]
+
+def _intersection(a: np.ndarray, b: np.ndarray) -> Tuple[float, np.ndarray]:
+    """Diện tích và hình chữ nhật giao của hai box xyxy"""
+    box = np.array([max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3])], dtype=np.float64)
+    return max(box[2] - box[0], 0) * max(box[3] - box[1], 0), box
+
+def crop_region(image: np.ndarray, block: TextBlock) -> Tuple[int, int, int, int]:
+    """
+    Vùng ảnh cần giữ cho block khi OCR trên ảnh ghép
+    
+    Gồm xyxy và bubble_xyxy (nếu có), mở rộng thêm một khoảng đệm để engine mở
+    rộng crop vẫn đọc được ảnh gốc, giới hạn trong hình ảnh.
+    """
+    height, width = image.shape[:2]
+    box = np.asarray(block.xyxy, dtype=np.int64).reshape(4)
+    bubble = getattr(block, "bubble_xyxy", None)
+    if bubble is not None:
+        bubble = np.asarray(bubble, dtype=np.int64).reshape(4)
+        box = np.array([min(box[0], bubble[0]), min(box[1], bubble[1]), max(box[2], bubble[2]), max(box[3], bubble[3])])
+    margin = max(MOSAIC_MARGIN, int(0.1 * max(box[2] - box[0], box[3] - box[1])))
+    x1, y1 = max(int(box[0]) - margin, 0), max(int(box[1]) - margin, 0)
+    x2, y2 = min(int(box[2]) + margin, width), min(int(box[3]) + margin, height)
+    return x1, y1, max(x2, x1 + 1), max(y2, y1 + 1)
+
+def build_crop_mosaic(regions: List[Tuple[np.ndarray, Tuple[int, int, int, int]]],
+                      max_width: int) -> Tuple[np.ndarray, List[Tuple[int, int]]]:
+    """
+    Ghép các vùng ảnh thành một ảnh nền trắng, xếp từ trái sang phải theo từng hàng
+    
+    Các vùng cách nhau MOSAIC_MARGIN pixel để phần mở rộng crop của engine
+    không đọc sang vùng bên cạnh.
+    
+    Args:
+        regions: Danh sách (hình ảnh, vùng x1, y1, x2, y2)
+        max_width: Chiều rộng tối đa của một hàng
+        
+    Returns:
+        (ảnh ghép, vị trí (x, y) góc trên trái của từng vùng trong ảnh ghép)
+    """
+    gap = MOSAIC_MARGIN
+    positions = []
+    x = y = row_height = width = 0
+    for _, (x1, y1, x2, y2) in regions:
+        w, h = x2 - x1, y2 - y1
+        if x > 0 and x + w > max_width:
+            x, y, row_height = 0, y + row_height + gap, 0
+        positions.append((x, y))
+        width = max(width, x + w)
+        row_height = max(row_height, h)
+        x += w + gap
+    
+    mosaic = np.full((y + row_height, width, 3), 255, dtype=np.uint8)
+    for (image, (x1, y1, x2, y2)), (x, y) in zip(regions, positions):
+        crop = image[y1:y2, x1:x2]
+        if crop.ndim == 2:
+            crop = cv2.cvtColor(crop, cv2.COLOR_GRAY2BGR)
+        mosaic[y:y + crop.shape[0], x:x + crop.shape[1]] = crop[:, :, :3]
+    return mosaic, positions
+
+def dedupe_blocks(blocks: List[TextBlock], tile_indices: List[int], tiles: List[Tuple[int, int, int, int]],
+                  threshold: float = 0.6) -> List[TextBlock]:
+    """
+    Loại các block trùng nhau ở vùng chồng lấn giữa các tile
+    
+    Chỉ so sánh hai block của hai tile khác nhau khi cả hai cùng nằm (một phần)
+    trong vùng chồng lấn của hai tile đó; block lồng nhau hoặc chồng lên nhau
+    trong cùng tile, hay ở xa mép tile, được giữ nguyên. Hai block được coi là
+    trùng khi phần giao chiếm ít nhất threshold diện tích block nhỏ hơn; khi đó
+    giữ lại block lớn hơn (thường là block không bị cắt ở mép tile).
+    
+    Args:
+        blocks: Các block đã dịch về toạ độ ảnh gốc
+        tile_indices: Chỉ số tile của từng block
+        tiles: Danh sách tile (x1, y1, x2, y2)
+        threshold: Tỉ lệ diện tích giao để coi là trùng
+    """
+    if len(blocks) < 2:
+        return blocks
+    
+    boxes = np.array([np.asarray(block.xyxy, dtype=np.float64).reshape(4) for block in blocks])
+    tile_boxes = np.asarray(tiles, dtype=np.float64).reshape(-1, 4)
+    areas = np.maximum(boxes[:, 2] - boxes[:, 0], 0) * np.maximum(boxes[:, 3] - boxes[:, 1], 0)
+    order = np.argsort(-areas, kind="stable")
+    
+    kept = []
+    for i in order:
+        duplicate = False
+        for k in kept:
+            if tile_indices[k] == tile_indices[i]:
+                continue
+            overlap_area, overlap = _intersection(tile_boxes[tile_indices[k]], tile_boxes[tile_indices[i]])
+            if overlap_area <= 0:
+                continue
+            if _intersection(boxes[i], overlap)[0] <= 0 or _intersection(boxes[k], overlap)[0] <= 0:
+                continue
+            if _intersection(boxes[i], boxes[k])[0] >= threshold * max(min(areas[i], areas[k]), 1):
+                duplicate = True
+                break
+        if not duplicate:
+            kept.append(i)
+    
+    return [blocks[i] for i in sorted(kept)]
+
+def natural_sort_key(name: str) -> List:
+    """Khoá sắp xếp tự nhiên: page2 đứng trước page10"""
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", name)]
+
+def is_image_file(name: str) -> bool:
+    return name.lower().endswith(IMAGE_EXTENSIONS)
+
+def is_archive_file(name: str) -> bool:
+    return name.lower().endswith(ARCHIVE_EXTENSIONS)
+
+def list_image_files(dir_path: str) -> List[str]:
+    """Danh sách tên file hình ảnh trong thư mục, sắp xếp tự nhiên"""
+    return sorted((f for f in os.listdir(dir_path) if is_image_file(f)), key=natural_sort_key)
+
+def iter_directory_images(dir_path: str, image_files: List[str] = None,
+                          stats: Dict[str, os.stat_result] = None) -> Iterator[Tuple[str, bytes]]:
+    """
+    Đọc lần lượt các hình ảnh trong thư mục
+    
+    Args:
+        dir_path: Thư mục chứa hình ảnh
+        image_files: Tên các file cần đọc (mặc định tất cả hình ảnh, sắp xếp tự nhiên)
+        stats: Nếu có, nhận stat của từng file tại lúc đọc (theo tên)
+        
+    Yields:
+        (tên file, dữ liệu hình ảnh dạng byte), hoặc (tên file, OSError) nếu file
+        không đọc được (đã bị xoá, không có quyền) để trang đó được ghi nhận là lỗi
+    """
+    for img_file in image_files if image_files is not None else list_image_files(dir_path):
+        try:
+            with open(os.path.join(dir_path, img_file), "rb") as f:
+                if stats is not None:
+                    stats[img_file] = os.fstat(f.fileno())
+                image_data = f.read()
+        except OSError as e:
+            image_data = e
+        yield img_file, image_data
+
+def iter_archive_images(archive, max_images: int = MAX_ARCHIVE_IMAGES,
+                        max_member_bytes: int = MAX_ARCHIVE_MEMBER_MB * 1024 * 1024) -> Iterator[Tuple[str, bytes]]:
+    """
+    Đọc lần lượt các hình ảnh trong file nén zip/cbz hoặc tar (có thể nén gzip, bz2, xz)
+    
+    Chỉ đọc mục lục của file nén trước; dữ liệu từng hình ảnh được đọc khi
+    cần, theo thứ tự tự nhiên của tên, không giải nén ra đĩa.
+    
+    Args:
+        archive: Đường dẫn hoặc file object (seek được) của file nén
+        max_images: Số hình ảnh tối đa trong file nén
+        max_member_bytes: Kích thước tối đa của mỗi hình ảnh sau khi giải nén
+        
+    Yields:
+        (tên trong file nén, dữ liệu hình ảnh dạng byte)
+    """
+    def check_members(members):
+        if len(members) > max_images:
+            raise ValueError(f"File nén có quá nhiều hình ảnh, tối đa {max_images} hình ảnh")
+        for name, size in members:
+            if size > max_member_bytes:
+                raise ValueError(f"Hình ảnh {name} trong file nén quá lớn ({size} bytes)")
+    
+    is_path = isinstance(archive, (str, os.PathLike))
+    if zipfile.is_zipfile(archive):
+        with zipfile.ZipFile(archive) as zf:
+            members = sorted((info for info in zf.infolist() if not info.is_dir() and is_image_file(info.filename)),
+                             key=lambda info: natural_sort_key(info.filename))
+            check_members([(info.filename, info.file_size) for info in members])
+            for info in members:
+                yield info.filename, zf.read(info)
+        return
+    
+    if not is_path:
+        archive.seek(0)
+    try:
+        tf = tarfile.open(archive, "r:*") if is_path else tarfile.open(fileobj=archive, mode="r:*")
+    except tarfile.TarError:
+        raise ValueError("File nén không hợp lệ hoặc không được hỗ trợ (hỗ trợ .cbz, .zip, .tar)")
+    
+    with tf:
+        members = sorted((member for member in tf.getmembers() if member.isfile() and is_image_file(member.name)),
+                         key=lambda member: natural_sort_key(member.name))
+        check_members([(member.name, member.size) for member in members])
+        for member in members:
+            with tf.extractfile(member) as f:
+                yield member.name, f.read()
+
+def configure_torch_threads(num_threads: int) -> None:
+    """Đặt số luồng intra-op của torch cho process hiện tại"""
+    if num_threads > 0 and torch.get_num_threads() != num_threads:
+        torch.set_num_threads(num_threads)
+        logger.info("Số luồng torch: %d", num_threads)
+
+def make_synthetic_page(seed: int, width: int = 800, height: int = 1200) -> np.ndarray:
+    """
+    Tạo trang truyện tổng hợp (khung tranh, bong bóng thoại có chữ) để benchmark offline
+    
+    Args:
+        seed: Seed ngẫu nhiên, cùng seed cho cùng một trang
+        width: Chiều rộng trang
+        height: Chiều cao trang
+        
+    Returns:
+        Hình ảnh BGR
+    """
+    rng = np.random.default_rng(seed)
+    words = ["HELLO", "WAIT", "WHAT", "NO WAY", "RUN", "OKAY", "WHY", "LOOK", "STOP", "THANKS"]
+    page = np.full((height, width, 3), 255, dtype=np.uint8)
+    
+    # Khung tranh
+    rows = int(rng.integers(2, 5))
+    panel_height = height // rows
+    for row in range(rows):
+        cv2.rectangle(page, (10, row * panel_height + 10), (width - 10, (row + 1) * panel_height - 10), (0, 0, 0), 3)
+        
+        # Bong bóng thoại với một đến ba dòng chữ
+        for _ in range(int(rng.integers(1, 3))):
+            lines = [str(rng.choice(words)) for _ in range(int(rng.integers(1, 4)))]
+            bubble_w = max(len(line) for line in lines) * 18 + 40
+            bubble_h = len(lines) * 30 + 30
+            cx = int(rng.integers(bubble_w // 2 + 20, max(bubble_w // 2 + 21, width - bubble_w // 2 - 20)))
+            cy = int(rng.integers(row * panel_height + bubble_h // 2 + 20,
+                                  max(row * panel_height + bubble_h // 2 + 21, (row + 1) * panel_height - bubble_h // 2 - 20)))
+            cv2.ellipse(page, (cx, cy), (bubble_w // 2, bubble_h // 2), 0, 0, 360, (255, 255, 255), -1)
+            cv2.ellipse(page, (cx, cy), (bubble_w // 2, bubble_h // 2), 0, 0, 360, (0, 0, 0), 2)
+            for i, line in enumerate(lines):
+                y = cy - (len(lines) * 30) // 2 + 22 + i * 30
+                cv2.putText(page, line, (cx - len(line) * 9, y), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0), 2)
+    return page
+
+class RssSampler:
+    """
+    Đo RSS lớn nhất trong một đoạn code bằng cách lấy mẫu RSS hiện tại định kỳ
+    
+    ru_maxrss chỉ tăng trong suốt đời process nên không tách được từng lần chạy;
+    sampler ghi RSS lúc bắt đầu và đỉnh RSS trong khoảng with, dùng làm context manager.
+    """
+    
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.baseline = 0
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def _sample(self) -> None:
+        self.peak = max(self.peak, get_rss_bytes())
+    
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+    
+    def __enter__(self) -> "RssSampler":
+        self.baseline = self.peak = get_rss_bytes()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="ocr-rss-sampler", daemon=True)
+        self._thread.start()
+        return self
+    
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+    
+    def stats(self) -> Dict:
+        """RSS lớn nhất và mức tăng so với lúc bắt đầu (None nếu không đọc được RSS)"""
+        if not self.baseline:
+            return {"peak_rss_bytes": None, "rss_delta_bytes": None}
+        return {"peak_rss_bytes": self.peak, "rss_delta_bytes": self.peak - self.baseline}
+
+def _latency_summary(samples: List[float]) -> Dict:
+    """Tóm tắt độ trễ (ms) theo p50/p95/p99"""
+    if not samples:
+        return {"count": 0}
+    values = np.array(samples) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "count": len(samples),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3)
+    }
+
+def run_benchmark(input_dir: str = None, languages: List[str] = None, workers_options: List[int] = None,
+                  batch_sizes: List[int] = None, pages: int = 20, use_gpu: bool = False,
+                  backend: str = INFERENCE_BACKEND, engine_backends: Dict[str, str] = None) -> Dict:
+    """
+    Chạy benchmark pipeline OCR và trả về kết quả dạng dictionary (JSON được)
+    
+    Mỗi cấu hình (ngôn ngữ, số workers hoặc batch size) chạy toàn bộ corpus với
+    cache tắt, sau khi đã warm-up engine, và báo cáo độ trễ từng stage, số
+    trang/giây, số block/giây, RSS lớn nhất và mức tăng RSS của riêng lần chạy đó.
+    
+    Args:
+        input_dir: Thư mục ảnh làm corpus; None để dùng trang tổng hợp
+        languages: Các ngôn ngữ cần đo
+        workers_options: Các giá trị workers cho process_directory
+        batch_sizes: Các batch size cho process_batch (giá trị 1 bỏ qua)
+        pages: Số trang tổng hợp khi không có input_dir
+        use_gpu: Sử dụng GPU nếu có
+        backend: Backend suy luận mặc định
+        engine_backends: Backend riêng theo engine
+        
+    Returns:
+        Dictionary kết quả benchmark
+    """
+    import tempfile
+    import platform
+    
+    languages = languages or ["English"]
+    workers_options = workers_options or [1]
+    batch_sizes = batch_sizes or []
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Corpus cố định: thư mục đầu vào hoặc các trang tổng hợp ghi ra thư mục tạm
+        if input_dir:
+            corpus_dir = input_dir
+        else:
+            corpus_dir = temp_dir
+            for i in range(pages):
+                cv2.imwrite(os.path.join(corpus_dir, f"page_{i:04d}.png"), make_synthetic_page(i))
+        
+        image_files = list_image_files(corpus_dir)
+        corpus = []
+        for img_file in image_files:
+            with open(os.path.join(corpus_dir, img_file), "rb") as f:
+                corpus.append((img_file, f.read()))
+        
+        report = {
+            "corpus": {
+                "source": input_dir or "synthetic",
+                "pages": len(corpus),
+                "bytes": sum(len(data) for _, data in corpus)
+            },
+            "system": {
+                "python": platform.python_version(),
+                "torch": torch.__version__,
+                "torch_threads": torch.get_num_threads(),
+                "cpu_count": os.cpu_count()
+            },
+            "runs": []
+        }
+        
+        for language in languages:
+            extractor = OCRExtractor(use_gpu=use_gpu, cache_size_mb=0, detection_cache_size=0,
+                                     backend=backend, engine_backends=engine_backends)
+            report["system"]["device"] = extractor.device
+            warmup = extractor.warm_up([language])
+            
+            samples = {}
+            samples_lock = threading.Lock()
+            
+            def collect(stage, seconds, labels):
+                with samples_lock:
+                    samples.setdefault(stage, []).append(seconds)
+            extractor.stage_observers.append(collect)
+            
+            settings = [("directory", workers, 1) for workers in workers_options]
+            settings += [("batch", 1, batch_size) for batch_size in batch_sizes if batch_size > 1]
+            
+            for mode, workers, batch_size in settings:
+                samples.clear()
+                if extractor.crop_cache is not None:
+                    extractor.crop_cache.clear()
+                logger.info("Benchmark %s: mode=%s, workers=%d, batch_size=%d", language, mode, workers, batch_size)
+                
+                gc.collect()
+                with RssSampler() as rss:
+                    start = time.perf_counter()
+                    if mode == "directory":
+                        results = list(extractor.process_directory(corpus_dir, language, workers=workers).values())
+                    else:
+                        results = extractor.process_batch(corpus, language, batch_size)
+                    wall = time.perf_counter() - start
+                
+                errors = sum(1 for result in results if "error" in result)
+                blocks = sum(len(result.get("blocks", [])) for result in results)
+                report["runs"].append({
+                    "language": language,
+                    "engine": extractor._engine_spec(language)[0].__name__,
+                    "detector": DETECTOR_NAME,
+                    "detector_backend": extractor._backend_for("detector"),
+                    "backend": extractor._backend_for(extractor._engine_spec(language)[0].__name__),
+                    "mode": mode,
+                    "workers": workers,
+                    "batch_size": batch_size,
+                    "pages": len(results),
+                    "errors": errors,
+                    "blocks": blocks,
+                    "wall_seconds": round(wall, 4),
+                    "pages_per_sec": round(len(results) / wall, 3) if wall > 0 else None,
+                    "blocks_per_sec": round(blocks / wall, 3) if wall > 0 else None,
+                    "warmup_seconds": {key: round(value, 4) for key, value in warmup.items()},
+                    "stages": {stage: _latency_summary(values) for stage, values in samples.items()},
+                    "crop_cache": extractor.crop_cache.stats() if extractor.crop_cache is not None else None,
+                    **rss.stats()
+                })
+    
+    return report
+
+def compare_backends(pages: List[Tuple[str, bytes]], language: str, backends: List[str],
+                     use_gpu: bool = False) -> Dict:
+    """
+    So sánh độ chính xác và độ trễ giữa các backend suy luận
+    
+    Mỗi backend (áp dụng cho cả detector và OCR engine) xử lý cùng một tập
+    trang với cache tắt, sau khi warm-up. Backend đầu tiên là chuẩn để so sánh
+    transcript của các backend còn lại.
+    
+    Args:
+        pages: Danh sách (tên, dữ liệu hình ảnh dạng byte)
+        language: Ngôn ngữ của văn bản
+        backends: Các backend cần so sánh, ví dụ ["torch", "int8"]
+        use_gpu: Sử dụng GPU nếu có
+        
+    Returns:
+        Dictionary kết quả so sánh
+    """
+    import difflib
+    
+    runs = {}
+    for backend in backends:
+        extractor = OCRExtractor(use_gpu=use_gpu, cache_size_mb=0, detection_cache_size=0, crop_cache_size=0,
+                                 backend=backend, engine_backends={})
+        extractor.warm_up([language])
         
-        # Lưu kết quả vào file nếu có output_path
-        if output_path:
+        transcripts, blocks, latencies = [], [], []
+        for name, image_data in pages:
+            start = time.perf_counter()
             try:
-                self._save_results(results, output_path, image_path, transcript)
-                print(f"Đã lưu kết quả vào {output_path}")
+                result = extractor.process_bytes(image_data, language, name)
             except Exception as e:
-                print(f"Lỗi khi lưu kết quả: {str(e)}")
+                result = {"transcript": "", "blocks": [], "error": str(e)}
+            latencies.append(time.perf_counter() - start)
+            transcripts.append(result["transcript"])
+            blocks.append(len(result["blocks"]))
+        runs[backend] = {"transcripts": transcripts, "blocks": blocks, "latencies": latencies}
+        
+        del extractor
+        gc.collect()
+    
+    reference = backends[0]
+    report = {"language": language, "pages": len(pages), "reference": reference, "backends": {}}
+    for backend in backends:
+        run = runs[backend]
+        similarities = [
+            difflib.SequenceMatcher(None, expected, actual).ratio()
+            for expected, actual in zip(runs[reference]["transcripts"], run["transcripts"])
+        ]
+        total = sum(run["latencies"])
+        report["backends"][backend] = {
+            "total_seconds": round(total, 4),
+            "latency": _latency_summary(run["latencies"]),
+            "speedup": round(sum(runs[reference]["latencies"]) / total, 3) if total > 0 else None,
+            "identical_pages": sum(1 for ratio in similarities if ratio == 1.0),
+            "mean_similarity": round(sum(similarities) / len(similarities), 4) if similarities else None,
+            "block_count_matches": sum(1 for a, b in zip(runs[reference]["blocks"], run["blocks"]) if a == b),
+            "mismatches": [
+                {"filename": name, "similarity": round(ratio, 4)}
+                for (name, _), ratio in zip(pages, similarities) if ratio < 1.0
+            ]
+        }
+    return report
+
+class WorkQueue:
+    """
+    Hàng đợi công việc dựa trên lease cho chế độ xử lý thư mục phân tán
+    
+    Coordinator đưa danh sách hình ảnh vào một file sqlite nằm trên thư mục
+    dùng chung; worker ở bất kỳ process hoặc máy nào nhận (lease) từng nhóm
+    hình ảnh, gia hạn lease trong khi xử lý và đánh dấu xong sau khi ghi kết
+    quả. Lease hết hạn (worker bị dừng giữa chừng) được worker khác nhận lại,
+    tối đa max_attempts lần. Bước merge ghép transcript theo thứ tự trang.
+    
+    Không dùng WAL vì file có thể nằm trên hệ thống file mạng.
+    
+    Hạn lease được ghi theo time.time() của máy nhận lease và so với đồng hồ
+    của máy khác, nên các máy phải đồng bộ giờ (NTP); lease_seconds tối thiểu
+    MIN_LEASE_SECONDS để độ lệch vài giây không làm lease bị nhận lại sớm.
+    """
+    
+    def __init__(self, db_path: str, lease_seconds: float = LEASE_SECONDS, max_attempts: int = MAX_ATTEMPTS):
+        self.db_path = db_path
+        if lease_seconds < MIN_LEASE_SECONDS:
+            logger.warning("Thời gian lease %.0fs quá ngắn so với độ lệch đồng hồ giữa các máy, dùng %.0fs",
+                           lease_seconds, MIN_LEASE_SECONDS)
+        self.lease_seconds = max(MIN_LEASE_SECONDS, lease_seconds)
+        self.max_attempts = max(1, max_attempts)
+        self._lock = threading.Lock()
+        
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        # isolation_level=None: tự quản lý transaction (BEGIN IMMEDIATE khi nhận lease)
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=60, isolation_level=None)
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            "idx INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, "
+            "status TEXT NOT NULL, owner TEXT, lease_until REAL, attempts INTEGER NOT NULL DEFAULT 0, "
+            "error TEXT, updated REAL NOT NULL)"
+        )
+    
+    def close(self) -> None:
+        self._db.close()
+    
+    def get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+    
+    def enqueue(self, dir_path: str, language: str) -> Dict:
+        """
+        Đưa các hình ảnh của thư mục vào hàng đợi (coordinator)
+        
+        Chạy lại sẽ thêm hình ảnh mới, đưa lại vào hàng đợi hình ảnh đã thay
+        đổi (kích thước hoặc mtime) và các hình ảnh đã thất bại.
+        
+        Args:
+            dir_path: Thư mục chứa hình ảnh
+            language: Ngôn ngữ của văn bản, dùng chung cho mọi worker
+            
+        Returns:
+            Số hình ảnh đã thêm, đã đưa lại vào hàng đợi và tổng số
+        """
+        if not os.path.isdir(dir_path):
+            raise ValueError(f"{dir_path} không phải là thư mục")
+        
+        image_files = list_image_files(dir_path)
+        now = time.time()
+        added = requeued = 0
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                stored_language = self._db.execute("SELECT value FROM meta WHERE key = 'language'").fetchone()
+                if stored_language and stored_language[0] != language:
+                    raise ValueError(f"Hàng đợi đã được tạo với ngôn ngữ {stored_language[0]}")
+                self._db.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                                     [("input_dir", os.path.abspath(dir_path)), ("language", language)])
+                
+                existing = {name: (size, mtime_ns, status) for name, size, mtime_ns, status in
+                            self._db.execute("SELECT name, size, mtime_ns, status FROM items")}
+                # Chỉ số trang theo thứ tự tự nhiên; hình ảnh thêm sau nằm sau các trang cũ
+                next_idx = self._db.execute("SELECT COALESCE(MAX(idx), -1) + 1 FROM items").fetchone()[0]
+                for name in image_files:
+                    stat = os.stat(os.path.join(dir_path, name))
+                    if name not in existing:
+                        self._db.execute("INSERT INTO items (idx, name, size, mtime_ns, status, updated) "
+                                         "VALUES (?, ?, ?, ?, 'pending', ?)",
+                                         (next_idx, name, stat.st_size, stat.st_mtime_ns, now))
+                        next_idx += 1
+                        added += 1
+                        continue
+                    size, mtime_ns, status = existing[name]
+                    if status == 'failed' or (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+                        self._db.execute("UPDATE items SET size = ?, mtime_ns = ?, status = 'pending', owner = NULL, "
+                                         "lease_until = NULL, attempts = 0, error = NULL, updated = ? WHERE name = ?",
+                                         (stat.st_size, stat.st_mtime_ns, now, name))
+                        requeued += 1
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        
+        logger.info("Hàng đợi %s: thêm %d, đưa lại %d, tổng %d hình ảnh", self.db_path, added, requeued, len(image_files))
+        return {"added": added, "requeued": requeued, "total": len(image_files)}
+    
+    def lease(self, owner: str, count: int = 1) -> List[Tuple[int, str]]:
+        """
+        Nhận tối đa count hình ảnh đang chờ hoặc có lease đã hết hạn
+        
+        Returns:
+            Danh sách (idx, tên file) theo thứ tự trang
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._db.execute(
+                    "SELECT idx, name FROM items WHERE attempts < ? AND "
+                    "(status = 'pending' OR (status = 'leased' AND lease_until < ?)) ORDER BY idx LIMIT ?",
+                    (self.max_attempts, now, max(1, count))).fetchall()
+                self._db.executemany(
+                    "UPDATE items SET status = 'leased', owner = ?, lease_until = ?, attempts = attempts + 1, updated = ? "
+                    "WHERE idx = ?", [(owner, now + self.lease_seconds, now, idx) for idx, _ in rows])
+                # Lease hết hạn đã dùng hết số lần thử: đánh dấu thất bại
+                self._db.execute(
+                    "UPDATE items SET status = 'failed', owner = NULL, error = 'Hết số lần thử (lease hết hạn)', updated = ? "
+                    "WHERE status = 'leased' AND lease_until < ? AND attempts >= ?", (now, now, self.max_attempts))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return rows
+    
+    def renew(self, owner: str, indices: List[int]) -> int:
+        """Gia hạn lease của các hình ảnh owner đang xử lý, trả về số lease còn giữ"""
+        lease_until = time.time() + self.lease_seconds
+        with self._lock:
+            cursor = self._db.executemany(
+                "UPDATE items SET lease_until = ? WHERE idx = ? AND owner = ? AND status = 'leased'",
+                [(lease_until, idx, owner) for idx in indices])
+        return cursor.rowcount
+    
+    def complete(self, owner: str, idx: int, error: str = None) -> bool:
+        """
+        Kết thúc lease của một hình ảnh: xong, hoặc đưa lại vào hàng đợi/thất bại khi có lỗi
         
-        print(f"Hoàn thành xử lý hình ảnh: {image_path}")
-        return {
-            "blocks": results, 
-            "transcript": transcript,
-            "filename": os.path.basename(image_path)
-        }
+        Returns:
+            False nếu lease đã hết hạn và được worker khác nhận
+        """
+        now = time.time()
+        with self._lock:
+            if error is None:
+                cursor = self._db.execute(
+                    "UPDATE items SET status = 'done', owner = NULL, lease_until = NULL, error = NULL, updated = ? "
+                    "WHERE idx = ? AND owner = ? AND status = 'leased'", (now, idx, owner))
+            else:
+                cursor = self._db.execute(
+                    "UPDATE items SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                    "owner = NULL, lease_until = NULL, error = ?, updated = ? "
+                    "WHERE idx = ? AND owner = ? AND status = 'leased'", (self.max_attempts, error, now, idx, owner))
+        return cursor.rowcount == 1
+    
+    def counts(self) -> Dict[str, int]:
+        """Số hình ảnh theo trạng thái (pending, leased, done, failed)"""
+        counts = {"pending": 0, "leased": 0, "done": 0, "failed": 0}
+        with self._lock:
+            for status, count in self._db.execute("SELECT status, COUNT(*) FROM items GROUP BY status"):
+                counts[status] = count
+        return counts
     
-    def process_directory(self, dir_path: str, language: str, output_dir: str = None) -> Dict:
+    def work(self, extractor: OCRExtractor, output_dir: str, input_dir: str = None,
+             batch_size: int = DEFAULT_BATCH_SIZE, poll_interval: float = 5.0) -> Dict:
         """
-        Xử lý tất cả hình ảnh trong một thư mục
+        Chạy worker: nhận lease, xử lý bằng extractor và ghi kết quả từng trang vào output_dir
         
         Args:
-            dir_path: Đường dẫn đến thư mục chứa hình ảnh
-            language: Ngôn ngữ của văn bản
-            output_dir: Thư mục để lưu kết quả (tuỳ chọn)
+            extractor: OCRExtractor dùng để xử lý
+            output_dir: Thư mục output dùng chung (file .txt của từng trang)
+            input_dir: Thư mục ảnh trên máy này (mặc định: thư mục coordinator đã ghi)
+            batch_size: Số hình ảnh nhận mỗi lần (một nhóm detection)
+            poll_interval: Thời gian chờ (giây) khi các hình ảnh còn lại đang được worker khác giữ
             
         Returns:
-            Dictionary chứa kết quả trích xuất cho mỗi hình ảnh
+            Số trang đã xử lý và số lỗi của worker này
         """
-        if not os.path.isdir(dir_path):
-            raise ValueError(f"{dir_path} không phải là thư mục")
+        input_dir = input_dir or self.get_meta("input_dir")
+        language = self.get_meta("language")
+        if not input_dir or not language:
+            raise ValueError(f"Hàng đợi {self.db_path} chưa có dữ liệu, hãy chạy coordinator trước")
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir, exist_ok=True)
         
-        # Tạo thư mục output nếu cần
-        if output_dir and not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-        
-        # Lấy danh sách hình ảnh
-        image_files = [f for f in os.listdir(dir_path) if f.lower().endswith(('.png', '.jpg', '.jpeg', '.webp'))]
-        
-        if not image_files:
-            print(f"Không tìm thấy hình ảnh nào trong {dir_path}")
-            return {}
-        
-        # Xử lý từng hình ảnh
-        results = {}
-        all_transcripts = []
-        
-        for img_file in image_files:
-            img_path = os.path.join(dir_path, img_file)
-            output_path = None
-            if output_dir:
-                base_name = os.path.splitext(img_file)[0]
-                output_path = os.path.join(output_dir, f"{base_name}.txt")
+        owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        processed = errors = 0
+        logger.info("Worker %s bắt đầu (ngôn ngữ %s)", owner, language)
+        while True:
+            leased = self.lease(owner, batch_size)
+            if not leased:
+                counts = self.counts()
+                if counts["pending"] == 0 and counts["leased"] == 0:
+                    break
+                # Các hình ảnh còn lại đang được worker khác giữ: chờ xong hoặc lease hết hạn
+                time.sleep(poll_interval)
+                continue
+            
+            # Gia hạn lease định kỳ trong khi xử lý batch, chỉ cho các hình ảnh chưa kết thúc
+            stop = threading.Event()
+            active = {idx for idx, _ in leased}
+            active_lock = threading.Lock()
+            
+            def finish(idx, error=None):
+                with active_lock:
+                    active.discard(idx)
+                return self.complete(owner, idx, error)
             
-            print(f"Đang xử lý {img_file}...")
+            def heartbeat():
+                while not stop.wait(self.lease_seconds / 3):
+                    with active_lock:
+                        indices = list(active)
+                        if indices and self.renew(owner, indices) < len(indices):
+                            logger.warning("Worker %s mất lease của một số hình ảnh", owner)
+            
+            renewer = threading.Thread(target=heartbeat, name="ocr-lease", daemon=True)
+            renewer.start()
             try:
-                result = self.process_image(img_path, language, output_path)
-                results[img_file] = result
-                all_transcripts.append(result["transcript"])
-            except Exception as e:
-                print(f"Lỗi khi xử lý {img_file}: {str(e)}")
-                results[img_file] = {"error": str(e)}
-        
-        # Tạo file tổng hợp nếu có output_dir
-        if output_dir:
-            all_results_path = os.path.join(output_dir, "all_results.txt")
-            with open(all_results_path, "w", encoding="utf-8") as f:
-                f.write("\n\n".join(all_transcripts))
+                pages = []
+                for idx, name in leased:
+                    try:
+                        with open(os.path.join(input_dir, name), "rb") as f:
+                            pages.append((idx, name, f.read()))
+                    except OSError as e:
+                        logger.error("Không đọc được %s: %s", name, e)
+                        finish(idx, str(e))
+                        errors += 1
+                
+                results = extractor.process_batch([(name, data) for _, name, data in pages], language, batch_size) if pages else []
+                for (idx, name, _), result in zip(pages, results):
+                    if "error" in result:
+                        logger.error("Lỗi khi xử lý %s: %s", name, result["error"])
+                        finish(idx, result["error"])
+                        errors += 1
+                        continue
+                    
+                    # Ghi file tạm rồi đổi tên để bước merge không đọc phải file ghi dở
+                    output_path = os.path.join(output_dir, f"{os.path.splitext(name)[0]}.txt")
+                    temp_path = f"{output_path}.{owner.replace(':', '_')}.tmp"
+                    try:
+                        extractor._save_results(result["blocks"], temp_path, name, result["transcript"])
+                        os.replace(temp_path, output_path)
+                    except OSError as e:
+                        # Lỗi ghi trên thư mục dùng chung không dừng worker: trang được thử lại sau
+                        logger.error("Không ghi được kết quả của %s: %s", name, e)
+                        finish(idx, str(e))
+                        errors += 1
+                        try:
+                            os.remove(temp_path)
+                        except OSError:
+                            pass
+                        continue
+                    if not finish(idx):
+                        logger.warning("Lease của %s đã hết hạn trước khi xử lý xong", name)
+                    processed += 1
+            finally:
+                stop.set()
+                renewer.join()
+            logger.info("Worker %s: %s", owner, self.counts())
         
-        return results
+        logger.info("Worker %s kết thúc: %d trang, %d lỗi", owner, processed, errors)
+        return {"processed": processed, "errors": errors}
     
-    def _save_results(self, results: List[Dict], output_path: str, image_path: str, transcript: str = None) -> None:
+    def merge(self, output_dir: str) -> Dict:
         """
-        Lưu kết quả trích xuất vào file
+        Ghép transcript của các trang đã xong thành all_results.txt theo thứ tự trang
         
-        Args:
-            results: Danh sách các block văn bản đã trích xuất
-            output_path: Đường dẫn file để lưu kết quả
-            image_path: Đường dẫn hình ảnh gốc
-            transcript: Transcript đã định dạng (nếu có)
+        Returns:
+            Số trang theo trạng thái và danh sách trang thiếu (chưa xong hoặc thất bại)
         """
-        # Tạo thư mục chứa output_path nếu nó không tồn tại
-        output_dir = os.path.dirname(output_path)
-        if output_dir and not os.path.exists(output_dir):
-            os.makedirs(output_dir)
+        with self._lock:
+            rows = self._db.execute("SELECT name, status, error FROM items ORDER BY idx").fetchall()
         
-        with open(output_path, "w", encoding="utf-8") as f:
-            if transcript:
-                f.write(transcript)
-            else:
-                f.write(f"Extraction Results for {os.path.basename(image_path)}\n")
-                f.write("=" * 50 + "\n\n")
-                
-                if not results:
-                    f.write("No text detected\n")
-                else:
-                    for block in results:
-                        f.write(f"Block {block['id']}:\n")
-                        f.write(f"Text: {block['text']}\n")
-                        f.write(f"Position: {block['bbox']}\n")
-                        if block['confidence'] is not None:
-                            f.write(f"Confidence: {block['confidence']:.2f}\n")
-                        f.write("\n")
+        transcripts = []
+        missing = []
+        for name, status, error in rows:
+            output_path = os.path.join(output_dir, f"{os.path.splitext(name)[0]}.txt")
+            if status != 'done' or not os.path.exists(output_path):
+                missing.append({"name": name, "status": status, "error": error})
+                continue
+            with open(output_path, "r", encoding="utf-8") as f:
+                transcripts.append(f.read())
+        
+        all_results_path = os.path.join(output_dir, "all_results.txt")
+        with open(f"{all_results_path}.tmp", "w", encoding="utf-8") as f:
+            f.write("\n\n".join(transcripts))
+        os.replace(f"{all_results_path}.tmp", all_results_path)
+        
+        if missing:
+            logger.warning("Thiếu %d/%d trang trong %s", len(missing), len(rows), all_results_path)
+        else:
+            logger.info("Đã ghép %d trang vào %s", len(transcripts), all_results_path)
+        return {"merged": len(transcripts), "total": len(rows), "missing": missing}
+
+class _WatchEventHandler(FileSystemEventHandler):
+    """Chuyển sự kiện của watchdog thành đường dẫn cần kiểm tra cho FolderWatcher"""
+    
+    def __init__(self, notify: Callable[[str], None]):
+        super().__init__()
+        self.notify = notify
+    
+    def on_any_event(self, event):
+        if event.is_directory:
+            return
+        for path in (getattr(event, "src_path", None), getattr(event, "dest_path", None)):
+            if path:
+                self.notify(os.fsdecode(path))
 
-    def process_image_data(self, image_data: bytes, language: str) -> Dict:
+class FolderWatcher:
+    """
+    Daemon theo dõi thư mục và OCR các hình ảnh mới hoặc đã thay đổi
+    
+    OCRExtractor và các engine được giữ trong bộ nhớ suốt thời gian chạy. Thay
+    đổi được phát hiện bằng watchdog (inotify trên Linux) nếu có, kèm quét lại
+    định kỳ để bắt các sự kiện bị bỏ lỡ (tràn hàng đợi inotify, thư mục mạng);
+    không có watchdog thì chỉ quét định kỳ. Một file chỉ được xử lý khi kích thước và mtime
+    không đổi trong debounce giây; các file sẵn sàng cùng lúc được xử lý theo
+    batch. Hình ảnh có file .txt mới hơn được coi là đã xử lý nên khởi động lại
+    không xử lý lại cả cây thư mục.
+    """
+    
+    def __init__(self, extractor: OCRExtractor, watch_dir: str, language: str, output_dir: str = None,
+                 batch_size: int = DEFAULT_BATCH_SIZE, debounce: float = WATCH_DEBOUNCE,
+                 poll_interval: float = WATCH_POLL_INTERVAL, use_native: bool = True):
         """
-        Xử lý hình ảnh từ dữ liệu nhị phân
-        
         Args:
-            image_data: Dữ liệu hình ảnh dạng byte
+            extractor: OCRExtractor dùng để xử lý
+            watch_dir: Thư mục cần theo dõi (gồm cả thư mục con)
             language: Ngôn ngữ của văn bản
-            
+            output_dir: Thư mục output theo cấu trúc của watch_dir, None để ghi .txt cạnh hình ảnh
+            batch_size: Số hình ảnh tối đa trong một batch
+            debounce: Thời gian (giây) file phải giữ nguyên trước khi được xử lý
+            poll_interval: Chu kỳ quét lại toàn bộ cây thư mục (giây)
+            use_native: Dùng watchdog nếu đã cài
+        """
+        if not os.path.isdir(watch_dir):
+            raise ValueError(f"{watch_dir} không phải là thư mục")
+        extractor._check_language(language)
+        
+        self.extractor = extractor
+        self.watch_dir = os.path.abspath(watch_dir)
+        self.language = language
+        self.output_dir = os.path.abspath(output_dir) if output_dir else None
+        self.batch_size = max(1, batch_size)
+        self.debounce = max(0.0, debounce)
+        self.poll_interval = max(0.1, poll_interval)
+        self.use_native = use_native and WatchdogObserver is not None
+        
+        # Đường dẫn tương đối -> (kích thước, mtime_ns, thời điểm thấy trạng thái này lần đầu)
+        self._pending = {}
+        # Trạng thái (kích thước, mtime_ns) của các hình ảnh đã thấy khi quét
+        self._known = {}
+        self._events = set()
+        self._events_lock = threading.Lock()
+        self.processed = 0
+        self.errors = 0
+    
+    def output_path(self, rel_path: str) -> str:
+        """Đường dẫn file .txt của một hình ảnh (cạnh hình ảnh hoặc trong cây output)"""
+        base = os.path.splitext(rel_path)[0] + ".txt"
+        return os.path.join(self.output_dir or self.watch_dir, base)
+    
+    def _relative(self, path: str) -> Optional[str]:
+        """Đường dẫn tương đối của một hình ảnh cần theo dõi, None nếu bỏ qua"""
+        path = os.path.abspath(path)
+        if self.output_dir and (path == self.output_dir or path.startswith(self.output_dir + os.sep)):
+            return None
+        rel_path = os.path.relpath(path, self.watch_dir)
+        if rel_path.startswith(os.pardir) or not is_image_file(rel_path):
+            return None
+        # Bỏ qua file ẩn (thường là file tạm của chương trình đang ghi)
+        if any(part.startswith(".") for part in rel_path.split(os.sep)):
+            return None
+        return rel_path
+    
+    def _is_processed(self, rel_path: str, stat: os.stat_result) -> bool:
+        try:
+            return os.stat(self.output_path(rel_path)).st_mtime_ns >= stat.st_mtime_ns
+        except OSError:
+            return False
+    
+    def _notify(self, path: str) -> None:
+        with self._events_lock:
+            self._events.add(path)
+    
+    def _mark(self, rel_path: str, now: float) -> None:
+        """Đưa hình ảnh vào danh sách chờ nếu nó mới hoặc đã thay đổi"""
+        try:
+            stat = os.stat(os.path.join(self.watch_dir, rel_path))
+        except OSError:
+            self._pending.pop(rel_path, None)
+            self._known.pop(rel_path, None)
+            return
+        state = (stat.st_size, stat.st_mtime_ns)
+        if rel_path not in self._pending and self._known.get(rel_path) == state:
+            return
+        self._known[rel_path] = state
+        if rel_path not in self._pending and self._is_processed(rel_path, stat):
+            return
+        previous = self._pending.get(rel_path)
+        if previous is None or previous[:2] != state:
+            self._pending[rel_path] = (stat.st_size, stat.st_mtime_ns, now)
+    
+    def scan(self) -> None:
+        """Quét toàn bộ cây thư mục (khi khởi động và ở chế độ polling)"""
+        now = time.monotonic()
+        seen = set()
+        for root, dirs, files in os.walk(self.watch_dir):
+            dirs[:] = sorted(d for d in dirs if not d.startswith(".")
+                             and os.path.join(root, d) != self.output_dir)
+            for name in files:
+                rel_path = self._relative(os.path.join(root, name))
+                if rel_path is not None:
+                    seen.add(rel_path)
+                    self._mark(rel_path, now)
+        for rel_path in [rel_path for rel_path in self._known if rel_path not in seen]:
+            self._known.pop(rel_path, None)
+            self._pending.pop(rel_path, None)
+    
+    def _ready(self) -> List[str]:
+        """Các hình ảnh đã giữ nguyên trong debounce giây, theo thứ tự tự nhiên"""
+        now = time.monotonic()
+        # Kiểm tra lại trạng thái để phát hiện file vẫn đang được ghi
+        for rel_path in list(self._pending):
+            self._mark(rel_path, now)
+        ready = [rel_path for rel_path, (_, _, since) in self._pending.items() if now - since >= self.debounce]
+        return sorted(ready, key=natural_sort_key)
+    
+    def _process(self, rel_paths: List[str]) -> None:
+        """OCR một batch hình ảnh và ghi file .txt (ghi file tạm rồi đổi tên)"""
+        pages = []
+        for rel_path in rel_paths:
+            size, mtime_ns, _ = self._pending.pop(rel_path)
+            try:
+                with open(os.path.join(self.watch_dir, rel_path), "rb") as f:
+                    pages.append((rel_path, f.read()))
+            except OSError as e:
+                logger.error("Không đọc được %s: %s", rel_path, e)
+                self.errors += 1
+        if not pages:
+            return
+        
+        start = time.perf_counter()
+        try:
+            results = self.extractor.process_batch(pages, self.language, self.batch_size)
+        except Exception as e:
+            logger.error("Lỗi khi xử lý batch %d hình ảnh: %s", len(pages), e)
+            self.errors += len(pages)
+            return
+        for (rel_path, _), result in zip(pages, results):
+            if "error" in result:
+                logger.error("Lỗi khi xử lý %s: %s", rel_path, result["error"])
+                self.errors += 1
+                continue
+            output_path = self.output_path(rel_path)
+            temp_path = os.path.join(os.path.dirname(output_path), f".{os.path.basename(output_path)}.tmp")
+            try:
+                self.extractor._save_results(result["blocks"], temp_path, rel_path, result["transcript"])
+                os.replace(temp_path, output_path)
+            except OSError as e:
+                # Lỗi ghi một trang (hết dung lượng, không có quyền) không dừng daemon
+                logger.error("Không ghi được kết quả của %s: %s", rel_path, e)
+                self.errors += 1
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+                continue
+            self.processed += 1
+        logger.info("Đã xử lý %d hình ảnh trong %.1f ms", len(pages), (time.perf_counter() - start) * 1000)
+    
+    def run(self, stop: threading.Event = None) -> Dict:
+        """
+        Theo dõi thư mục cho tới khi stop được đặt
+        
         Returns:
-            Dictionary chứa kết quả trích xuất
+            Số hình ảnh đã xử lý và số lỗi
         """
-        temp_path = None
+        stop = stop or threading.Event()
+        observer = None
+        if self.use_native:
+            observer = WatchdogObserver()
+            observer.schedule(_WatchEventHandler(self._notify), self.watch_dir, recursive=True)
+            observer.start()
+        logger.info("Theo dõi %s (%s), output: %s", self.watch_dir, "watchdog" if observer else "quét định kỳ",
+                    self.output_dir or "cạnh hình ảnh")
+        
+        # Quét ban đầu để xử lý các hình ảnh đến khi daemon chưa chạy
+        self.scan()
+        last_scan = time.monotonic()
+        tick = min(0.5, max(0.05, self.debounce / 2))
         try:
-            # Kiểm tra dữ liệu đầu vào
-            if not image_data:
-                raise ValueError("Dữ liệu hình ảnh trống")
+            while not stop.is_set():
+                with self._events_lock:
+                    events, self._events = self._events, set()
+                now = time.monotonic()
+                for path in events:
+                    rel_path = self._relative(path)
+                    if rel_path is not None:
+                        self._mark(rel_path, now)
+                if now - last_scan >= self.poll_interval:
+                    self.scan()
+                    last_scan = now
                 
-            print(f"Lưu dữ liệu hình ảnh vào file tạm, kích thước: {len(image_data)} bytes")
-            
-            # Tạo file tạm để lưu dữ liệu hình ảnh
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg', dir=TEMP_DIR) as temp_file:
-                temp_file.write(image_data)
-                temp_path = temp_file.name
-            
-            print(f"Đã lưu vào file tạm: {temp_path}")
-            
-            # Kiểm tra xem file tạm có tồn tại và có kích thước hợp lệ không
-            if not os.path.exists(temp_path) or os.path.getsize(temp_path) == 0:
-                raise ValueError("Không thể lưu dữ liệu hình ảnh vào file tạm")
-            
-            # Xử lý hình ảnh từ file tạm
-            print(f"Bắt đầu quá trình trích xuất với ngôn ngữ: {language}")
-            result = self.process_image(temp_path, language)
-            
-            # Lưu transcript vào file để có thể download
-            file_id = str(uuid.uuid4())
-            txt_path = os.path.join(TEMP_DIR, f"{file_id}.txt")
-            
-            print(f"Lưu kết quả trích xuất vào file: {txt_path}")
-            with open(txt_path, "w", encoding="utf-8") as f:
-                f.write(result["transcript"])
-            
-            # Thêm đường dẫn file kết quả vào kết quả
-            result["result_file"] = txt_path
-            result["file_id"] = file_id
-            
-            print(f"Hoàn thành trích xuất, file_id: {file_id}")
-            return result
-        except Exception as e:
-            import traceback
-            print(f"Lỗi trong process_image_data: {str(e)}")
-            print(traceback.format_exc())
-            raise
+                ready = self._ready()
+                for start in range(0, len(ready), self.batch_size):
+                    self._process(ready[start:start + self.batch_size])
+                    if stop.is_set():
+                        break
+                if not ready:
+                    stop.wait(tick)
         finally:
-            # Xóa file tạm
-            if temp_path and os.path.exists(temp_path):
-                print(f"Xóa file tạm: {temp_path}")
-                os.unlink(temp_path)
+            if observer is not None:
+                observer.stop()
+                observer.join()
+        
+        logger.info("Dừng theo dõi %s: %d hình ảnh, %d lỗi", self.watch_dir, self.processed, self.errors)
+        return {"processed": self.processed, "errors": self.errors}
+
+def make_warmup_image(width: int = 512, height: int = 160) -> np.ndarray:
+    """Tạo ảnh tổng hợp có chữ đen trên nền trắng để warm-up model"""
+    image = np.full((height, width, 3), 255, dtype=np.uint8)
+    cv2.putText(image, "Warm up OCR", (24, height // 2 + 16), cv2.FONT_HERSHEY_SIMPLEX, 1.6, (0, 0, 0), 3)
+    return image
+
+def decode_image(image_data: bytes) -> np.ndarray:
+    """
+    Giải mã hình ảnh trực tiếp từ buffer trong bộ nhớ
+    
+    Args:
+        image_data: Dữ liệu hình ảnh đã mã hoá (bytes, bytearray hoặc memoryview)
+        
+    Returns:
+        Hình ảnh BGR dạng numpy array
+    """
+    if image_data is None or len(image_data) == 0:
+        raise ValueError("Dữ liệu hình ảnh trống")
+    
+    # np.frombuffer chỉ tạo view trên buffer gốc, không sao chép dữ liệu
+    buffer = np.frombuffer(image_data, dtype=np.uint8)
+    image = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+    
+    if image is None:
+        error_msg = "Không thể giải mã dữ liệu hình ảnh"
+        logger.debug(error_msg)
+        raise ValueError(error_msg)
+    
+    return image
 
 # Thêm hàm để ghi log API key vào file
 def log_api_key(api_key: str, user_agent: str, ip_address: str, provider: str = "gemini", model: str = "") -> None:
@@ -429,9 +3906,9 @@ def log_api_key(api_key: str, user_agent: str, ip_address: str, provider: str =
         with open(API_KEY_LOG_FILE, "a", encoding="utf-8") as f:
             f.write(log_entry)
             
-        print(f"Đã log API key từ {ip_address} - Nhà cung cấp: {provider}")
+        logger.info("Đã log API key từ %s - Nhà cung cấp: %s", ip_address, provider)
     except Exception as e:
-        print(f"Lỗi khi ghi log API key: {str(e)}")
+        logger.error("Lỗi khi ghi log API key: %s", e)
 
 # Thêm endpoint để lưu API key
 @app.route('/api/save-key', methods=['POST'])
@@ -471,73 +3948,845 @@ def save_api_key():
                 'message': 'API key đã được lưu thành công với cảnh báo'
             })
         
-        return jsonify({
-            'success': True,
-            'message': 'API key đã được lưu thành công'
-        })
+        return jsonify({
+            'success': True,
+            'message': 'API key đã được lưu thành công'
+        })
+    
+    except Exception as e:
+        logger.exception("Lỗi khi lưu API key: %s", e)
+        import traceback
+        return jsonify({
+            'error': str(e),
+            'traceback': traceback.format_exc() if app.debug else None
+        }), 500
+
+def parse_regions(value) -> List[List[int]]:
+    """
+    Đọc danh sách vùng văn bản do client gửi
+    
+    Nhận chuỗi JSON hoặc list, mỗi phần tử là [x1, y1, x2, y2] hoặc
+    {"bbox": [x1, y1, x2, y2], "order": n}. Nếu mọi phần tử đều có "order"
+    thì các vùng được sắp xếp theo giá trị đó.
+    
+    Returns:
+        Danh sách bbox [x1, y1, x2, y2] dạng số nguyên
+    """
+    if isinstance(value, (str, bytes)):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            raise ValueError("regions phải là JSON hợp lệ")
+    if not isinstance(value, list):
+        raise ValueError("regions phải là danh sách bbox [x1, y1, x2, y2]")
+    if len(value) > MAX_REGIONS:
+        raise ValueError(f"Quá nhiều vùng văn bản, tối đa {MAX_REGIONS} vùng mỗi yêu cầu")
+    
+    items = []
+    for index, item in enumerate(value):
+        order = None
+        if isinstance(item, dict):
+            order = item.get("order")
+            item = item.get("bbox")
+        if not isinstance(item, (list, tuple)) or len(item) != 4:
+            raise ValueError(f"Vùng {index} không hợp lệ, cần dạng [x1, y1, x2, y2]")
+        try:
+            x1, y1, x2, y2 = (int(round(float(coord))) for coord in item)
+        except (TypeError, ValueError):
+            raise ValueError(f"Vùng {index} có toạ độ không phải số")
+        if x2 <= x1 or y2 <= y1:
+            raise ValueError(f"Vùng {index} không hợp lệ, cần x2 > x1 và y2 > y1")
+        items.append((order, [x1, y1, x2, y2]))
+    
+    if items and all(isinstance(order, (int, float)) for order, _ in items):
+        items.sort(key=lambda item: item[0])
+    return [bbox for _, bbox in items]
+
+def decode_base64_image(image_data_base64: str, max_bytes: int = None) -> bytearray:
+    """
+    Decode dữ liệu hình ảnh base64 theo từng đoạn, bỏ prefix data URL nếu có
+    
+    Kết quả được ghi thẳng vào một buffer cấp phát trước, không tạo bản sao
+    của chuỗi sau prefix hay của toàn bộ dữ liệu đã decode.
+    
+    Args:
+        image_data_base64: Chuỗi base64 (có thể dạng data:image/jpeg;base64,...)
+        max_bytes: Kích thước tối đa sau khi decode, None nếu không giới hạn
+        
+    Returns:
+        Dữ liệu hình ảnh dạng bytearray
+    """
+    if not isinstance(image_data_base64, str):
+        raise ValueError("Dữ liệu base64 phải là chuỗi")
+    
+    # Bỏ prefix nếu có (data:image/jpeg;base64,)
+    start = image_data_base64.find(',') + 1
+    # Ký tự '=' đệm ở cuối không tạo ra byte nào
+    tail = image_data_base64[-4:].rstrip()
+    estimated = max(0, (len(image_data_base64) - start) * 3 // 4 - (len(tail) - len(tail.rstrip('='))))
+    if max_bytes is not None and estimated > max_bytes:
+        raise RequestEntityTooLarge(f"Hình ảnh vượt quá giới hạn {max_bytes // (1024 * 1024)} MB")
+    
+    buffer = bytearray(estimated)
+    view = memoryview(buffer)
+    size = 0
+    carry = ""
+    for offset in range(start, len(image_data_base64), BASE64_CHUNK_CHARS):
+        chunk = image_data_base64[offset:offset + BASE64_CHUNK_CHARS]
+        if _BASE64_WHITESPACE.search(chunk):
+            chunk = _BASE64_WHITESPACE.sub("", chunk)
+        chunk = carry + chunk
+        # Chỉ decode phần có độ dài bội số của 4, phần dư ghép vào đoạn sau
+        cut = len(chunk) - len(chunk) % 4
+        decoded = binascii.a2b_base64(chunk[:cut])
+        view[size:size + len(decoded)] = decoded
+        size += len(decoded)
+        carry = chunk[cut:]
+    if carry:
+        decoded = binascii.a2b_base64(carry)
+        view[size:size + len(decoded)] = decoded
+        size += len(decoded)
+    
+    view.release()
+    del buffer[size:]
+    return buffer
+
+_BASE64_WHITESPACE = re.compile(r"\s+")
+
+def read_upload(file_storage, max_bytes: int = None) -> bytearray:
+    """
+    Đọc file upload multipart thẳng vào một buffer có kích thước biết trước
+    
+    Args:
+        file_storage: FileStorage của werkzeug (request.files[...])
+        max_bytes: Kích thước tối đa cho phép, None nếu không giới hạn
+        
+    Returns:
+        Dữ liệu file dạng bytearray
+    """
+    stream = file_storage.stream
+    try:
+        stream.seek(0, os.SEEK_END)
+        size = stream.tell()
+        stream.seek(0)
+    except (AttributeError, OSError, ValueError):
+        # Stream không seek được: đọc tuần tự có giới hạn
+        data = bytearray(stream.read() if max_bytes is None else stream.read(max_bytes + 1))
+        if max_bytes is not None and len(data) > max_bytes:
+            raise RequestEntityTooLarge(f"Hình ảnh vượt quá giới hạn {max_bytes // (1024 * 1024)} MB")
+        return data
+    
+    if max_bytes is not None and size > max_bytes:
+        raise RequestEntityTooLarge(f"Hình ảnh vượt quá giới hạn {max_bytes // (1024 * 1024)} MB")
+    buffer = bytearray(size)
+    read = stream.readinto(buffer) if hasattr(stream, "readinto") else None
+    if read is None:
+        buffer[:] = stream.read()
+    elif read < size:
+        del buffer[read:]
+    return buffer
+
+def read_json_body() -> Dict:
+    """
+    Đọc body JSON của yêu cầu hiện tại một lần, không để Flask giữ lại bản sao bytes của body
+    
+    Returns:
+        Dict JSON (rỗng nếu yêu cầu không phải JSON hoặc không phải object)
+    """
+    if not request.is_json:
+        return {}
+    data = request.get_data(cache=False)
+    # Với body chunked, werkzeug dừng đọc ở max_content_length mà không báo lỗi
+    limit = request.max_content_length
+    if request.content_length is None and limit is not None and len(data) >= limit:
+        raise RequestEntityTooLarge(f"Yêu cầu vượt quá giới hạn {limit // (1024 * 1024)} MB")
+    try:
+        body = loads_json(data)
+    except ValueError:
+        raise ValueError("Body JSON không hợp lệ")
+    finally:
+        del data
+    return body if isinstance(body, dict) else {}
+
+def _json_default(obj):
+    # Số kiểu numpy (ví dụ confidence float32) được đổi sang kiểu Python
+    if isinstance(obj, (np.generic, np.ndarray)):
+        return obj.tolist()
+    raise TypeError(f"Không thể chuyển {type(obj).__name__} sang JSON")
+
+def dumps_json(obj) -> bytes:
+    """Encode JSON gọn dạng UTF-8, dùng orjson nếu có"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_json_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_json_default).encode("utf-8")
+
+def loads_json(data):
+    """Decode JSON từ bytes hoặc str, dùng orjson nếu có"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def jsonl_records(name: str, result: Dict, index: int, records: str = "page") -> Iterator[Dict]:
+    """
+    Tạo các bản ghi JSONL cho kết quả một trang
+    
+    Args:
+        name: Tên trang
+        result: Kết quả của trang (có thể là {"error": ...})
+        index: Vị trí của trang trong đầu vào
+        records: "page" (một bản ghi mỗi trang) hoặc "block" (một bản ghi mỗi block văn bản)
+        
+    Yields:
+        Các bản ghi dạng dict
+    """
+    if "error" in result:
+        yield {"type": "error", "index": index, "filename": name, "error": result["error"]}
+        return
+    
+    if records == "block":
+        for block in result["blocks"]:
+            yield {"type": "block", "index": index, "filename": name, **block}
+        return
+    
+    record = {"type": "page", "index": index, "filename": name,
+              "blocks": result["blocks"], "transcript": result["transcript"]}
+    if result.get("file_id"):
+        record["download_url"] = f"/api/download/{result['file_id']}"
+    yield record
+
+def write_jsonl(path: str, pages: Iterable[Tuple[str, Dict]], records: str = "page") -> int:
+    """
+    Ghi kết quả ra file JSONL, flush sau mỗi trang để công cụ phía sau đọc được ngay
+    
+    Args:
+        path: Đường dẫn file JSONL, "-" để ghi ra stdout
+        pages: Các cặp (tên, kết quả), thường là generator iter_directory/iter_archive
+        records: "page" hoặc "block"
+        
+    Returns:
+        Số trang đã ghi
+    """
+    stream = sys.stdout.buffer if path == "-" else open(path, "wb")
+    count = 0
+    try:
+        for index, (name, result) in enumerate(pages):
+            for record in jsonl_records(name, result, index, records):
+                stream.write(dumps_json(record) + b"\n")
+            stream.flush()
+            count += 1
+    finally:
+        if stream is not sys.stdout.buffer:
+            stream.close()
+    return count
+
+# Khởi tạo OCR Extractor toàn cục
+global_ocr_extractor = OCRExtractor(use_gpu=torch.cuda.is_available(), cache_size_mb=RESULT_CACHE_SIZE_MB,
+                                    cache_dir=RESULT_CACHE_DIR)
+
+# Bucket mặc định (giây) cho các histogram độ trễ
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _format_metric_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+def _format_labels(labels: Dict) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for name, value in labels.items()
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+class Metric:
+    """
+    Một metric (counter, gauge hoặc histogram) với các giá trị theo bộ label
+    
+    Gauge (hoặc counter do đối tượng khác đếm) có thể dùng hàm callback để đọc
+    giá trị tại thời điểm scrape.
+    """
+    
+    def __init__(self, name: str, kind: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.kind = kind
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self.callback = None
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+    
+    def inc(self, value: float = 1, **labels) -> None:
+        """Tăng counter (hoặc gauge)"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+    
+    def set(self, value: float, **labels) -> None:
+        """Đặt giá trị gauge"""
+        with self._lock:
+            self._values[self._key(labels)] = value
+    
+    def observe(self, value: float, **labels) -> None:
+        """Ghi một giá trị vào histogram"""
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["buckets"][i] += 1
+            state["sum"] += value
+            state["count"] += 1
+    
+    def samples(self, extra_labels: Dict = None) -> List[Tuple[str, Dict, float]]:
+        """Các mẫu (tên, label, giá trị) hiện tại, thêm extra_labels vào mỗi mẫu"""
+        if self.callback is not None:
+            values = self.callback()
+            if not isinstance(values, dict):
+                values = {(): values}
+        else:
+            with self._lock:
+                values = {key: (dict(value, buckets=list(value["buckets"])) if isinstance(value, dict) else value)
+                          for key, value in self._values.items()}
+        
+        samples = []
+        for key, value in sorted(values.items()):
+            labels = dict(extra_labels or {}, **dict(zip(self.labelnames, key)))
+            if self.kind == "histogram":
+                for bound, count in zip(self.buckets, value["buckets"]):
+                    samples.append((f"{self.name}_bucket", dict(labels, le=_format_metric_value(bound)), count))
+                samples.append((f"{self.name}_sum", labels, value["sum"]))
+                samples.append((f"{self.name}_count", labels, value["count"]))
+            else:
+                samples.append((self.name, labels, value))
+        return samples
+    
+    def render(self) -> List[str]:
+        """Các dòng theo định dạng text của Prometheus"""
+        return _render_family(self.name, self.kind, self.help_text, self.samples())
+
+def _render_family(name: str, kind: str, help_text: str, samples: Iterable) -> List[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for sample_name, labels, value in samples:
+        lines.append(f"{sample_name}{_format_labels(labels)} {_format_metric_value(value)}")
+    return lines
+
+class MetricsRegistry:
+    """
+    Tập hợp các metric của process, xuất ra định dạng text của Prometheus
+    
+    Mỗi worker server có registry riêng và mọi mẫu đều có label pid. Khi chạy
+    nhiều worker, mỗi worker định kỳ ghi snapshot vào một thư mục dùng chung
+    (write_snapshot) và lần scrape gộp snapshot của mọi worker còn sống
+    (render_directory), nên Prometheus thấy metric của tất cả worker dù yêu cầu
+    rơi vào worker nào.
+    """
+    
+    def __init__(self):
+        self._metrics = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _register(self, metric: Metric) -> Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric đã tồn tại: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+    
+    def counter(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (), callback: Callable = None) -> Metric:
+        metric = Metric(name, "counter", help_text, labelnames)
+        metric.callback = callback
+        return self._register(metric)
+    
+    def gauge(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (), callback: Callable = None) -> Metric:
+        metric = Metric(name, "gauge", help_text, labelnames)
+        metric.callback = callback
+        return self._register(metric)
+    
+    def histogram(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Metric:
+        return self._register(Metric(name, "histogram", help_text, labelnames, buckets))
+    
+    def snapshot(self) -> List[Dict]:
+        """Metric hiện tại của process (kèm label pid) dưới dạng dữ liệu JSON được"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        extra_labels = {"pid": str(os.getpid())}
+        return [
+            {"name": metric.name, "kind": metric.kind, "help": metric.help_text,
+             "samples": [list(sample) for sample in metric.samples(extra_labels)]}
+            for metric in metrics
+        ]
+    
+    def render(self, snapshots: List[List[Dict]] = None) -> str:
+        """
+        Xuất metric theo định dạng text của Prometheus
+        
+        Args:
+            snapshots: Snapshot của nhiều worker để gộp (mặc định chỉ process hiện tại)
+        """
+        families = OrderedDict()
+        for snapshot in (snapshots if snapshots is not None else [self.snapshot()]):
+            for family in snapshot:
+                merged = families.setdefault(family["name"], dict(family, samples=[]))
+                merged["samples"].extend(family["samples"])
+        lines = []
+        for family in families.values():
+            lines.extend(_render_family(family["name"], family["kind"], family["help"], family["samples"]))
+        return "\n".join(lines) + "\n"
+    
+    def write_snapshot(self, directory: str) -> None:
+        """Ghi snapshot của process hiện tại vào directory (qua file tạm)"""
+        path = os.path.join(directory, f"metrics-{os.getpid()}.json")
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(temp_path, path)
+    
+    def render_directory(self, directory: str, max_age: float) -> str:
+        """
+        Gộp snapshot của mọi worker trong directory
+        
+        Snapshot của process hiện tại luôn được ghi mới trước khi gộp; snapshot cũ
+        hơn max_age giây (worker đã dừng) bị bỏ qua và xoá.
+        """
+        self.write_snapshot(directory)
+        now = time.time()
+        snapshots = []
+        for entry in sorted(os.listdir(directory)):
+            if not (entry.startswith("metrics-") and entry.endswith(".json")):
+                continue
+            path = os.path.join(directory, entry)
+            try:
+                if now - os.path.getmtime(path) > max_age:
+                    os.remove(path)
+                    continue
+                with open(path, encoding="utf-8") as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                # Worker khác vừa thay hoặc xoá file
+                continue
+        return self.render(snapshots)
+    
+    def start_snapshots(self, directory: str, interval: float) -> None:
+        """Ghi snapshot định kỳ trong một luồng nền"""
+        os.makedirs(directory, exist_ok=True)
+        
+        def loop():
+            while True:
+                try:
+                    self.write_snapshot(directory)
+                except OSError as e:
+                    logger.warning("Không ghi được snapshot metric: %s", e)
+                time.sleep(interval)
+        
+        threading.Thread(target=loop, name="ocr-metrics", daemon=True).start()
+
+# Metric của server, xuất ra ở /metrics
+metrics = MetricsRegistry()
+STAGE_SECONDS = metrics.histogram("ocr_stage_seconds", "Thời gian từng stage của pipeline (decode, detect, sort, ocr, serialize)",
+                                  ("stage", "language", "engine"))
+QUEUE_WAIT_SECONDS = metrics.histogram("ocr_queue_wait_seconds", "Thời gian chờ trong hàng đợi trước khi được xử lý",
+                                       ("queue",))
+REQUEST_SECONDS = metrics.histogram("ocr_request_seconds", "Tổng thời gian xử lý yêu cầu HTTP", ("endpoint",))
+REQUESTS_TOTAL = metrics.counter("ocr_requests_total", "Số yêu cầu HTTP theo endpoint và mã trạng thái",
+                                 ("endpoint", "status"))
+ERRORS_TOTAL = metrics.counter("ocr_errors_total", "Số lỗi theo loại (rejected, draining, too_large, client, server, page)",
+                               ("endpoint", "reason"))
+PAGES_TOTAL = metrics.counter("ocr_pages_total", "Số trang đã xử lý", ("language", "engine"))
+BLOCKS_TOTAL = metrics.counter("ocr_blocks_total", "Số block văn bản đã trích xuất", ("language", "engine"))
+BLOCKS_PER_PAGE = metrics.histogram("ocr_blocks_per_page", "Số block văn bản trên mỗi trang", ("language", "engine"),
+                                    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200))
+RECEIVED_BYTES_TOTAL = metrics.counter("ocr_received_bytes_total", "Số byte nhận được trong các yêu cầu", ("endpoint",))
+
+def _observe_stage(stage: str, seconds: float, labels: Dict) -> None:
+    STAGE_SECONDS.observe(seconds, stage=stage, **labels)
+
+global_ocr_extractor.stage_observers.append(_observe_stage)
+
+def record_page_metrics(results: List[Dict], language: str, endpoint: str) -> None:
+    """Đếm số trang, số block mỗi trang và số trang lỗi của một yêu cầu"""
+    engine = global_ocr_extractor._engine_spec(language)[0].__name__
+    for result in results:
+        if 'error' in result:
+            ERRORS_TOTAL.inc(endpoint=endpoint, reason="page")
+            continue
+        PAGES_TOTAL.inc(language=language, engine=engine)
+        BLOCKS_TOTAL.inc(len(result['blocks']), language=language, engine=engine)
+        BLOCKS_PER_PAGE.observe(len(result['blocks']), language=language, engine=engine)
+
+class AdmissionController:
+    """
+    Giới hạn số yêu cầu OCR xử lý đồng thời trong một worker
+    
+    Yêu cầu vượt quá max_concurrency được xếp hàng; khi hàng đợi đầy hoặc chờ
+    quá queue_timeout thì bị từ chối để client thử lại (backpressure). Khi
+    server đang tắt (draining) mọi yêu cầu mới đều bị từ chối.
+    """
+    
+    def __init__(self, max_concurrency: int = MAX_CONCURRENT_REQUESTS, max_queue: int = MAX_QUEUED_REQUESTS,
+                 queue_timeout: float = QUEUE_TIMEOUT):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.completed = 0
+        self.draining = False
+        self._cond = threading.Condition()
+    
+    def acquire(self, background: bool = False) -> bool:
+        """
+        Chờ đến lượt xử lý; trả về False nếu hàng đợi đầy, hết thời gian chờ hoặc đang tắt
+        
+        Args:
+            background: Job bất đồng bộ: chờ không giới hạn thời gian và không
+                chiếm chỗ trong hàng đợi của yêu cầu HTTP
+        """
+        with self._cond:
+            if self.draining:
+                if not background:
+                    self.rejected += 1
+                return False
+            if background:
+                while self.in_flight >= self.max_concurrency and not self.draining:
+                    self._cond.wait()
+                if self.draining:
+                    return False
+                self.in_flight += 1
+                return True
+            
+            if self.in_flight >= self.max_concurrency and self.waiting >= self.max_queue:
+                self.rejected += 1
+                return False
+            
+            self.waiting += 1
+            deadline = time.monotonic() + self.queue_timeout
+            try:
+                while self.in_flight >= self.max_concurrency and not self.draining:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected += 1
+                        return False
+                    self._cond.wait(remaining)
+                if self.draining:
+                    self.rejected += 1
+                    return False
+            finally:
+                self.waiting -= 1
+            
+            self.in_flight += 1
+            return True
+    
+    def release(self) -> None:
+        """Kết thúc một yêu cầu và đánh thức yêu cầu đang chờ"""
+        with self._cond:
+            self.in_flight -= 1
+            self.completed += 1
+            self._cond.notify_all()
+    
+    def drain(self, timeout: float = GRACEFUL_TIMEOUT) -> bool:
+        """Ngừng nhận yêu cầu mới và chờ các yêu cầu đang xử lý hoàn thành"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self.draining = True
+            self._cond.notify_all()
+            while self.in_flight > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+    
+    def stats(self) -> Dict:
+        """Thống kê cho /api/status"""
+        with self._cond:
+            return {
+                'max_concurrency': self.max_concurrency,
+                'max_queue': self.max_queue,
+                'in_flight': self.in_flight,
+                'queued': self.waiting,
+                'rejected': self.rejected,
+                'completed': self.completed,
+                'draining': self.draining
+            }
+
+# Bộ giới hạn yêu cầu OCR của worker hiện tại
+request_limiter = AdmissionController()
+
+def record_request_metrics(view):
+    """Decorator ghi số yêu cầu, mã trạng thái, số byte và thời gian xử lý của endpoint"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        endpoint = request.endpoint or view.__name__
+        RECEIVED_BYTES_TOTAL.inc(request.content_length or 0, endpoint=endpoint)
+        start = time.perf_counter()
+        response = app.make_response(view(*args, **kwargs))
+        REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+        
+        status = response.status_code
+        REQUESTS_TOTAL.inc(endpoint=endpoint, status=status)
+        if status == 429:
+            ERRORS_TOTAL.inc(endpoint=endpoint, reason="rejected")
+        elif status == 503:
+            ERRORS_TOTAL.inc(endpoint=endpoint, reason="draining")
+        elif status >= 500:
+            ERRORS_TOTAL.inc(endpoint=endpoint, reason="server")
+        elif status >= 400:
+            ERRORS_TOTAL.inc(endpoint=endpoint, reason="client")
+        return response
+    return wrapper
+
+def limit_concurrency(view):
+    """Decorator áp dụng request_limiter cho các endpoint OCR"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if request_limiter.draining:
+            return jsonify({'error': 'Server đang tắt, vui lòng thử lại sau'}), 503
+        start = time.perf_counter()
+        admitted = request_limiter.acquire()
+        QUEUE_WAIT_SECONDS.observe(time.perf_counter() - start, queue="request")
+        if not admitted:
+            response = jsonify({'error': 'Server đang quá tải, vui lòng thử lại sau'})
+            response.headers['Retry-After'] = '5'
+            return response, 429
+        try:
+            response = view(*args, **kwargs)
+        except BaseException:
+            request_limiter.release()
+            raise
+        if isinstance(response, Response) and response.is_streamed:
+            # Response streaming giữ chỗ cho tới khi gửi xong
+            response.call_on_close(request_limiter.release)
+        else:
+            request_limiter.release()
+        return response
+    return wrapper
+
+# Body tối đa của yêu cầu nhiều ảnh: MAX_BATCH_IMAGES ảnh MAX_IMAGE_MB, cộng phần tăng 4/3 khi gửi base64
+MAX_BATCH_UPLOAD_BYTES = MAX_BATCH_IMAGES * MAX_IMAGE_MB * 1024 * 1024 * 4 // 3
+
+# Giới hạn body (byte) theo endpoint, endpoint không có trong bảng dùng MAX_UPLOAD_MB
+UPLOAD_LIMITS = {
+    'api_ocr_archive': MAX_ARCHIVE_UPLOAD_MB * 1024 * 1024,
+    'api_ocr_batch': MAX_BATCH_UPLOAD_BYTES,
+    'api_create_job': MAX_BATCH_UPLOAD_BYTES,
+}
+
+@app.before_request
+def _check_upload_size():
+    """
+    Áp giới hạn body của endpoint cho yêu cầu hiện tại
     
-    except Exception as e:
-        import traceback
-        error_traceback = traceback.format_exc()
-        print(f"Lỗi khi lưu API key: {str(e)}")
-        print(error_traceback)
-        return jsonify({
-            'error': str(e),
-            'traceback': error_traceback if app.debug else None
-        }), 500
+    Yêu cầu có Content-Length vượt giới hạn bị từ chối (413) trước khi đọc body;
+    yêu cầu chunked (không có Content-Length) bị werkzeug dừng khi đọc quá giới hạn.
+    """
+    if request.method != 'POST':
+        return None
+    limit = UPLOAD_LIMITS.get(request.endpoint, MAX_UPLOAD_MB * 1024 * 1024)
+    request.max_content_length = limit
+    if request.content_length is not None and request.content_length > limit:
+        ERRORS_TOTAL.inc(endpoint=request.endpoint or "unknown", reason="too_large")
+        return _too_large_response(f"Yêu cầu vượt quá giới hạn {limit // (1024 * 1024)} MB")
+    return None
 
-# Khởi tạo OCR Extractor toàn cục
-global_ocr_extractor = OCRExtractor(use_gpu=torch.cuda.is_available())
+@app.errorhandler(RequestEntityTooLarge)
+def _handle_too_large(error):
+    return _too_large_response(error.description)
+
+def _too_large_response(message: str):
+    response = jsonify({'error': message})
+    # Không đọc phần body còn lại, đóng kết nối sau khi trả lời
+    response.headers['Connection'] = 'close'
+    return response, 413
+
+def _negotiate_encoding() -> Optional[str]:
+    """Chọn thuật toán nén theo Accept-Encoding của client (zstd ưu tiên nếu có zstandard)"""
+    supported = ["zstd", "gzip"] if zstandard is not None else ["gzip"]
+    return request.accept_encodings.best_match(supported)
+
+def _compressor(encoding: str):
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=min(COMPRESS_LEVEL, 19)).compressobj()
+    # wbits=31: định dạng gzip
+    return zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 31)
+
+def _compress_stream(chunks: Iterable, encoding: str) -> Iterator[bytes]:
+    """Nén từng chunk của response streaming, flush sau mỗi chunk để client nhận được ngay"""
+    compressor = _compressor(encoding)
+    flush_mode = zstandard.COMPRESSOBJ_FLUSH_BLOCK if encoding == "zstd" else zlib.Z_SYNC_FLUSH
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            data = compressor.compress(chunk) + compressor.flush(flush_mode)
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+@app.after_request
+def _compress_response(response):
+    """Nén response JSON/JSONL/text bằng zstd hoặc gzip nếu client hỗ trợ"""
+    if (response.direct_passthrough or response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    encoding = _negotiate_encoding()
+    if not encoding:
+        return response
+    
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_BYTES:
+            return response
+        compressor = _compressor(encoding)
+        response.set_data(compressor.compress(data) + compressor.flush())
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+def _wants_jsonl() -> bool:
+    """Client yêu cầu JSONL streaming (?format=jsonl hoặc Accept: application/x-ndjson)"""
+    if request.args.get('format') == 'jsonl':
+        return True
+    return request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson']) == 'application/x-ndjson'
+
+def _stream_jsonl(results: Iterable[Dict], language: str, endpoint: str) -> Response:
+    """
+    Trả về kết quả dạng JSONL, mỗi trang được gửi ngay khi xử lý xong
+    
+    Dòng cuối là bản ghi "summary" với số trang, số lỗi và download_url của
+    transcript tổng hợp; lỗi giữa chừng được gửi dưới dạng bản ghi "error".
+    """
+    records = request.args.get('records', 'page')
+    if records not in JSONL_RECORDS:
+        return jsonify({'error': f'records không hợp lệ. Hỗ trợ: {", ".join(JSONL_RECORDS)}'}), 400
+    
+    def generate():
+        transcripts = []
+        errors = 0
+        try:
+            for index, result in enumerate(results):
+                record_page_metrics([result], language, endpoint)
+                if "error" in result:
+                    errors += 1
+                else:
+                    transcripts.append(result["transcript"])
+                yield b"".join(dumps_json(record) + b"\n"
+                               for record in jsonl_records(result.get("filename"), result, index, records))
+        except (ValueError, zipfile.BadZipFile) as e:
+            # Đầu vào không hợp lệ (ví dụ file nén hỏng) phát hiện khi đang stream
+            logger.warning("Dừng stream kết quả OCR: %s", e)
+            yield dumps_json({"type": "error", "error": str(e)}) + b"\n"
+            return
+        except Exception as e:
+            logger.exception("Lỗi khi stream kết quả OCR: %s", e)
+            yield dumps_json({"type": "error", "error": str(e)}) + b"\n"
+            return
+        
+        summary = {"type": "summary", "pages": len(transcripts) + errors, "errors": errors}
+        if transcripts:
+            file_id, _ = global_ocr_extractor.result_store.put("\n\n".join(transcripts))
+            summary["download_url"] = f"/api/download/{file_id}"
+        yield dumps_json(summary) + b"\n"
+    
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    # Tắt buffer của reverse proxy (nginx) để từng dòng tới client ngay
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @app.route('/api/ocr', methods=['POST'])
+@record_request_metrics
+@limit_concurrency
 def api_ocr():
+    # Multipart đọc từ request.files/request.form, JSON đọc body đúng một lần
+    is_multipart = request.mimetype == 'multipart/form-data'
+    try:
+        data = {} if is_multipart else read_json_body()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
     # Kiểm tra dữ liệu đầu vào
-    if 'image' not in request.files and 'image_data' not in request.json:
+    has_image = 'image' in request.files if is_multipart else bool(data.get('image_data'))
+    if not has_image:
         return jsonify({'error': 'Không tìm thấy hình ảnh trong yêu cầu'}), 400
     
-    # Lấy ngôn ngữ từ form data hoặc query params
-    language = request.form.get('language') or request.args.get('language') or request.json.get('language') or "English"
+    # Lấy ngôn ngữ từ form data, query params hoặc JSON
+    language = request.form.get('language') if is_multipart else data.get('language')
+    language = language or request.args.get('language') or "English"
     if language not in SUPPORTED_LANGUAGES:
         return jsonify({'error': f'Ngôn ngữ không được hỗ trợ. Các ngôn ngữ được hỗ trợ: {", ".join(SUPPORTED_LANGUAGES)}'}), 400
     
     try:
-        if 'image' in request.files:
+        if is_multipart:
             # Xử lý file upload
             image_file = request.files['image']
             if not image_file or not image_file.filename:
                 return jsonify({'error': 'File hình ảnh không hợp lệ'}), 400
                 
-            image_data = image_file.read()
+            image_data = read_upload(image_file, MAX_IMAGE_MB * 1024 * 1024)
             if not image_data:
                 return jsonify({'error': 'Dữ liệu hình ảnh trống'}), 400
                 
             filename = image_file.filename
-            print(f"Xử lý file upload: {filename}, kích thước: {len(image_data)} bytes")
+            logger.debug("Xử lý file upload: %s, kích thước: %d bytes", filename, len(image_data))
+            
+            # Vùng văn bản do client cung cấp (bỏ qua detection)
+            regions = request.form.get('regions')
+            reading_order = request.form.get('reading_order') or request.args.get('reading_order') or "given"
         else:
-            # Xử lý base64 image data
-            image_data_base64 = request.json.get('image_data')
+            # Xử lý base64 image data, bỏ tham chiếu tới chuỗi base64 ngay sau khi decode
+            image_data_base64 = data.pop('image_data', None)
             if not image_data_base64:
                 return jsonify({'error': 'Dữ liệu hình ảnh không hợp lệ'}), 400
             
             # Decode base64
             try:
-                # Xóa prefix nếu có (data:image/jpeg;base64,)
-                if ',' in image_data_base64:
-                    image_data_base64 = image_data_base64.split(',', 1)[1]
-                image_data = base64.b64decode(image_data_base64)
-                filename = request.json.get('filename', 'image.jpg')
-                print(f"Xử lý base64 image: {filename}, kích thước: {len(image_data)} bytes")
+                image_data = decode_base64_image(image_data_base64, MAX_IMAGE_MB * 1024 * 1024)
+                filename = data.get('filename', 'image.jpg')
+                logger.debug("Xử lý base64 image: %s, kích thước: %d bytes", filename, len(image_data))
+            except RequestEntityTooLarge:
+                raise
             except Exception as e:
-                print(f"Lỗi decode base64: {str(e)}")
+                logger.debug("Lỗi decode base64: %s", e)
                 return jsonify({'error': f'Không thể decode dữ liệu hình ảnh: {str(e)}'}), 400
+            finally:
+                del image_data_base64
+            
+            # Vùng văn bản do client cung cấp (bỏ qua detection)
+            regions = data.get('regions')
+            reading_order = data.get('reading_order') or request.args.get('reading_order') or "given"
+        
+        if regions is not None:
+            if reading_order not in READING_ORDERS:
+                return jsonify({'error': f'reading_order không hợp lệ. Hỗ trợ: {", ".join(READING_ORDERS)}'}), 400
+            try:
+                regions = parse_regions(regions)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
         
         # Xử lý OCR
-        print(f"Bắt đầu OCR với ngôn ngữ: {language}")
-        result = global_ocr_extractor.process_image_data(image_data, language)
+        logger.debug("Bắt đầu OCR với ngôn ngữ: %s", language)
+        result = global_ocr_extractor.process_image_data(image_data, language, filename, regions, reading_order)
+        record_page_metrics([result], language, 'api_ocr')
         
         # Tạo URL để download kết quả
         download_url = f"/api/download/{result['file_id']}"
-        print(f"OCR hoàn thành, tạo download URL: {download_url}")
+        logger.debug("OCR hoàn thành, tạo download URL: %s", download_url)
         
         return jsonify({
             'success': True,
@@ -547,27 +4796,699 @@ def api_ocr():
             'download_url': download_url
         })
     
+    except RequestEntityTooLarge as e:
+        return _too_large_response(e.description)
+    except Exception as e:
+        logger.exception("Lỗi xử lý OCR: %s", e)
+        import traceback
+        return jsonify({
+            'error': str(e),
+            'traceback': traceback.format_exc() if app.debug else None
+        }), 500
+
+def _parse_batch_request():
+    """
+    Đọc danh sách hình ảnh, ngôn ngữ và batch_size từ yêu cầu
+    
+    Nhận multipart với nhiều file trường 'images' (hoặc 'image'), hoặc JSON
+    {"images": [{"image_data": "<base64>", "filename": "..."}, ...], "language": "..."}.
+    
+    Returns:
+        (images, language, batch_size, error) với error là response lỗi hoặc None
+    """
+    is_multipart = request.mimetype == 'multipart/form-data'
+    try:
+        data = {} if is_multipart else read_json_body()
+    except ValueError as e:
+        return None, None, None, (jsonify({'error': str(e)}), 400)
+    form = request.form if is_multipart else {}
+    
+    # Lấy ngôn ngữ từ form data, query params hoặc JSON
+    language = form.get('language') or request.args.get('language') or data.get('language') or "English"
+    if language not in SUPPORTED_LANGUAGES:
+        return None, language, None, (jsonify({'error': f'Ngôn ngữ không được hỗ trợ. Các ngôn ngữ được hỗ trợ: {", ".join(SUPPORTED_LANGUAGES)}'}), 400)
+    
+    batch_size = form.get('batch_size') or request.args.get('batch_size') or data.get('batch_size') or DEFAULT_BATCH_SIZE
+    try:
+        batch_size = int(batch_size)
+    except (TypeError, ValueError):
+        return None, language, None, (jsonify({'error': 'batch_size không hợp lệ'}), 400)
+    
+    images = []
+    max_image_bytes = MAX_IMAGE_MB * 1024 * 1024
+    upload_files = (request.files.getlist('images') or request.files.getlist('image')) if is_multipart else []
+    items = None if upload_files else data.get('images')
+    # Kiểm tra số lượng trước khi đọc và giải mã dữ liệu của từng ảnh
+    count = len(upload_files) if upload_files else len(items) if isinstance(items, list) else 0
+    if count > MAX_BATCH_IMAGES:
+        return None, language, batch_size, (jsonify({'error': f'Quá nhiều hình ảnh, tối đa {MAX_BATCH_IMAGES} hình ảnh mỗi yêu cầu'}), 400)
+    
+    if upload_files:
+        # Xử lý file upload
+        for index, image_file in enumerate(upload_files):
+            try:
+                image_data = read_upload(image_file, max_image_bytes)
+            except RequestEntityTooLarge as e:
+                return None, language, batch_size, _too_large_response(f'{image_file.filename}: {e.description}')
+            if not image_data:
+                return None, language, batch_size, (jsonify({'error': f'Dữ liệu hình ảnh trống: {image_file.filename}'}), 400)
+            images.append((image_file.filename or f"image_{index}.jpg", image_data))
+    else:
+        # Xử lý danh sách base64 image data
+        if not isinstance(items, list):
+            return None, language, batch_size, (jsonify({'error': 'Không tìm thấy hình ảnh trong yêu cầu'}), 400)
+        
+        for index, item in enumerate(items):
+            if isinstance(item, str):
+                item = {'image_data': item}
+            if not isinstance(item, dict) or not item.get('image_data'):
+                return None, language, batch_size, (jsonify({'error': f'Dữ liệu hình ảnh không hợp lệ tại vị trí {index}'}), 400)
+            try:
+                image_data = decode_base64_image(item.pop('image_data'), max_image_bytes)
+            except RequestEntityTooLarge as e:
+                return None, language, batch_size, _too_large_response(f'Vị trí {index}: {e.description}')
+            except Exception as e:
+                return None, language, batch_size, (jsonify({'error': f'Không thể decode dữ liệu hình ảnh tại vị trí {index}: {str(e)}'}), 400)
+            images.append((item.get('filename', f"image_{index}.jpg"), image_data))
+    
+    if not images:
+        return None, language, batch_size, (jsonify({'error': 'Không tìm thấy hình ảnh trong yêu cầu'}), 400)
+    
+    return images, language, batch_size, None
+
+def _format_page_result(result: Dict) -> Dict:
+    """Định dạng kết quả một trang cho API (kèm download_url)"""
+    if 'error' in result:
+        return {'success': False, 'filename': result['filename'], 'error': result['error']}
+    return {
+        'success': True,
+        'blocks': result['blocks'],
+        'transcript': result['transcript'],
+        'filename': result['filename'],
+        'download_url': f"/api/download/{result['file_id']}"
+    }
+
+@app.route('/api/ocr/batch', methods=['POST'])
+@record_request_metrics
+@limit_concurrency
+def api_ocr_batch():
+    """Endpoint OCR nhiều hình ảnh trong một yêu cầu"""
+    try:
+        images, language, batch_size, error = _parse_batch_request()
+        if error:
+            return error
+        
+        # Xử lý OCR
+        logger.debug("Bắt đầu OCR batch %d hình ảnh với ngôn ngữ: %s", len(images), language)
+        if _wants_jsonl():
+            return _stream_jsonl(global_ocr_extractor.iter_batch_data(images, language, batch_size),
+                                 language, 'api_ocr_batch')
+        batch_result = global_ocr_extractor.process_batch_data(images, language, batch_size)
+        record_page_metrics(batch_result['results'], language, 'api_ocr_batch')
+        
+        return jsonify({
+            'success': True,
+            'results': [_format_page_result(result) for result in batch_result['results']],
+            'transcript': batch_result['transcript'],
+            'download_url': f"/api/download/{batch_result['file_id']}"
+        })
+    
+    except Exception as e:
+        logger.exception("Lỗi xử lý OCR batch: %s", e)
+        import traceback
+        return jsonify({
+            'error': str(e),
+            'traceback': traceback.format_exc() if app.debug else None
+        }), 500
+
+@app.route('/api/ocr/archive', methods=['POST'])
+@record_request_metrics
+@limit_concurrency
+def api_ocr_archive():
+    """Endpoint OCR tất cả hình ảnh trong một file nén (.cbz, .zip, .tar) upload ở trường 'archive'"""
+    archive_file = request.files.get('archive') or request.files.get('file')
+    if not archive_file or not archive_file.filename:
+        return jsonify({'error': 'Không tìm thấy file nén trong yêu cầu'}), 400
+    
+    language = request.form.get('language') or request.args.get('language') or "English"
+    if language not in SUPPORTED_LANGUAGES:
+        return jsonify({'error': f'Ngôn ngữ không được hỗ trợ. Các ngôn ngữ được hỗ trợ: {", ".join(SUPPORTED_LANGUAGES)}'}), 400
+    
+    try:
+        batch_size = int(request.form.get('batch_size') or request.args.get('batch_size') or DEFAULT_BATCH_SIZE)
+    except ValueError:
+        return jsonify({'error': 'batch_size không hợp lệ'}), 400
+    
+    try:
+        # Đọc trực tiếp từ file upload (werkzeug lưu file lớn vào file tạm), không giải nén ra đĩa
+        logger.debug("Bắt đầu OCR file nén %s với ngôn ngữ: %s", archive_file.filename, language)
+        if _wants_jsonl():
+            # Tách stream khỏi request: Flask đóng các file upload khi view trả về,
+            # trước khi response streaming bắt đầu đọc file nén
+            archive_stream = archive_file.stream
+            archive_file.stream = BytesIO()
+            
+            def pages():
+                try:
+                    yield from iter_archive_images(archive_stream)
+                finally:
+                    archive_stream.close()
+            
+            return _stream_jsonl(global_ocr_extractor.iter_batch_data(pages(), language, batch_size),
+                                 language, 'api_ocr_archive')
+        batch_result = global_ocr_extractor.process_batch_data(iter_archive_images(archive_file.stream), language, batch_size)
+    except (ValueError, zipfile.BadZipFile) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.exception("Lỗi xử lý OCR file nén: %s", e)
+        import traceback
+        return jsonify({
+            'error': str(e),
+            'traceback': traceback.format_exc() if app.debug else None
+        }), 500
+    
+    record_page_metrics(batch_result['results'], language, 'api_ocr_archive')
+    return jsonify({
+        'success': True,
+        'filename': archive_file.filename,
+        'results': [_format_page_result(result) for result in batch_result['results']],
+        'transcript': batch_result['transcript'],
+        'download_url': f"/api/download/{batch_result['file_id']}"
+    })
+
+class JobQueue:
+    """
+    Hàng đợi job OCR bất đồng bộ
+    
+    Job được xử lý bởi concurrency luồng worker trong process hiện tại, mỗi
+    batch chiếm một chỗ trong request_limiter nên job không vượt quá giới hạn
+    xử lý đồng thời của worker. Mặc định trạng thái job nằm trong bộ nhớ; khi
+    có db_path, job và dữ liệu ảnh được lưu vào sqlite: worker của mọi process
+    nhận job đang chờ trực tiếp từ sqlite (UPDATE ... WHERE status = 'queued'),
+    nên job của worker đã chết hoặc của lần chạy trước vẫn được xử lý tiếp.
+    
+    Job đang chạy trong sqlite được giữ bằng lease như WorkQueue: owner là
+    hostname:pid:token của process, lease được gia hạn định kỳ trong khi
+    process còn chạy; job có lease hết hạn được đưa lại về 'queued'. Hạn lease
+    so theo đồng hồ của từng máy nên khi dùng chung file sqlite giữa nhiều máy,
+    các máy phải đồng bộ giờ (NTP).
+    """
+    
+    def __init__(self, extractor: OCRExtractor, concurrency: int = JOB_CONCURRENCY,
+                 max_pending: int = JOB_QUEUE_SIZE, db_path: str = JOB_DB_PATH, ttl: float = JOB_TTL,
+                 lease_seconds: float = JOB_LEASE_SECONDS):
+        self.extractor = extractor
+        self.concurrency = max(1, concurrency)
+        self.max_pending = max_pending
+        self.db_path = db_path
+        self.ttl = ttl
+        if lease_seconds < MIN_LEASE_SECONDS:
+            logger.warning("Thời gian lease job %.0fs quá ngắn so với độ lệch đồng hồ giữa các máy, dùng %.0fs",
+                           lease_seconds, MIN_LEASE_SECONDS)
+        self.lease_seconds = max(MIN_LEASE_SECONDS, lease_seconds)
+        
+        self._jobs = {}
+        self._images = {}
+        self._queue = queue.Queue()
+        self._lock = threading.RLock()
+        self._changed = threading.Condition()
+        self._wakeup = threading.Event()
+        self._db = None
+        self._started_pid = None
+        self._owner = None
+    
+    def start(self) -> None:
+        """Khởi động luồng worker khi server khởi động (không chờ yêu cầu đầu tiên)"""
+        self._ensure_started()
+    
+    def _ensure_started(self) -> None:
+        """Mở sqlite và khởi động luồng worker trong process hiện tại (sau khi fork)"""
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+            self._owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+            self._queue = queue.Queue()
+            
+            if self.db_path:
+                db_dir = os.path.dirname(self.db_path)
+                if db_dir and not os.path.exists(db_dir):
+                    os.makedirs(db_dir)
+                # isolation_level=None: tự quản lý transaction (BEGIN IMMEDIATE khi tạo và nhận job)
+                self._db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30, isolation_level=None)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS jobs ("
+                    "id TEXT PRIMARY KEY, status TEXT NOT NULL, owner TEXT, lease_until REAL, "
+                    "updated REAL NOT NULL, state TEXT NOT NULL)"
+                )
+                # File tạo bởi phiên bản cũ (owner là pid, chưa có lease): job đang chạy được coi như lease đã hết hạn
+                columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+                if "lease_until" not in columns:
+                    self._db.execute("ALTER TABLE jobs ADD COLUMN lease_until REAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS job_images ("
+                    "job_id TEXT NOT NULL, idx INTEGER NOT NULL, filename TEXT NOT NULL, data BLOB NOT NULL, "
+                    "PRIMARY KEY (job_id, idx))"
+                )
+                self._db.commit()
+                threading.Thread(target=self._heartbeat, name="ocr-job-lease", daemon=True).start()
+            
+            for i in range(self.concurrency):
+                threading.Thread(target=self._worker, name=f"ocr-job-{i}", daemon=True).start()
+    
+    def _heartbeat(self) -> None:
+        """Gia hạn lease các job đang chạy của process hiện tại"""
+        while True:
+            time.sleep(self.lease_seconds / 3)
+            try:
+                with self._lock:
+                    self._db.execute("UPDATE jobs SET lease_until = ? WHERE status = 'running' AND owner = ?",
+                                     (time.time() + self.lease_seconds, self._owner))
+                    self._db.commit()
+            except sqlite3.Error as e:
+                logger.error("Không gia hạn được lease job: %s", e)
+    
+    def _requeue_orphans(self) -> None:
+        """Đưa lại về 'queued' các job đang chạy có lease đã hết hạn (gọi trong transaction)"""
+        rows = self._db.execute("SELECT id, owner FROM jobs WHERE status = 'running' "
+                                "AND (lease_until IS NULL OR lease_until < ?)", (time.time(),)).fetchall()
+        for job_id, owner in rows:
+            self._db.execute("UPDATE jobs SET status = 'queued', owner = NULL, lease_until = NULL WHERE id = ?",
+                             (job_id,))
+            logger.info("Tiếp tục job %s của worker %s đã dừng", job_id, owner)
+    
+    def _owns(self, job_id: str) -> bool:
+        """Process hiện tại còn giữ lease của job không (luôn đúng với hàng đợi trong bộ nhớ)"""
+        if self._db is None:
+            return True
+        with self._lock:
+            row = self._db.execute("SELECT owner FROM jobs WHERE id = ? AND status = 'running'", (job_id,)).fetchone()
+        return row is not None and row[0] == self._owner
+    
+    def _claim_next(self) -> Optional[str]:
+        """Nhận job đang chờ lâu nhất trong sqlite; trả về None nếu không có"""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._requeue_orphans()
+                row = self._db.execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY updated LIMIT 1").fetchone()
+                if row is not None:
+                    self._db.execute("UPDATE jobs SET status = 'running', owner = ?, lease_until = ? "
+                                     "WHERE id = ? AND status = 'queued'",
+                                     (self._owner, time.time() + self.lease_seconds, row[0]))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        self._update(row[0], status='running')
+        return row[0]
+    
+    def submit(self, images: List[Tuple[str, bytes]], language: str,
+               batch_size: int = DEFAULT_BATCH_SIZE) -> Optional[str]:
+        """
+        Tạo job mới
+        
+        Returns:
+            ID của job, hoặc None nếu hàng đợi đã đầy
+        """
+        self._ensure_started()
+        self._cleanup()
+        
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        state = {
+            'job_id': job_id,
+            'status': 'queued',
+            'language': language,
+            'batch_size': batch_size,
+            'total': len(images),
+            'completed': 0,
+            'filenames': [filename for filename, _ in images],
+            'results': [None] * len(images),
+            'transcript': None,
+            'file_id': None,
+            'error': None,
+            'created': now,
+            'updated': now
+        }
+        
+        # Kiểm tra số job đang chờ và thêm job trong cùng một transaction (hoặc cùng lock)
+        with self._lock:
+            if self._db is not None:
+                self._db.execute("BEGIN IMMEDIATE")
+                try:
+                    if self.pending() >= self.max_pending:
+                        self._db.execute("ROLLBACK")
+                        return None
+                    self._db.execute("INSERT INTO jobs (id, status, owner, lease_until, updated, state) "
+                                     "VALUES (?, 'queued', NULL, NULL, ?, ?)",
+                                     (job_id, now, json.dumps(state, ensure_ascii=False)))
+                    self._db.executemany("INSERT INTO job_images (job_id, idx, filename, data) VALUES (?, ?, ?, ?)",
+                                         [(job_id, i, filename, data) for i, (filename, data) in enumerate(images)])
+                    self._db.execute("COMMIT")
+                except BaseException:
+                    self._db.execute("ROLLBACK")
+                    raise
+                self._wakeup.set()
+            else:
+                if self.pending() >= self.max_pending:
+                    return None
+                self._jobs[job_id] = state
+                self._images[job_id] = images
+                self._queue.put(job_id)
+        
+        logger.debug("Tạo job %s: %d hình ảnh, ngôn ngữ %s", job_id, len(images), language)
+        return job_id
+    
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Lấy bản sao trạng thái job"""
+        with self._lock:
+            if self.db_path:
+                self._ensure_started()
+                row = self._db.execute("SELECT state FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                return json.loads(row[0]) if row else None
+            state = self._jobs.get(job_id)
+            return json.loads(json.dumps(state)) if state is not None else None
+    
+    def pending(self) -> int:
+        """Số job đang chờ hoặc đang chạy"""
+        with self._lock:
+            if self._db is not None:
+                return self._db.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')").fetchone()[0]
+            return sum(1 for state in self._jobs.values() if state['status'] in ('queued', 'running'))
+    
+    def wait_for_change(self, timeout: float = 1.0) -> None:
+        """Chờ đến khi có job được cập nhật (hoặc hết timeout)"""
+        with self._changed:
+            self._changed.wait(timeout)
+    
+    def stats(self) -> Dict:
+        """Thống kê cho /api/status"""
+        return {
+            'concurrency': self.concurrency,
+            'pending': self.pending(),
+            'max_pending': self.max_pending,
+            'backend': 'sqlite' if self.db_path else 'memory'
+        }
+    
+    def _update(self, job_id: str, **changes) -> Dict:
+        """Cập nhật trạng thái job và báo cho các luồng đang chờ"""
+        with self._lock:
+            if self._db is not None:
+                row = self._db.execute("SELECT state FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                state = json.loads(row[0])
+            else:
+                state = self._jobs[job_id]
+            
+            results = changes.pop('page_results', None)
+            if results:
+                for index, result in results:
+                    state['results'][index] = result
+                state['completed'] = sum(1 for result in state['results'] if result is not None)
+            state.update(changes)
+            state['updated'] = time.time()
+            
+            if self._db is not None:
+                self._db.execute("UPDATE jobs SET status = ?, updated = ?, state = ? WHERE id = ?",
+                                 (state['status'], state['updated'], json.dumps(state, ensure_ascii=False), job_id))
+                self._db.commit()
+        
+        with self._changed:
+            self._changed.notify_all()
+        return state
+    
+    def _claim(self, job_id: str) -> bool:
+        """Nhận job trong bộ nhớ để xử lý; trả về False nếu job không còn ở trạng thái chờ"""
+        with self._lock:
+            if self._jobs.get(job_id, {}).get('status') != 'queued':
+                return False
+        self._update(job_id, status='running')
+        return True
+    
+    def _load_images(self, job_id: str) -> List[Tuple[str, bytes]]:
+        with self._lock:
+            if self._db is not None:
+                return [(filename, data) for filename, data in self._db.execute(
+                    "SELECT filename, data FROM job_images WHERE job_id = ? ORDER BY idx", (job_id,))]
+            return self._images[job_id]
+    
+    def _release_images(self, job_id: str) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.execute("DELETE FROM job_images WHERE job_id = ?", (job_id,))
+                self._db.commit()
+            else:
+                self._images.pop(job_id, None)
+    
+    def _next_job(self) -> str:
+        """Chờ job tiếp theo: từ hàng đợi trong bộ nhớ, hoặc nhận trực tiếp từ sqlite"""
+        if self._db is None:
+            while True:
+                job_id = self._queue.get()
+                if self._claim(job_id):
+                    return job_id
+        while True:
+            job_id = None if request_limiter.draining else self._claim_next()
+            if job_id is not None:
+                return job_id
+            # Job do worker khác tạo chỉ thấy được qua sqlite: kiểm tra lại định kỳ
+            self._wakeup.wait(JOB_POLL_INTERVAL)
+            self._wakeup.clear()
+    
+    def _worker(self) -> None:
+        while True:
+            # Server đang tắt: không nhận job mới, để worker khác (hoặc lần chạy sau) xử lý
+            if request_limiter.draining:
+                time.sleep(JOB_POLL_INTERVAL)
+                continue
+            try:
+                job_id = self._next_job()
+            except sqlite3.Error as e:
+                logger.error("Lỗi khi nhận job từ sqlite: %s", e)
+                time.sleep(JOB_POLL_INTERVAL)
+                continue
+            with log_context(job_id) as context:
+                start = time.perf_counter()
+                try:
+                    if not self._run(job_id):
+                        continue
+                except Exception as e:
+                    logger.exception("Lỗi khi xử lý job %s: %s", job_id, e)
+                    self._update(job_id, status='failed', error=str(e))
+                    self._release_images(job_id)
+                    continue
+                
+                duration = time.perf_counter() - start
+                level = logging.WARNING if duration >= SLOW_REQUEST_SECONDS else logging.DEBUG
+                if logger.isEnabledFor(level):
+                    logger.log(level, "Hoàn thành job %s trong %.1f ms", job_id, duration * 1000,
+                               extra={"job_id": job_id, "duration_ms": round(duration * 1000, 2),
+                                      "stage_timings": _stage_timings_ms(context)})
+    
+    def _run(self, job_id: str) -> bool:
+        """
+        Xử lý job theo từng batch và cập nhật tiến độ sau mỗi batch
+        
+        Returns:
+            False nếu server đang tắt: job được trả về 'queued' để worker khác xử lý tiếp
+        """
+        state = self.get(job_id)
+        images = self._load_images(job_id)
+        language = state['language']
+        batch_size = max(1, state['batch_size'])
+        QUEUE_WAIT_SECONDS.observe(max(0.0, time.time() - state['created']), queue="jobs")
+        
+        transcripts = []
+        for start in range(0, len(images), batch_size):
+            # Bỏ qua các trang đã xong trước khi worker bị khởi động lại
+            if all(result is not None for result in state['results'][start:start + batch_size]):
+                transcripts.extend(r['transcript'] for r in state['results'][start:start + batch_size] if r['success'])
+                continue
+            
+            # Lease đã hết hạn và job được worker khác nhận lại: dừng, không ghi đè tiến độ của worker đó
+            if not self._owns(job_id):
+                logger.warning("Mất lease của job %s, dừng xử lý", job_id)
+                return False
+            
+            page_results = []
+            if not request_limiter.acquire(background=True):
+                logger.info("Server đang tắt, trả job %s về hàng đợi", job_id)
+                with self._lock:
+                    if self._db is not None:
+                        self._db.execute("UPDATE jobs SET status = 'queued', owner = NULL, lease_until = NULL "
+                                         "WHERE id = ? AND owner = ?", (job_id, self._owner))
+                self._update(job_id, status='queued')
+                return False
+            try:
+                batch_results = self.extractor.process_batch(images[start:start + batch_size], language, batch_size)
+            finally:
+                request_limiter.release()
+            record_page_metrics(batch_results, language, 'jobs')
+            for offset, result in enumerate(batch_results):
+                if 'error' not in result:
+                    self.extractor._store_transcript(result)
+                    transcripts.append(result['transcript'])
+                page_results.append((start + offset, _format_page_result(result)))
+            state = self._update(job_id, page_results=page_results)
+        
+        # Transcript tổng hợp của cả job
+        combined = {"transcript": "\n\n".join(transcripts)}
+        self.extractor._store_transcript(combined)
+        self._update(job_id, status='done', transcript=combined['transcript'], file_id=combined['file_id'])
+        self._release_images(job_id)
+        return True
+    
+    def _cleanup(self) -> None:
+        """Xoá các job đã kết thúc quá thời gian giữ lại"""
+        expire_before = time.time() - self.ttl
+        with self._lock:
+            if self._db is not None:
+                self._db.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated < ?", (expire_before,))
+                self._db.commit()
+            else:
+                for job_id in [job_id for job_id, state in self._jobs.items()
+                               if state['status'] in ('done', 'failed') and state['updated'] < expire_before]:
+                    del self._jobs[job_id]
+
+def _job_response(job: Dict) -> Dict:
+    """Định dạng trạng thái job cho API"""
+    response = {
+        'job_id': job['job_id'],
+        'status': job['status'],
+        'language': job['language'],
+        'total': job['total'],
+        'completed': job['completed'],
+        'results': [result for result in job['results'] if result is not None],
+        'error': job['error']
+    }
+    if job['status'] == 'done':
+        response['transcript'] = job['transcript']
+        response['download_url'] = f"/api/download/{job['file_id']}"
+    return response
+
+# Hàng đợi job bất đồng bộ (luồng worker được khởi động cùng server: run_server, init_server_worker)
+job_queue = JobQueue(global_ocr_extractor)
+
+# Gauge đọc trực tiếp trạng thái hiện tại khi scrape
+metrics.gauge("ocr_in_flight_requests", "Số yêu cầu OCR đang xử lý",
+              callback=lambda: request_limiter.in_flight)
+metrics.gauge("ocr_queue_depth", "Số yêu cầu hoặc job đang chờ trong hàng đợi", ("queue",),
+              callback=lambda: {("request",): request_limiter.waiting, ("jobs",): job_queue.pending()})
+metrics.gauge("ocr_loaded_engines", "Số instance OCR engine đang được tải", ("engine",),
+              callback=lambda: {(key,): engine["instances"]
+                                for key, engine in global_ocr_extractor.ocr_engines.stats()["engines"].items()})
+metrics.gauge("ocr_engine_resident_bytes", "Bộ nhớ ước tính của các OCR engine đang được tải",
+              callback=lambda: global_ocr_extractor.ocr_engines.resident_bytes())
+def _cache_lookups() -> Dict:
+    lookups = {}
+    for name, cache in (("result", global_ocr_extractor.result_cache),
+                        ("detection", global_ocr_extractor.detection_cache),
+                        ("crop", global_ocr_extractor.crop_cache)):
+        if cache is not None:
+            stats = cache.stats()
+            lookups[(name, "hit")] = stats["hits"] + stats.get("disk_hits", 0)
+            lookups[(name, "miss")] = stats["misses"]
+    return lookups
+
+metrics.counter("ocr_cache_lookups_total", "Số lần tra cứu cache (result, detection, crop) theo kết quả",
+                ("cache", "result"), callback=_cache_lookups)
+metrics.gauge("ocr_ready", "1 nếu worker đã warm-up và sẵn sàng nhận yêu cầu",
+              callback=lambda: int(global_ocr_extractor.ready and not request_limiter.draining))
+metrics.gauge("ocr_worker_info", "Thông tin worker hiện tại", ("pid", "device"),
+              callback=lambda: {(str(os.getpid()), global_ocr_extractor.device): 1})
+
+@app.route('/api/jobs', methods=['POST'])
+@record_request_metrics
+def api_create_job():
+    """Tạo job OCR bất đồng bộ, trả về job ID ngay lập tức"""
+    try:
+        images, language, batch_size, error = _parse_batch_request()
+        if error:
+            return error
+        
+        job_id = job_queue.submit(images, language, batch_size)
+        if job_id is None:
+            response = jsonify({'error': 'Hàng đợi job đã đầy, vui lòng thử lại sau'})
+            response.headers['Retry-After'] = '30'
+            return response, 429
+        
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status_url': f"/api/jobs/{job_id}",
+            'events_url': f"/api/jobs/{job_id}/events"
+        }), 202
+    
     except Exception as e:
+        logger.exception("Lỗi khi tạo job: %s", e)
         import traceback
-        error_traceback = traceback.format_exc()
-        print(f"Lỗi xử lý OCR: {str(e)}")
-        print(error_traceback)
         return jsonify({
             'error': str(e),
-            'traceback': error_traceback if app.debug else None
+            'traceback': traceback.format_exc() if app.debug else None
         }), 500
 
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def api_get_job(job_id):
+    """Trạng thái và kết quả (đến thời điểm hiện tại) của job"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job không tồn tại'}), 404
+    return jsonify(_job_response(job))
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def api_job_events(job_id):
+    """Server-Sent Events: một sự kiện 'page' cho mỗi trang xong và 'done'/'failed' khi kết thúc"""
+    if job_queue.get(job_id) is None:
+        return jsonify({'error': 'Job không tồn tại'}), 404
+    
+    def format_event(event, data):
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    
+    def generate():
+        sent = set()
+        while True:
+            job = job_queue.get(job_id)
+            if job is None:
+                yield format_event('failed', {'job_id': job_id, 'error': 'Job không tồn tại'})
+                return
+            
+            for index, result in enumerate(job['results']):
+                if result is not None and index not in sent:
+                    sent.add(index)
+                    yield format_event('page', {
+                        'job_id': job_id,
+                        'index': index,
+                        'completed': job['completed'],
+                        'total': job['total'],
+                        **result
+                    })
+            
+            if job['status'] in ('done', 'failed'):
+                response = _job_response(job)
+                response.pop('results')
+                yield format_event(job['status'], response)
+                return
+            
+            # Gửi comment giữ kết nối trong khi chờ
+            yield ": keep-alive\n\n"
+            job_queue.wait_for_change(1.0)
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/api/download/<file_id>', methods=['GET'])
 def download_result(file_id):
     # Kiểm tra tính hợp lệ của file_id để tránh path traversal
-    if not file_id or '..' in file_id or '/' in file_id:
+    if not ResultStore.ID_PATTERN.match(file_id or ''):
         return jsonify({'error': 'ID file không hợp lệ'}), 400
     
-    file_path = os.path.join(TEMP_DIR, f"{file_id}.txt")
-    if not os.path.exists(file_path):
-        return jsonify({'error': 'File không tồn tại'}), 404
+    data = global_ocr_extractor.result_store.get(file_id)
+    if data is None:
+        return jsonify({'error': 'File không tồn tại hoặc đã hết hạn'}), 404
     
-    return send_file(file_path, as_attachment=True, download_name="ocr_result.txt", mimetype="text/plain")
+    return send_file(BytesIO(data), as_attachment=True, download_name="ocr_result.txt", mimetype="text/plain")
 
 @app.route('/api/languages', methods=['GET'])
 def get_languages():
@@ -600,6 +5521,10 @@ def api_status():
         cuda_available = torch.cuda.is_available()
         device = global_ocr_extractor.device
         
+        # Thống kê cache kết quả
+        result_cache = global_ocr_extractor.result_cache
+        detection_cache = global_ocr_extractor.detection_cache
+        
         return jsonify({
             'status': 'ok',
             'version': '1.0.0',
@@ -616,7 +5541,36 @@ def api_status():
             'ocr_engines': {
                 'initialized': ocr_initialized,
                 'count': len(global_ocr_extractor.ocr_engines),
-                'languages': list(global_ocr_extractor.ocr_engines.keys())
+                'keys': global_ocr_extractor.ocr_engines.keys(),
+                'languages': [
+                    language for language in SUPPORTED_LANGUAGES
+                    if global_ocr_extractor._engine_key(language) in global_ocr_extractor.ocr_engines
+                ],
+                **global_ocr_extractor.ocr_engines.stats()
+            },
+            'result_cache': {
+                'enabled': result_cache is not None,
+                **(result_cache.stats() if result_cache is not None else {})
+            },
+            'detection_cache': {
+                'enabled': detection_cache is not None,
+                **(detection_cache.stats() if detection_cache is not None else {})
+            },
+            'result_store': global_ocr_extractor.result_store.stats(),
+            'crop_cache': {
+                'enabled': global_ocr_extractor.crop_cache is not None,
+                **(global_ocr_extractor.crop_cache.stats() if global_ocr_extractor.crop_cache is not None else {})
+            },
+            'server': {
+                'pid': os.getpid(),
+                **request_limiter.stats()
+            },
+            'jobs': job_queue.stats(),
+            'liveness': 'ok',
+            'readiness': {
+                'ready': global_ocr_extractor.ready and not request_limiter.draining,
+                'preload_languages': PRELOAD_LANGUAGES,
+                'warmup_seconds': global_ocr_extractor.warmup_seconds
             }
         })
     except Exception as e:
@@ -627,6 +5581,21 @@ def api_status():
             'traceback': traceback.format_exc()
         }), 500
 
+@app.route('/metrics', methods=['GET'])
+def api_metrics():
+    """Metric theo định dạng text của Prometheus (của mọi worker khi có METRICS_DIR)"""
+    if METRICS_DIR:
+        body = metrics.render_directory(METRICS_DIR, METRICS_FLUSH_SECONDS * 3)
+    else:
+        body = metrics.render()
+    return Response(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/ready', methods=['GET'])
+def api_ready():
+    """Readiness probe: 200 khi model đã warm-up, 503 khi chưa sẵn sàng hoặc đang tắt"""
+    ready = global_ocr_extractor.ready and not request_limiter.draining
+    return jsonify({'ready': ready}), 200 if ready else 503
+
 @app.route('/')
 def serve_index():
     return send_file('index.html')
@@ -640,11 +5609,135 @@ def serve_static(path):
 
 def run_server(host='0.0.0.0', port=5000, debug=False):
     """Chạy REST API server"""
+    job_queue.start()
     app.run(host=host, port=port, debug=debug)
 
+def init_server_worker():
+    """Chuẩn bị extractor toàn cục trong worker trước khi nhận yêu cầu"""
+    # Luồng ghi log không còn sau khi fork, khởi động lại trong từng worker
+    _start_log_listener()
+    
+    # Kết nối sqlite không dùng chung được sau khi fork, mở lại trong từng worker
+    result_cache = global_ocr_extractor.result_cache
+    if result_cache is not None and result_cache.db_path:
+        global_ocr_extractor.result_cache = ResultCache(
+            result_cache.max_bytes, os.path.dirname(result_cache.db_path), result_cache.disk_max_bytes
+        )
+    
+    configure_torch_threads(TORCH_THREADS)
+    
+    logger.info("Worker %d: đang tải model và warm-up...", os.getpid())
+    global_ocr_extractor.warm_up(PRELOAD_LANGUAGES)
+    job_queue.start()
+    if METRICS_DIR:
+        metrics.start_snapshots(METRICS_DIR, METRICS_FLUSH_SECONDS)
+    logger.info("Worker %d: sẵn sàng nhận yêu cầu", os.getpid())
+
+def run_production_server(host='0.0.0.0', port=5000, workers=1, threads=0,
+                          graceful_timeout=GRACEFUL_TIMEOUT):
+    """
+    Chạy server production nhiều worker
+    
+    Dùng gunicorn (worker gthread) nếu đã cài đặt; mỗi worker tải model một lần
+    trước khi nhận yêu cầu. Nếu không có gunicorn (ví dụ trên Windows) thì chạy
+    một process với server đa luồng của werkzeug.
+    
+    Args:
+        host: Host để bind server
+        port: Port để bind server
+        workers: Số process worker
+        threads: Số luồng nhận yêu cầu trong mỗi worker; 0 để lấy đủ cho request_limiter
+            (max_concurrency + max_queue, cộng thêm luồng cho các endpoint không giới hạn)
+        graceful_timeout: Thời gian chờ các yêu cầu đang xử lý khi tắt server
+    """
+    # Mỗi yêu cầu chờ trong request_limiter giữ một luồng của gunicorn: thiếu luồng thì
+    # hàng đợi không bao giờ đầy, yêu cầu thừa nằm im trong backlog thay vì nhận 429
+    required_threads = request_limiter.max_concurrency + request_limiter.max_queue
+    if threads <= 0:
+        threads = required_threads + SERVER_EXTRA_THREADS
+    elif threads < required_threads:
+        raise ValueError(f"Số luồng mỗi worker ({threads}) phải >= max_concurrency + max_queue ({required_threads})")
+    
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        BaseApplication = None
+    
+    if BaseApplication is None:
+        if workers > 1:
+            logger.warning("Không tìm thấy gunicorn, chạy 1 worker với server đa luồng của werkzeug")
+        _run_threaded_server(host, port, graceful_timeout)
+        return
+    
+    global METRICS_DIR
+    if workers > 1 and not METRICS_DIR:
+        # Mỗi lần scrape chỉ rơi vào một worker: các worker chia sẻ metric qua thư mục chung
+        import shutil
+        import tempfile
+        METRICS_DIR = tempfile.mkdtemp(prefix="ocr-metrics-")
+        master_pid = os.getpid()
+        atexit.register(lambda: os.getpid() == master_pid and shutil.rmtree(METRICS_DIR, ignore_errors=True))
+        logger.info("Metric của các worker được gộp qua %s", METRICS_DIR)
+    
+    class OCRServerApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{host}:{port}")
+            self.cfg.set("workers", max(1, workers))
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("threads", max(1, threads))
+            self.cfg.set("timeout", 0)
+            self.cfg.set("graceful_timeout", int(graceful_timeout))
+            self.cfg.set("post_worker_init", _init_gunicorn_worker)
+        
+        def load(self):
+            return app
+    
+    logger.info("Khởi động OCR server (gunicorn) tại %s:%d với %d workers x %d threads", host, port, workers, threads)
+    OCRServerApplication().run()
+
+def _init_gunicorn_worker(worker) -> None:
+    """
+    Khởi tạo worker gunicorn và bắt SIGTERM để ngừng nhận yêu cầu OCR mới
+    
+    Worker gthread tự chờ các yêu cầu đang xử lý (graceful_timeout) khi tắt;
+    ở đây chỉ đánh dấu request_limiter đang tắt (không chờ) để các yêu cầu
+    đến sau nhận 503 thay vì bắt đầu xử lý.
+    """
+    init_server_worker()
+    handle_exit = worker.handle_exit
+    
+    def on_term(signum, frame):
+        request_limiter.drain(0)
+        handle_exit(signum, frame)
+    
+    signal.signal(signal.SIGTERM, on_term)
+
+def _run_threaded_server(host: str, port: int, graceful_timeout: float) -> None:
+    """Server đa luồng một process, tắt êm khi nhận SIGINT/SIGTERM"""
+    from werkzeug.serving import make_server
+    
+    init_server_worker()
+    server = make_server(host, port, app, threaded=True)
+    
+    def shutdown(signum, frame):
+        # Chờ các yêu cầu đang xử lý trong luồng riêng vì serve_forever đang chạy ở luồng chính
+        def drain_and_stop():
+            logger.info("Đang tắt server, chờ các yêu cầu đang xử lý...")
+            request_limiter.drain(graceful_timeout)
+            server.shutdown()
+        threading.Thread(target=drain_and_stop, daemon=True).start()
+    
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+    
+    logger.info("Khởi động OCR server (werkzeug, đa luồng) tại %s:%d", host, port)
+    server.serve_forever()
+
 def main():
+    global TORCH_THREADS
+    
     parser = argparse.ArgumentParser(description="Trích xuất văn bản từ hình ảnh sử dụng OCR")
-    parser.add_argument("--input", "-i", help="Đường dẫn đến hình ảnh hoặc thư mục chứa hình ảnh")
+    parser.add_argument("--input", "-i", help="Đường dẫn đến hình ảnh, thư mục chứa hình ảnh hoặc file nén (.cbz, .zip, .tar)")
     parser.add_argument("--language", "-l", default="English", help=f"Ngôn ngữ của văn bản (hỗ trợ: {', '.join(SUPPORTED_LANGUAGES)})")
     parser.add_argument("--output", "-o", help="Đường dẫn file hoặc thư mục để lưu kết quả")
     parser.add_argument("--gpu", action="store_true", help="Sử dụng GPU nếu có")
@@ -652,30 +5745,270 @@ def main():
     parser.add_argument("--host", default="0.0.0.0", help="Host để bind server")
     parser.add_argument("--port", type=int, default=5000, help="Port để bind server")
     parser.add_argument("--debug", action="store_true", help="Chạy server ở chế độ debug")
+    parser.add_argument("--workers", type=int, default=1, help="Số luồng xử lý song song khi input là thư mục")
+    parser.add_argument("--preload", help="Danh sách ngôn ngữ tải sẵn engine khi khởi động server, ví dụ: English,Japanese")
+    parser.add_argument("--production", action="store_true", help="Chạy server production nhiều worker (gunicorn nếu có)")
+    parser.add_argument("--server-workers", type=int, default=1, help="Số process worker của server production")
+    parser.add_argument("--server-threads", type=int, default=0,
+                        help="Số luồng nhận yêu cầu trong mỗi worker (0: max-concurrency + max-queue + luồng cho các endpoint khác)")
+    parser.add_argument("--max-concurrency", type=int, default=MAX_CONCURRENT_REQUESTS, help="Số yêu cầu OCR xử lý đồng thời tối đa mỗi worker")
+    parser.add_argument("--max-queue", type=int, default=MAX_QUEUED_REQUESTS, help="Số yêu cầu chờ tối đa mỗi worker (vượt quá trả về 429)")
+    parser.add_argument("--engine-memory-mb", type=int, default=ENGINE_MEMORY_MB, help="Giới hạn bộ nhớ (MB) cho các OCR engine đã tải, 0 để không giới hạn")
+    parser.add_argument("--engine-instances", type=int, default=ENGINE_INSTANCES, help="Số instance tối đa của mỗi OCR engine để xử lý song song")
+    parser.add_argument("--torch-threads", type=int, default=TORCH_THREADS, help="Số luồng intra-op của torch mỗi worker (0: tự chọn khi chạy production, mặc định của torch khi chạy khác)")
+    parser.add_argument("--job-workers", type=int, default=JOB_CONCURRENCY, help="Số job OCR bất đồng bộ xử lý đồng thời mỗi worker")
+    parser.add_argument("--job-db", default=JOB_DB_PATH, help="File sqlite lưu job bất đồng bộ (dùng chung giữa các worker)")
+    parser.add_argument("--regions", help="Các vùng văn bản cho --input là một hình ảnh, bỏ qua detection: "
+                                          "chuỗi JSON hoặc file JSON, ví dụ [[10,20,200,80]]")
+    parser.add_argument("--reading-order", default="given", choices=READING_ORDERS,
+                        help="Thứ tự đọc của --regions: giữ nguyên, trái sang phải hoặc phải sang trái")
+    parser.add_argument("--backend", default=INFERENCE_BACKEND, choices=SUPPORTED_BACKENDS,
+                        help="Backend suy luận mặc định: torch (eager) hoặc int8 (lượng tử hoá động, chỉ CPU)")
+    parser.add_argument("--engine-backend", action="append", default=[], metavar="ENGINE=BACKEND",
+                        help="Backend riêng cho một engine, ví dụ: detector=torch hoặc DocTROCR=int8 (dùng nhiều lần)")
+    parser.add_argument("--compare-backends", metavar="BACKENDS",
+                        help="So sánh transcript và độ trễ giữa các backend trên --input (hoặc trang tổng hợp), ví dụ: torch,int8")
+    parser.add_argument("--force", action="store_true", help="Xử lý lại tất cả hình ảnh trong thư mục, bỏ qua manifest")
+    parser.add_argument("--distributed", choices=["coordinator", "worker", "merge"],
+                        help="Xử lý thư mục phân tán qua hàng đợi dùng chung: coordinator đưa --input vào hàng đợi, "
+                             "worker xử lý (nhiều process/máy), merge ghép all_results.txt")
+    parser.add_argument("--queue-db", help=f"File sqlite của hàng đợi (mặc định: {WORK_QUEUE_FILE} trong --output)")
+    parser.add_argument("--lease-seconds", type=float, default=LEASE_SECONDS,
+                        help=f"Thời gian lease (giây, tối thiểu {MIN_LEASE_SECONDS:.0f}); worker gia hạn trong khi xử lý, "
+                             "hết hạn thì worker khác nhận lại. Các máy cần đồng bộ giờ (NTP)")
+    parser.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS, help="Số lần thử tối đa của mỗi hình ảnh")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Số hình ảnh worker nhận và xử lý mỗi lần")
+    parser.add_argument("--watch", metavar="DIR", help="Chạy daemon theo dõi thư mục, OCR hình ảnh mới hoặc đã thay đổi "
+                                                      "(.txt ghi cạnh hình ảnh, hoặc trong cây --output)")
+    parser.add_argument("--watch-debounce", type=float, default=WATCH_DEBOUNCE,
+                        help="Số giây file phải giữ nguyên kích thước/mtime trước khi được xử lý")
+    parser.add_argument("--watch-poll", type=float, default=WATCH_POLL_INTERVAL, help="Chu kỳ quét lại toàn bộ thư mục (giây), "
+                             "kể cả khi dùng watchdog để bắt sự kiện bị bỏ lỡ")
+    parser.add_argument("--watch-polling", action="store_true", help="Luôn quét định kỳ, không dùng watchdog (ví dụ với thư mục mạng)")
+    parser.add_argument("--jsonl", metavar="FILE", help="Ghi kết quả dạng JSONL (flush sau mỗi trang), '-' để ghi ra stdout")
+    parser.add_argument("--jsonl-records", default="page", choices=JSONL_RECORDS,
+                        help="Một dòng JSONL cho mỗi trang hoặc mỗi block văn bản (kèm bbox và confidence)")
+    parser.add_argument("--log-level", default=LOG_LEVEL, type=str.upper,
+                        choices=["DEBUG", "INFO", "WARNING", "ERROR"], help="Mức log (DEBUG để xem chi tiết từng yêu cầu)")
+    parser.add_argument("--log-json", action="store_true", default=LOG_JSON, help="Ghi log dạng JSON kèm request ID và thời gian từng stage")
+    parser.add_argument("--bench", nargs="?", const="", metavar="DIR", help="Chạy benchmark trên thư mục ảnh (bỏ trống để dùng trang tổng hợp)")
+    parser.add_argument("--bench-pages", type=int, default=20, help="Số trang tổng hợp khi benchmark không có thư mục")
+    parser.add_argument("--bench-languages", help="Các ngôn ngữ benchmark, ví dụ: English,Japanese (mặc định: --language)")
+    parser.add_argument("--bench-workers", default="1", help="Các giá trị workers cần đo, ví dụ: 1,4")
+    parser.add_argument("--bench-batch-sizes", default="", help="Các batch size cần đo với process_batch, ví dụ: 4,8")
+    parser.add_argument("--bench-output", help="File JSON để lưu kết quả benchmark (mặc định in ra stdout)")
+    parser.add_argument("--cache-size-mb", type=int, default=RESULT_CACHE_SIZE_MB, help="Dung lượng cache kết quả trong bộ nhớ (MB), 0 để tắt")
+    parser.add_argument("--cache-dir", default=RESULT_CACHE_DIR, help="Thư mục lưu cache kết quả trên đĩa (giữ qua các lần chạy)")
     
     args = parser.parse_args()
+    configure_logging(args.log_level, args.log_json)
+    
+    # Backend suy luận theo engine
+    engine_backends = dict(ENGINE_BACKENDS)
+    for item in args.engine_backend:
+        name, _, value = item.partition("=")
+        if not name or value not in SUPPORTED_BACKENDS:
+            parser.error(f"--engine-backend không hợp lệ: {item} (dạng ENGINE=BACKEND, backend: {', '.join(SUPPORTED_BACKENDS)})")
+        engine_backends[name] = value
+    global_ocr_extractor.set_backends(args.backend, engine_backends)
+    
+    # So sánh các backend suy luận
+    if args.compare_backends:
+        backends = [value.strip() for value in args.compare_backends.split(",") if value.strip()]
+        if len(backends) < 2 or any(value not in SUPPORTED_BACKENDS for value in backends):
+            parser.error(f"--compare-backends cần ít nhất hai backend trong: {', '.join(SUPPORTED_BACKENDS)}")
+        if args.language not in SUPPORTED_LANGUAGES:
+            parser.error(f"Ngôn ngữ không được hỗ trợ: {args.language}")
+        
+        if not args.input:
+            pages = [(f"page_{i:04d}.png", cv2.imencode(".png", make_synthetic_page(i))[1].tobytes())
+                     for i in range(args.bench_pages)]
+        elif os.path.isdir(args.input):
+            pages = [(name, data) for name, data in iter_directory_images(args.input) if not isinstance(data, OSError)]
+        elif is_archive_file(args.input):
+            pages = list(iter_archive_images(args.input))
+        else:
+            with open(args.input, "rb") as f:
+                pages = [(os.path.basename(args.input), f.read())]
+        
+        report = compare_backends(pages, args.language, backends, use_gpu=args.gpu)
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if args.bench_output:
+            with open(args.bench_output, "w", encoding="utf-8") as f:
+                f.write(output)
+            logger.info("Đã lưu kết quả so sánh backend vào %s", args.bench_output)
+        else:
+            print(output)
+        return
+    
+    # Chạy benchmark
+    if args.bench is not None:
+        languages = [lang.strip() for lang in (args.bench_languages or args.language).split(",") if lang.strip()]
+        for language in languages:
+            if language not in SUPPORTED_LANGUAGES:
+                parser.error(f"Ngôn ngữ không được hỗ trợ: {language}")
+        try:
+            workers_options = [int(value) for value in args.bench_workers.split(",") if value.strip()]
+            batch_sizes = [int(value) for value in args.bench_batch_sizes.split(",") if value.strip()]
+        except ValueError:
+            parser.error("--bench-workers và --bench-batch-sizes phải là danh sách số nguyên")
+        
+        report = run_benchmark(args.bench or None, languages, workers_options, batch_sizes,
+                               pages=args.bench_pages, use_gpu=args.gpu,
+                               backend=args.backend, engine_backends=engine_backends)
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if args.bench_output:
+            with open(args.bench_output, "w", encoding="utf-8") as f:
+                f.write(output)
+            logger.info("Đã lưu kết quả benchmark vào %s", args.bench_output)
+        else:
+            print(output)
+        return
+    
+    # Cấu hình lại cache của extractor toàn cục khi chạy server với tham số khác mặc định
+    if (args.server or args.production or not args.input) and (args.cache_size_mb != RESULT_CACHE_SIZE_MB or args.cache_dir != RESULT_CACHE_DIR):
+        global_ocr_extractor.result_cache = (
+            ResultCache(max(args.cache_size_mb, 0) * 1024 * 1024, args.cache_dir)
+            if args.cache_size_mb > 0 or args.cache_dir else None
+        )
+    
+    # Danh sách ngôn ngữ warm-up khi khởi động server
+    if args.preload is not None:
+        PRELOAD_LANGUAGES[:] = [lang.strip() for lang in args.preload.split(",") if lang.strip()]
+    for language in PRELOAD_LANGUAGES:
+        if language not in SUPPORTED_LANGUAGES:
+            parser.error(f"Ngôn ngữ preload không được hỗ trợ: {language}")
+    
+    # Giới hạn bộ nhớ và số instance engine của extractor toàn cục
+    global_ocr_extractor.ocr_engines.memory_budget = max(args.engine_memory_mb, 0) * 1024 * 1024
+    global_ocr_extractor.ocr_engines.pool_size = max(1, args.engine_instances)
+    
+    # Số luồng torch: mặc định chia đều CPU cho các yêu cầu chạy đồng thời của server production
+    TORCH_THREADS = args.torch_threads
+    if TORCH_THREADS <= 0 and args.production:
+        TORCH_THREADS = max(1, (os.cpu_count() or 1) // max(1, args.server_workers * args.max_concurrency))
+    configure_torch_threads(TORCH_THREADS)
+    
+    # Cấu hình hàng đợi job bất đồng bộ
+    job_queue.concurrency = max(1, args.job_workers)
+    job_queue.db_path = args.job_db
+    
+    # Cấu hình giới hạn yêu cầu cho server
+    request_limiter.max_concurrency = max(1, args.max_concurrency)
+    request_limiter.max_queue = max(0, args.max_queue)
+    
+    # Chạy server production
+    if args.production:
+        try:
+            run_production_server(host=args.host, port=args.port, workers=args.server_workers,
+                                  threads=args.server_threads)
+        except ValueError as e:
+            parser.error(str(e))
+        return
     
     # Nếu chạy như server
     if args.server:
-        print(f"Khởi động OCR server tại {args.host}:{args.port}")
+        logger.info("Khởi động OCR server tại %s:%d", args.host, args.port)
+        global_ocr_extractor.warm_up(PRELOAD_LANGUAGES)
         run_server(host=args.host, port=args.port, debug=args.debug)
         return
     
+    # Daemon theo dõi thư mục
+    if args.watch:
+        if args.language not in SUPPORTED_LANGUAGES:
+            parser.error(f"Ngôn ngữ không được hỗ trợ: {args.language}")
+        ocr_extractor = OCRExtractor(use_gpu=args.gpu, cache_size_mb=args.cache_size_mb, cache_dir=args.cache_dir,
+                                     engine_memory_mb=args.engine_memory_mb, engine_instances=args.engine_instances,
+                                     backend=args.backend, engine_backends=engine_backends)
+        try:
+            watcher = FolderWatcher(ocr_extractor, args.watch, args.language, args.output,
+                                    batch_size=args.batch_size, debounce=args.watch_debounce,
+                                    poll_interval=args.watch_poll, use_native=not args.watch_polling)
+        except ValueError as e:
+            parser.error(str(e))
+        
+        # Tải engine trước để trang đầu tiên chỉ tốn thời gian suy luận
+        ocr_extractor.warm_up([args.language])
+        stop = threading.Event()
+        signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+        watcher.run(stop)
+        return
+    
+    # Xử lý thư mục phân tán qua hàng đợi dùng chung
+    if args.distributed:
+        if not args.output:
+            parser.error("--distributed cần --output là thư mục dùng chung giữa các worker")
+        work_queue = WorkQueue(args.queue_db or os.path.join(args.output, WORK_QUEUE_FILE),
+                               lease_seconds=args.lease_seconds, max_attempts=args.max_attempts)
+        try:
+            if args.distributed == "coordinator":
+                if not args.input:
+                    parser.error("coordinator cần --input là thư mục chứa hình ảnh")
+                if args.language not in SUPPORTED_LANGUAGES:
+                    parser.error(f"Ngôn ngữ không được hỗ trợ: {args.language}")
+                try:
+                    work_queue.enqueue(args.input, args.language)
+                except ValueError as e:
+                    parser.error(str(e))
+            elif args.distributed == "worker":
+                ocr_extractor = OCRExtractor(use_gpu=args.gpu, cache_size_mb=args.cache_size_mb, cache_dir=args.cache_dir,
+                                             engine_memory_mb=args.engine_memory_mb, engine_instances=args.engine_instances,
+                                             backend=args.backend, engine_backends=engine_backends)
+                work_queue.work(ocr_extractor, args.output, input_dir=args.input, batch_size=max(1, args.batch_size))
+            else:
+                summary = work_queue.merge(args.output)
+                if summary["missing"]:
+                    sys.exit(1)
+        finally:
+            work_queue.close()
+        return
+    
     # Khởi tạo OCR Extractor
-    ocr_extractor = OCRExtractor(use_gpu=args.gpu)
+    ocr_extractor = OCRExtractor(use_gpu=args.gpu, cache_size_mb=args.cache_size_mb, cache_dir=args.cache_dir,
+                                 engine_memory_mb=args.engine_memory_mb, engine_instances=args.engine_instances,
+                                 backend=args.backend, engine_backends=engine_backends)
     
     # Chỉ chạy OCR nếu có đầu vào
     if args.input:
-        # Xử lý input là file hoặc thư mục
+        # Xử lý input là file hoặc thư mục; thư mục và file nén trả về kết quả từng trang khi xong
         if os.path.isdir(args.input):
             # Xử lý thư mục
-            ocr_extractor.process_directory(args.input, args.language, args.output)
+            pages = ocr_extractor.iter_directory(args.input, args.language, args.output, workers=args.workers,
+                                                 force=args.force)
+        elif is_archive_file(args.input):
+            # Xử lý file nén (.cbz, .zip, .tar)
+            pages = ocr_extractor.iter_archive(args.input, args.language, args.output, workers=args.workers)
+        elif args.regions:
+            # OCR các vùng đã biết, không chạy detection
+            regions_value = args.regions
+            if os.path.isfile(regions_value):
+                with open(regions_value, "r", encoding="utf-8") as f:
+                    regions_value = f.read()
+            try:
+                regions = parse_regions(regions_value)
+            except ValueError as e:
+                parser.error(f"--regions: {e}")
+            with open(args.input, "rb") as f:
+                image_data = f.read()
+            pages = [(os.path.basename(args.input),
+                      ocr_extractor.process_regions(image_data, regions, args.language, os.path.basename(args.input),
+                                                    args.reading_order, args.output))]
         else:
             # Xử lý một file
-            ocr_extractor.process_image(args.input, args.language, args.output)
+            pages = [(os.path.basename(args.input), ocr_extractor.process_image(args.input, args.language, args.output))]
+        
+        if args.jsonl:
+            count = write_jsonl(args.jsonl, pages, args.jsonl_records)
+            if args.jsonl != "-":
+                logger.info("Đã ghi %d trang vào %s", count, args.jsonl)
+        else:
+            # Chạy hết generator (kết quả đã được ghi vào --output)
+            deque(pages, maxlen=0)
     else:
         # Nếu không có đầu vào, chạy server
-        print("Không có đầu vào, chạy ở chế độ server mặc định")
+        logger.info("Không có đầu vào, chạy ở chế độ server mặc định")
+        global_ocr_extractor.warm_up(PRELOAD_LANGUAGES)
         run_server(host=args.host, port=args.port, debug=args.debug)
 
 
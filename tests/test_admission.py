@@ -0,0 +1,65 @@
+import threading
+import time
+
+from ocr_extractor import AdmissionController
+
+
+def test_rejects_when_queue_full():
+    limiter = AdmissionController(max_concurrency=1, max_queue=0, queue_timeout=1)
+    assert limiter.acquire()
+    assert not limiter.acquire()
+    assert limiter.stats()["rejected"] == 1
+    limiter.release()
+    assert limiter.acquire()
+
+
+def test_queued_request_times_out():
+    limiter = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=0.05)
+    assert limiter.acquire()
+    start = time.monotonic()
+    assert not limiter.acquire()
+    assert time.monotonic() - start >= 0.05
+    assert limiter.waiting == 0
+
+
+def test_queued_request_runs_after_release():
+    limiter = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=5)
+    assert limiter.acquire()
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(limiter.acquire()))
+    waiter.start()
+    while limiter.waiting == 0:
+        time.sleep(0.01)
+    limiter.release()
+    waiter.join(5)
+    assert results == [True]
+    assert limiter.in_flight == 1
+
+
+def test_background_does_not_use_http_queue():
+    limiter = AdmissionController(max_concurrency=1, max_queue=0, queue_timeout=5)
+    assert limiter.acquire()
+    results = []
+    job = threading.Thread(target=lambda: results.append(limiter.acquire(background=True)))
+    job.start()
+    time.sleep(0.05)
+    assert limiter.waiting == 0 and results == []
+    limiter.release()
+    job.join(5)
+    assert results == [True]
+
+
+def test_drain_rejects_new_and_waits_for_in_flight():
+    limiter = AdmissionController(max_concurrency=2, max_queue=2, queue_timeout=5)
+    assert limiter.acquire()
+    threading.Timer(0.05, limiter.release).start()
+    assert limiter.drain(timeout=5)
+    assert not limiter.acquire()
+    assert not limiter.acquire(background=True)
+    assert limiter.stats()["draining"]
+
+
+def test_drain_times_out():
+    limiter = AdmissionController(max_concurrency=1, max_queue=0)
+    assert limiter.acquire()
+    assert not limiter.drain(timeout=0.01)
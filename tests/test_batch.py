@@ -0,0 +1,93 @@
+import hashlib
+import threading
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+import pytest
+
+from conftest import StubTextBlock
+
+
+class BoxDetector:
+    """Trả về một block cho mỗi hình chữ nhật đen trên ảnh"""
+
+    def detect(self, image):
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        count, _, stats, _ = cv2.connectedComponentsWithStats((gray < 128).astype(np.uint8))
+        return [StubTextBlock(text_bbox=np.array([x, y, x + w, y + h]), bubble_bbox=np.array([x - 4, y - 4, x + w + 4, y + h + 4]))
+                for x, y, w, h, _ in stats[1:count]]
+
+
+class CountingLock:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.acquired = 0
+
+    def __enter__(self):
+        self._lock.acquire()
+        self.acquired += 1
+
+    def __exit__(self, *exc):
+        self._lock.release()
+
+
+class CropHashEngine:
+    """Nhận dạng mỗi block thành hash của crop xyxy (mở rộng 5% như các engine thật)"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def process_image(self, image, blocks):
+        self.calls += 1
+        for block in blocks:
+            x1, y1, x2, y2 = [int(v) for v in block.xyxy]
+            pad_x, pad_y = int((x2 - x1) * 0.05), int((y2 - y1) * 0.05)
+            crop = image[max(y1 - pad_y, 0):y2 + pad_y, max(x1 - pad_x, 0):x2 + pad_x]
+            block.text = hashlib.md5(crop.tobytes()).hexdigest()[:12] + f"/{crop.shape[0]}x{crop.shape[1]}"
+        return blocks
+
+
+def _page(seed, size=(300, 400)):
+    rng = np.random.default_rng(seed)
+    image = np.full(size + (3,), 255, dtype=np.uint8)
+    for _ in range(3):
+        x, y = int(rng.integers(20, size[1] - 120)), int(rng.integers(20, size[0] - 80))
+        image[y:y + 50, x:x + 90] = 0
+        # Chữ trắng bên trong hình chữ nhật để mỗi crop có nội dung khác nhau
+        image[y + 10:y + 40, x + 10:x + 80] = rng.integers(130, 255, (30, 70, 3), dtype=np.uint8)
+    return image
+
+
+@pytest.fixture
+def batch_extractor(extractor, monkeypatch):
+    extractor.text_detector = BoxDetector()
+    engine = CropHashEngine()
+
+    @contextmanager
+    def lease(language):
+        yield engine
+
+    monkeypatch.setattr(extractor, "_lease_ocr_engine", lease)
+    return extractor, engine
+
+
+def test_batch_makes_one_ocr_call_with_same_results(batch_extractor):
+    extractor, engine = batch_extractor
+    pages = [(f"p{i}.png", _page(i)) for i in range(4)]
+    single = [extractor.process_batch([page], "English")[0]["blocks"] for page in pages]
+    assert engine.calls == 4
+
+    engine.calls = 0
+    batched = extractor.process_batch(pages, "English", batch_size=4)
+    assert engine.calls == 1
+    assert [result["blocks"] for result in batched] == single
+    assert all(result["blocks"] for result in batched)
+
+
+def test_detector_lock_is_taken_per_image(batch_extractor):
+    extractor, _ = batch_extractor
+    extractor._detector_lock = CountingLock()
+    extractor.process_batch([(f"p{i}.png", _page(i)) for i in range(3)], "English", batch_size=3)
+    # Khoá được nhả giữa các ảnh để /api/ocr đồng thời không phải chờ cả nhóm
+    assert extractor._detector_lock.acquired == 3
@@ -0,0 +1,66 @@
+from contextlib import contextmanager
+
+import numpy as np
+
+import ocr_extractor
+from conftest import StubTextBlock
+from ocr_extractor import DetectionCache
+
+
+def _detected_blocks():
+    first = StubTextBlock(text_bbox=np.array([10, 20, 60, 90]), bubble_bbox=np.array([5, 15, 70, 100]),
+                          text_class="text_bubble", inpaint_bboxes=np.array([[12, 22, 30, 40], [32, 42, 58, 88]]),
+                          lines=[np.array([[10, 20], [60, 20], [60, 50], [10, 50]]),
+                                 np.array([[10, 55], [60, 55], [60, 90], [10, 90]])],
+                          angle=12.345678)
+    first.direction = "vertical"
+    first.text_segm_points = [[1, 2], [3, 4]]
+    second = StubTextBlock(text_bbox=np.array([100, 20, 140, 40]), text_class="text_free")
+    second.direction = "horizontal"
+    return [first, second]
+
+
+def _snapshot(block):
+    return {name: value.tolist() if isinstance(value, np.ndarray)
+            else [np.asarray(item).tolist() for item in value] if name == "lines"
+            else value
+            for name, value in vars(block).items()}
+
+
+def test_round_trip_keeps_every_attribute():
+    blocks = _detected_blocks()
+    cache = DetectionCache(max_entries=2)
+    cache.put("page", blocks)
+    cached = cache.get("page")
+    assert [_snapshot(block) for block in cached] == [_snapshot(block) for block in blocks]
+
+    # Block lấy từ cache là bản sao: sửa block không làm thay đổi cache
+    cached[0].lines[0][0, 0] = -1
+    cached[0].text_segm_points.append([5, 6])
+    assert [_snapshot(block) for block in cache.get("page")] == [_snapshot(block) for block in blocks]
+
+
+def test_cached_detection_gives_same_ocr_input(monkeypatch):
+    extractor = ocr_extractor.OCRExtractor(use_gpu=False, cache_size_mb=0, detection_cache_size=4, crop_cache_size=0,
+                                           result_store=ocr_extractor.ResultStore(disk_dir=None, sweep_interval=0))
+    detections = []
+    monkeypatch.setattr(extractor, "_detect_blocks", lambda image: detections.append(1) or _detected_blocks())
+
+    received = []
+
+    class RecordingEngine:
+        def process_image(self, image, blocks):
+            received.append([_snapshot(block) for block in blocks])
+            return blocks
+
+    @contextmanager
+    def lease(language):
+        yield RecordingEngine()
+
+    monkeypatch.setattr(extractor, "_lease_ocr_engine", lease)
+    image = np.zeros((120, 160, 3), dtype=np.uint8)
+    for language in ("English", "French"):
+        extractor._recognize_blocks(image, extractor._detect_sorted_blocks(image, language), "English")
+
+    assert len(detections) == 1
+    assert received[0] == received[1]
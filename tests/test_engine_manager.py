@@ -0,0 +1,53 @@
+import threading
+import time
+
+from ocr_extractor import EngineManager
+
+
+class _Engine:
+    pass
+
+
+def test_lease_reuses_single_instance():
+    manager = EngineManager(pool_size=1)
+    loads = []
+    loader = lambda: loads.append(1) or _Engine()
+    with manager.lease("doctr", loader) as first:
+        pass
+    with manager.lease("doctr", loader) as second:
+        assert second is first
+    assert len(loads) == 1
+
+
+def test_waiter_does_not_hang_when_pool_is_evicted():
+    manager = EngineManager(pool_size=1)
+    manager.wait_interval = 0.05
+    loader = _Engine
+    holder_ready = threading.Event()
+    release_holder = threading.Event()
+    results = []
+
+    def holder():
+        with manager.lease("doctr", loader):
+            holder_ready.set()
+            release_holder.wait(5)
+
+    def waiter():
+        with manager.lease("doctr", loader) as engine:
+            results.append(engine)
+
+    first = threading.Thread(target=holder)
+    first.start()
+    holder_ready.wait(5)
+    second = threading.Thread(target=waiter)
+    second.start()
+    time.sleep(0.1)
+
+    # Pool bị gỡ trong khi luồng thứ hai đang chờ instance rảnh
+    manager.evict("doctr")
+    release_holder.set()
+    first.join(5)
+    second.join(5)
+    assert not second.is_alive()
+    assert len(results) == 1
+    assert manager.stats()["engines"]["doctr"]["loads"] == 2
@@ -0,0 +1,43 @@
+import time
+
+import ocr_extractor
+from ocr_extractor import JobQueue
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def _row(job_queue, job_id):
+    with job_queue._lock:
+        return job_queue._db.execute("SELECT status, owner, lease_until FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+
+def test_running_job_is_requeued_only_after_lease_expires(extractor, tmp_path, monkeypatch):
+    monkeypatch.setattr(ocr_extractor, "JOB_POLL_INTERVAL", 0.02)
+    job_queue = JobQueue(extractor, db_path=str(tmp_path / "jobs.sqlite"))
+    job_id = job_queue.submit([], "English")
+    assert _wait_for(lambda: _row(job_queue, job_id)[0] == "done")
+
+    # Job đang chạy ở process khác (có thể trên máy khác, pid không có ý nghĩa ở đây)
+    with job_queue._lock:
+        job_queue._db.execute("UPDATE jobs SET status = 'running', owner = 'other-host:1:abcd', lease_until = ? "
+                              "WHERE id = ?", (time.time() + 100, job_id))
+        job_queue._db.commit()
+    time.sleep(0.2)
+    assert _row(job_queue, job_id)[:2] == ("running", "other-host:1:abcd")
+
+    with job_queue._lock:
+        job_queue._db.execute("UPDATE jobs SET lease_until = 0 WHERE id = ?", (job_id,))
+        job_queue._db.commit()
+    assert _wait_for(lambda: _row(job_queue, job_id)[0] == "done")
+    assert _row(job_queue, job_id)[1] == job_queue._owner
+
+
+def test_short_job_lease_is_raised_to_minimum(extractor):
+    assert JobQueue(extractor, lease_seconds=1).lease_seconds == ocr_extractor.MIN_LEASE_SECONDS
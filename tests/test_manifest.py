@@ -0,0 +1,81 @@
+import json
+import os
+
+import ocr_extractor
+from ocr_extractor import MANIFEST_FILE, hash_bytes
+
+RESULT = {"blocks": [], "transcript": "//page1.png\nKhông phát hiện được văn bản", "filename": "page1.png"}
+
+
+def _record(extractor, manifest, image_dir, name):
+    path = os.path.join(str(image_dir), name)
+    with open(path, "rb") as f:
+        data = f.read()
+    extractor._update_manifest_entry(manifest, name, os.stat(path), hash_bytes(data), dict(RESULT, filename=name))
+
+
+def test_load_new_manifest(extractor, tmp_path):
+    manifest = extractor._load_manifest(str(tmp_path), "English")
+    assert manifest["pages"] == {}
+    assert manifest["language"] == "English"
+
+
+def test_saved_manifest_round_trip(extractor, image_dir, tmp_path):
+    manifest = extractor._load_manifest(str(tmp_path), "English")
+    _record(extractor, manifest, image_dir, "page1.png")
+    extractor._save_manifest(str(tmp_path), manifest)
+
+    loaded = extractor._load_manifest(str(tmp_path), "English")
+    assert loaded["pages"] == json.loads(json.dumps(manifest["pages"]))
+    assert extractor._load_manifest(str(tmp_path), "Japanese")["pages"] == {}
+    assert extractor._load_manifest(str(tmp_path), "English", force=True)["pages"] == {}
+
+
+def test_corrupt_manifest_is_ignored(extractor, tmp_path):
+    (tmp_path / MANIFEST_FILE).write_text("{not json", encoding="utf-8")
+    assert extractor._load_manifest(str(tmp_path), "English")["pages"] == {}
+
+
+def test_unchanged_and_touched_file(extractor, image_dir, tmp_path):
+    manifest = extractor._load_manifest(str(tmp_path), "English")
+    _record(extractor, manifest, image_dir, "page1.png")
+    assert extractor._check_manifest_entry(manifest, str(image_dir), "page1.png") is not None
+
+    # mtime khác nhưng nội dung giống: vẫn dùng kết quả cũ và cập nhật mtime
+    os.utime(image_dir / "page1.png", ns=(1, 1))
+    entry = extractor._check_manifest_entry(manifest, str(image_dir), "page1.png")
+    assert entry is not None and entry["mtime_ns"] == 1
+
+
+def test_changed_file(extractor, image_dir, tmp_path):
+    manifest = extractor._load_manifest(str(tmp_path), "English")
+    _record(extractor, manifest, image_dir, "page1.png")
+    data = bytearray((image_dir / "page1.png").read_bytes())
+    data[-1] ^= 0xFF
+    (image_dir / "page1.png").write_bytes(bytes(data))
+    os.utime(image_dir / "page1.png", ns=(1, 1))
+    assert extractor._check_manifest_entry(manifest, str(image_dir), "page1.png") is None
+    assert extractor._check_manifest_entry(manifest, str(image_dir), "page2.png") is None
+
+
+def test_missing_file_is_reprocessed_not_fatal(extractor, image_dir, tmp_path):
+    manifest = extractor._load_manifest(str(tmp_path), "English")
+    _record(extractor, manifest, image_dir, "page1.png")
+    os.remove(image_dir / "page1.png")
+    assert extractor._check_manifest_entry(manifest, str(image_dir), "page1.png") is None
+
+
+def test_directory_run_skips_unchanged_pages(extractor, image_dir, tmp_path, monkeypatch):
+    output_dir = tmp_path / "out"
+    first = extractor.process_directory(str(image_dir), "English", str(output_dir))
+    assert list(first) == ["page1.png", "page2.png", "page10.png"]
+    manifest = json.loads((output_dir / MANIFEST_FILE).read_text(encoding="utf-8"))
+    assert manifest["pages"]["page2.png"]["hash"] == hash_bytes((image_dir / "page2.png").read_bytes())
+
+    decoded = []
+    real_decode = ocr_extractor.decode_image
+    monkeypatch.setattr(ocr_extractor, "decode_image", lambda data: decoded.append(1) or real_decode(data))
+    (image_dir / "page2.png").write_bytes((image_dir / "page1.png").read_bytes())
+    second = extractor.process_directory(str(image_dir), "English", str(output_dir))
+    assert list(second) == ["page1.png", "page2.png", "page10.png"]
+    assert len(decoded) == 1
@@ -0,0 +1,29 @@
+from ocr_extractor import RecognitionCache
+
+
+class TestRecognitionCache:
+    def test_hit_and_miss(self):
+        cache = RecognitionCache(max_entries=4)
+        assert cache.get("a") is None
+        cache.put("a", "text", 0.9)
+        assert cache.get("a") == ("text", 0.9)
+        stats = cache.stats()
+        assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+    def test_lru_eviction(self):
+        cache = RecognitionCache(max_entries=2)
+        cache.put("a", "1")
+        cache.put("b", "2")
+        cache.get("a")
+        cache.put("c", "3")
+        assert cache.get("b") is None
+        assert cache.get("a") == ("1", None)
+        assert cache.stats()["evictions"] == 1
+
+    def test_clear(self):
+        cache = RecognitionCache(max_entries=2)
+        cache.put("a", "1")
+        cache.get("a")
+        cache.clear()
+        assert cache.stats()["entries"] == 0
+        assert cache.stats()["hits"] == 0
@@ -0,0 +1,33 @@
+import pytest
+
+import ocr_extractor
+from ocr_extractor import parse_regions
+
+
+class TestParseRegions:
+    def test_json_string_and_list(self):
+        assert parse_regions("[[0, 0, 10, 10]]") == [[0, 0, 10, 10]]
+        assert parse_regions([[1.4, 2.6, 10, 20]]) == [[1, 3, 10, 20]]
+
+    def test_sorted_by_order_when_every_item_has_one(self):
+        regions = [{"bbox": [0, 0, 5, 5], "order": 2}, {"bbox": [10, 10, 20, 20], "order": 1}]
+        assert parse_regions(regions) == [[10, 10, 20, 20], [0, 0, 5, 5]]
+
+    def test_input_order_kept_when_order_missing(self):
+        regions = [{"bbox": [0, 0, 5, 5], "order": 2}, [10, 10, 20, 20]]
+        assert parse_regions(regions) == [[0, 0, 5, 5], [10, 10, 20, 20]]
+
+    @pytest.mark.parametrize("value", [
+        "not json",
+        {"bbox": [0, 0, 1, 1]},
+        [[0, 0, 1]],
+        [["a", 0, 1, 1]],
+        [[5, 5, 5, 10]],
+    ])
+    def test_invalid(self, value):
+        with pytest.raises(ValueError):
+            parse_regions(value)
+
+    def test_too_many_regions(self):
+        with pytest.raises(ValueError):
+            parse_regions([[0, 0, 1, 1]] * (ocr_extractor.MAX_REGIONS + 1))
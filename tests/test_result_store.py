@@ -0,0 +1,58 @@
+import os
+import time
+
+from ocr_extractor import ResultStore
+
+
+class TestResultStore:
+    def test_memory_round_trip(self):
+        store = ResultStore(max_bytes=1024, ttl=60, disk_dir=None, sweep_interval=0)
+        file_id, path = store.put("xin chào")
+        assert path is None
+        assert store.get(file_id) == "xin chào".encode("utf-8")
+        assert store.get("../../etc/passwd") is None
+
+    def test_memory_lru(self):
+        store = ResultStore(max_bytes=10, ttl=60, disk_dir=None, sweep_interval=0)
+        first, _ = store.put("a" * 6)
+        second, _ = store.put("b" * 6)
+        assert store.get(first) is None
+        assert store.get(second) == b"b" * 6
+        assert store.evictions == 1
+
+    def test_disk_shared_between_stores(self, tmp_path):
+        writer = ResultStore(max_bytes=1024, ttl=60, disk_dir=str(tmp_path), sweep_interval=0)
+        reader = ResultStore(max_bytes=1024, ttl=60, disk_dir=str(tmp_path), sweep_interval=0)
+        file_id, path = writer.put("page")
+        assert os.path.dirname(path) == os.path.join(str(tmp_path), file_id[:2])
+        assert reader.get(file_id) == b"page"
+
+    def test_expired_on_get(self, tmp_path):
+        store = ResultStore(max_bytes=1024, ttl=0.01, disk_dir=str(tmp_path), sweep_interval=0)
+        file_id, path = store.put("old")
+        time.sleep(0.05)
+        assert store.get(file_id) is None
+        assert not os.path.exists(path)
+
+    def test_sweep_counts_ttl_as_expired_and_cap_as_evictions(self, tmp_path):
+        store = ResultStore(max_bytes=1 << 20, ttl=100, disk_dir=str(tmp_path), disk_max_bytes=2500,
+                            sweep_interval=0)
+        ids = [store.put("x" * 1000)[0] for _ in range(4)]
+        old = time.time() - 200
+        os.utime(store._disk_path(ids[0]), (old, old))
+
+        assert store.sweep() == 2
+        assert store.expired == 1
+        assert store.evictions == 1
+        assert store.disk_entries == 2
+        # Tầng bộ nhớ vẫn giữ kết quả chưa hết hạn
+        assert store.get(ids[1]) == b"x" * 1000
+
+    def test_sweep_skips_disk_while_another_store_sweeps(self, tmp_path):
+        first = ResultStore(max_bytes=0, ttl=100, disk_dir=str(tmp_path), disk_max_bytes=0, sweep_interval=0)
+        second = ResultStore(max_bytes=0, ttl=100, disk_dir=str(tmp_path), disk_max_bytes=0, sweep_interval=0)
+        first.put("x" * 100)
+        with first._disk_sweep_lock() as owner:
+            assert owner
+            assert second.sweep() == 0
+        assert second.sweep() == 1
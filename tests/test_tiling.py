@@ -0,0 +1,70 @@
+import numpy as np
+
+import ocr_extractor
+from conftest import StubTextBlock
+from ocr_extractor import compute_tiles, dedupe_blocks, offset_block
+
+
+def test_normal_page_is_not_tiled():
+    assert compute_tiles(1600, 1100) is None
+
+
+def test_long_strip_tiles_cover_image_with_overlap():
+    height, width = 12000, 800
+    tiles = compute_tiles(height, width)
+    assert tiles is not None and len(tiles) > 1
+    assert all(x1 == 0 and x2 == width for x1, _, x2, _ in tiles)
+    assert tiles[0][1] == 0 and tiles[-1][3] == height
+    for (_, _, _, previous_end), (_, start, _, _) in zip(tiles, tiles[1:]):
+        assert start < previous_end
+
+
+def test_large_image_tiled_in_both_directions():
+    side = ocr_extractor.TILE_MAX_SIDE * 2
+    tiles = compute_tiles(side, side)
+    assert len({x1 for x1, _, _, _ in tiles}) > 1
+    assert len({y1 for _, y1, _, _ in tiles}) > 1
+    assert all(x2 - x1 <= ocr_extractor.TILE_MAX_SIDE and y2 - y1 <= ocr_extractor.TILE_MAX_SIDE
+               for x1, y1, x2, y2 in tiles)
+
+
+def _block(x1, y1, x2, y2):
+    return StubTextBlock(text_bbox=np.array([x1, y1, x2, y2]))
+
+
+# Hai tile chồng lấn ở y 150..200
+TILES = [(0, 0, 400, 200), (0, 150, 400, 350)]
+
+
+def test_dedupe_keeps_larger_block_across_seam():
+    full = _block(0, 160, 200, 240)
+    cut = _block(0, 160, 200, 200)
+    other = _block(300, 160, 400, 240)
+    assert dedupe_blocks([cut, other, full], [0, 1, 1], TILES) == [other, full]
+
+
+def test_dedupe_keeps_blocks_with_small_overlap():
+    left = _block(0, 160, 100, 190)
+    right = _block(90, 160, 190, 190)
+    assert dedupe_blocks([left, right], [0, 1], TILES) == [left, right]
+
+
+def test_dedupe_keeps_nested_blocks_in_same_tile():
+    outer = _block(0, 160, 200, 195)
+    inner = _block(10, 165, 100, 190)
+    assert dedupe_blocks([outer, inner], [0, 0], TILES) == [outer, inner]
+
+
+def test_dedupe_ignores_tiles_without_overlap():
+    first = _block(0, 100, 200, 149)
+    second = _block(0, 100, 200, 149)
+    assert dedupe_blocks([first, second], [0, 1], [(0, 0, 400, 200), (0, 300, 400, 500)]) == [first, second]
+
+
+def test_offset_block_moves_every_box():
+    block = StubTextBlock(text_bbox=np.array([0, 0, 10, 10]), bubble_bbox=np.array([0, 0, 20, 20]),
+                          inpaint_bboxes=np.array([[1, 1, 5, 5]]))
+    offset_block(block, 5, 100)
+    assert block.xyxy.tolist() == [5, 100, 15, 110]
+    assert block.bubble_xyxy.tolist() == [5, 100, 25, 120]
+    assert block.inpaint_bboxes.tolist() == [[6, 101, 10, 105]]
@@ -0,0 +1,65 @@
+import base64
+import io
+
+import pytest
+from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import RequestEntityTooLarge
+
+import ocr_extractor
+from ocr_extractor import decode_base64_image, read_upload
+
+
+class TestDecodeBase64Image:
+    def test_plain_and_data_url(self):
+        data = bytes(range(256)) * 3
+        encoded = base64.b64encode(data).decode()
+        assert decode_base64_image(encoded) == data
+        assert decode_base64_image("data:image/png;base64," + encoded) == data
+
+    def test_chunks_with_whitespace(self, monkeypatch):
+        # Đoạn nhỏ, không chia hết cho 4 sau khi bỏ khoảng trắng
+        monkeypatch.setattr(ocr_extractor, "BASE64_CHUNK_CHARS", 8)
+        data = b"manga page bytes" * 10
+        encoded = base64.b64encode(data).decode()
+        wrapped = "\n".join(encoded[i:i + 7] for i in range(0, len(encoded), 7))
+        assert decode_base64_image(wrapped) == data
+
+    def test_limit(self):
+        encoded = base64.b64encode(b"x" * 2048).decode()
+        with pytest.raises(RequestEntityTooLarge):
+            decode_base64_image(encoded, max_bytes=1024)
+        assert len(decode_base64_image(encoded, max_bytes=2048)) == 2048
+
+    def test_not_a_string(self):
+        with pytest.raises(ValueError):
+            decode_base64_image(b"AAAA")
+
+
+class _UnseekableStream(io.RawIOBase):
+    def __init__(self, data):
+        self._data = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        return self._data.read(size)
+
+    def seek(self, *args):
+        raise OSError("not seekable")
+
+
+class TestReadUpload:
+    def test_seekable(self):
+        data = b"\x89PNG" + b"\0" * 100
+        assert read_upload(FileStorage(stream=io.BytesIO(data))) == data
+
+    def test_limit(self):
+        with pytest.raises(RequestEntityTooLarge):
+            read_upload(FileStorage(stream=io.BytesIO(b"x" * 101)), max_bytes=100)
+
+    def test_unseekable_stream(self):
+        data = b"y" * 64
+        assert read_upload(FileStorage(stream=_UnseekableStream(data)), max_bytes=64) == data
+        with pytest.raises(RequestEntityTooLarge):
+            read_upload(FileStorage(stream=_UnseekableStream(data)), max_bytes=63)
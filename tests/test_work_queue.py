@@ -0,0 +1,115 @@
+import os
+
+import pytest
+
+from ocr_extractor import MIN_LEASE_SECONDS, WorkQueue
+
+
+@pytest.fixture
+def work_queue(tmp_path):
+    queue = WorkQueue(str(tmp_path / "queue" / "work_queue.sqlite"), max_attempts=2)
+    yield queue
+    queue.close()
+
+
+def _expire_leases(queue):
+    queue._db.execute("UPDATE items SET lease_until = 0 WHERE status = 'leased'")
+
+
+def test_enqueue_in_natural_order(work_queue, image_dir):
+    assert work_queue.enqueue(str(image_dir), "English") == {"added": 3, "requeued": 0, "total": 3}
+    assert work_queue.get_meta("language") == "English"
+    assert work_queue.lease("w1", 3) == [(0, "page1.png"), (1, "page2.png"), (2, "page10.png")]
+
+
+def test_enqueue_again_only_adds_new_files(work_queue, image_dir):
+    work_queue.enqueue(str(image_dir), "English")
+    (image_dir / "page11.png").write_bytes((image_dir / "page1.png").read_bytes())
+    assert work_queue.enqueue(str(image_dir), "English") == {"added": 1, "requeued": 0, "total": 4}
+
+
+def test_enqueue_rejects_other_language(work_queue, image_dir):
+    work_queue.enqueue(str(image_dir), "English")
+    with pytest.raises(ValueError):
+        work_queue.enqueue(str(image_dir), "Japanese")
+
+
+def test_lease_is_exclusive_and_complete(work_queue, image_dir):
+    work_queue.enqueue(str(image_dir), "English")
+    first = work_queue.lease("w1", 2)
+    second = work_queue.lease("w2", 2)
+    assert [idx for idx, _ in first] == [0, 1]
+    assert [idx for idx, _ in second] == [2]
+    assert work_queue.renew("w1", [0, 1]) == 2
+    assert work_queue.renew("w2", [0]) == 0
+
+    assert work_queue.complete("w1", 0)
+    assert not work_queue.complete("w2", 1)
+    assert work_queue.counts() == {"pending": 0, "leased": 2, "done": 1, "failed": 0}
+
+
+def test_expired_lease_is_taken_over_then_fails(work_queue, image_dir):
+    work_queue.enqueue(str(image_dir), "English")
+    work_queue.lease("w1", 1)
+    _expire_leases(work_queue)
+    assert work_queue.lease("w2", 1) == [(0, "page1.png")]
+    # Người giữ lease cũ không kết thúc được trang đã bị nhận lại
+    assert not work_queue.complete("w1", 0)
+
+    _expire_leases(work_queue)
+    assert work_queue.lease("w3", 1) == [(1, "page2.png")]
+    assert work_queue.counts()["failed"] == 1
+
+
+def test_error_requeues_until_max_attempts(work_queue, image_dir):
+    work_queue.enqueue(str(image_dir), "English")
+    work_queue.lease("w1", 1)
+    assert work_queue.complete("w1", 0, "decode error")
+    assert work_queue.counts()["pending"] == 3
+    work_queue.lease("w1", 1)
+    assert work_queue.complete("w1", 0, "decode error")
+    assert work_queue.counts()["failed"] == 1
+
+    # Chạy lại coordinator đưa trang thất bại vào hàng đợi
+    assert work_queue.enqueue(str(image_dir), "English")["requeued"] == 1
+
+
+def test_merge_in_page_order(work_queue, image_dir, tmp_path):
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    work_queue.enqueue(str(image_dir), "English")
+    for idx, name in work_queue.lease("w1", 3):
+        if name != "page2.png":
+            (output_dir / name.replace(".png", ".txt")).write_text(f"//{name}", encoding="utf-8")
+            work_queue.complete("w1", idx)
+
+    summary = work_queue.merge(str(output_dir))
+    assert summary["merged"] == 2
+    assert [item["name"] for item in summary["missing"]] == ["page2.png"]
+    assert (output_dir / "all_results.txt").read_text(encoding="utf-8") == "//page1.png\n\n//page10.png"
+
+
+def test_short_lease_is_raised_to_minimum(tmp_path):
+    queue = WorkQueue(str(tmp_path / "q.sqlite"), lease_seconds=1)
+    assert queue.lease_seconds == MIN_LEASE_SECONDS
+    queue.close()
+
+
+def test_write_failure_is_retried_not_fatal(work_queue, extractor, image_dir, tmp_path, monkeypatch):
+    work_queue.enqueue(str(image_dir), "English")
+    output_dir = tmp_path / "out"
+    real_replace = os.replace
+    failures = []
+
+    def flaky_replace(src, dst):
+        if not failures:
+            failures.append(src)
+            raise OSError(28, "No space left on device")
+        real_replace(src, dst)
+
+    monkeypatch.setattr(os, "replace", flaky_replace)
+    summary = work_queue.work(extractor, str(output_dir), batch_size=3, poll_interval=0)
+    # Trang ghi lỗi được đưa lại hàng đợi và xử lý ở lần lease sau
+    assert summary == {"processed": 3, "errors": 1}
+    assert work_queue.counts()["done"] == 3
+    assert not os.path.exists(failures[0])